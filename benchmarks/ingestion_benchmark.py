@@ -0,0 +1,231 @@
+"""
+Measures how ingestion scales with the corpus size, to know when it stops fitting the batch
+windows and the containers.
+
+For every scale the corpus is replicated scale times and every copy but the first is perturbed
+(a share of the words of every paragraph is replaced by random corpus words, and the titles are
+numbered) so the copies get their own vectors. Each scale is ingested by a fresh process into a
+fresh Qdrant collection, registry and embedding store, through the same paths the service uses:
+    - ingest: QdrantCollectionManager.add_data_to_collection, embedding the corpus.
+    - rebuild: QdrantCollectionManager.rebuild_collection, uploading from the embedding store.
+and records docs/sec, the embedding and upload seconds, the seconds until the index is ready,
+the peak RSS of the process and the size of the collection and of the embedding store on disk.
+
+With the local transport Qdrant runs inside the ingesting process, so its memory is part of
+the peak RSS. with rest or grpc, pass the server's storage directory to measure the index size.
+
+usage (from the repo root):
+    python -m benchmarks.ingestion_benchmark run data/espn/espn_stories.csv --scales 1 10 100
+    python -m benchmarks.ingestion_benchmark run data/espn/espn_stories.csv --scales 10 --transport rest \
+        --qdrant-storage-dir ./qdrant_storage
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.qdrant_transport import TRANSPORTS
+from src.utils.utility_functions import read_and_concatenate, write_columnar_corpus
+
+results_dir = Path(__file__).resolve().parent / "results"
+repo_root = Path(__file__).resolve().parent.parent
+
+COLLECTION_NAME = "ingestion_benchmark"
+
+
+def scale_corpus(df: pd.DataFrame, scale: int, text_field: str, perturb_rate: float, seed: int) -> pd.DataFrame:
+    "the corpus replicated scale times, the copies after the first one are perturbed."
+    rng = np.random.default_rng(seed)
+    texts = df[text_field].astype(str).tolist()
+    vocabulary = np.array(' '.join(texts).split())
+    copies = [df]
+    for copy_number in range(1, scale):
+        copy = df.copy()
+        perturbed_texts = []
+        for text in texts:
+            words = np.array(text.split(), dtype=object)
+            replaced = rng.random(len(words)) < perturb_rate
+            words[replaced] = rng.choice(vocabulary, replaced.sum())
+            perturbed_texts.append(' '.join(words))
+        copy[text_field] = perturbed_texts
+        if 'title' in copy.columns:
+            copy['title'] = copy['title'].astype(str) + f" #{copy_number}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def directory_size(path: Optional[Path]) -> Optional[int]:
+    if path is None or not path.exists():
+        return None
+    return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+
+
+def _wait_until_green(qdrant_client, collection_name: str, timeout: float = 3600) -> float:
+    from qdrant_client import models
+
+    start_time = time.perf_counter()
+    while qdrant_client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.perf_counter() - start_time > timeout:
+            raise TimeoutError(f"Error: {collection_name} wasn't indexed within {timeout} seconds.")
+        time.sleep(1)
+    return time.perf_counter() - start_time
+
+
+def _stage_report(rows_count: int, seconds: float, index_seconds: float) -> Dict:
+    from src.utils.metrics import metrics
+
+    latencies = metrics.snapshot()['latencies']
+    metrics.reset()
+    return {
+        'seconds': seconds,
+        'docs_per_second': rows_count / seconds,
+        'embed_seconds': latencies.get('embedding.documents', {}).get('total_seconds', 0.0),
+        'upload_seconds': latencies.get('ingestion.upload', {}).get('total_seconds', 0.0),
+        'index_seconds': index_seconds,
+    }
+
+
+def ingest(corpus_file: str, text_field: str, metadata_fields: List[str], late_interaction: bool, rebuild: bool,
+           collections_dir: Optional[Path]) -> Dict:
+    """
+    runs in the child process, its Qdrant, registry and embedding store are set by the parent's
+    environment variables. returns the stages timings, the process peak RSS and the size of every
+    collection in collections_dir. the collections are deleted at the end, a Qdrant server outlives the child.
+    """
+    from src.qdrant_db import QdrantCollectionManager, client
+
+    # the registry of the run starts empty, the legacy collections may be real collections of the server.
+    manager = QdrantCollectionManager(import_legacy_collections=False)
+    manager.create_collection(COLLECTION_NAME, late_interaction=late_interaction)
+    start_time = time.perf_counter()
+    manager.add_data_to_collection(COLLECTION_NAME, [corpus_file], text_field, metadata_fields)
+    seconds = time.perf_counter() - start_time
+    rows_count = client.count(COLLECTION_NAME).count
+    report = {'rows': rows_count, 'ingest': _stage_report(rows_count, seconds, _wait_until_green(client, COLLECTION_NAME))}
+
+    collection_names = [COLLECTION_NAME]
+    if rebuild:
+        rebuild_name = f"{COLLECTION_NAME}_rebuild"
+        collection_names.append(rebuild_name)
+        start_time = time.perf_counter()
+        manager.rebuild_collection(COLLECTION_NAME, rebuild_name)
+        seconds = time.perf_counter() - start_time
+        report['rebuild'] = _stage_report(rows_count, seconds, _wait_until_green(client, rebuild_name))
+
+    # ru_maxrss is in KB on Linux.
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report['index_bytes'] = {}
+    for collection_name in collection_names:
+        physical_name = manager.get_collection_info(collection_name)['physical_name']
+        report['index_bytes'][collection_name] = directory_size(
+            collections_dir / physical_name if collections_dir is not None else None)
+        manager.delete_collection(collection_name)
+    return report
+
+
+def run_scale(corpus_file: Path, work_dir: Path, args) -> Dict:
+    "ingest a scaled corpus in a child process with its own Qdrant collection, registry and embedding store."
+    local_path = work_dir / "qdrant_local"
+    embedding_store_dir = work_dir / "embeddings"
+    env = {
+        **os.environ,
+        'QDRANT_TRANSPORT': args.transport,
+        'QDRANT_LOCAL_PATH': str(local_path),
+        'QDRANT_REGISTRY_PATH': str(work_dir / "registry.db"),
+        'EMBEDDING_STORE_DIR': str(embedding_store_dir),
+    }
+    if args.transport == 'local':
+        collections_dir = local_path / "collection"
+    else:
+        collections_dir = Path(args.qdrant_storage_dir).resolve() / "collections" if args.qdrant_storage_dir else None
+
+    command = [sys.executable, '-m', 'benchmarks.ingestion_benchmark', 'ingest', str(corpus_file),
+               '--text-field', args.text_field, '--metadata-fields', *args.metadata_fields]
+    if collections_dir is not None:
+        command += ['--collections-dir', str(collections_dir)]
+    if args.late_interaction:
+        command.append('--late-interaction')
+    if args.no_rebuild:
+        command.append('--no-rebuild')
+    completed = subprocess.run(command, cwd=repo_root, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report['embedding_store_bytes'] = directory_size(embedding_store_dir)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion of scaled corpora.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="synthesize the scaled corpora and benchmark their ingestion.")
+    run_parser.add_argument('corpus_file')
+    run_parser.add_argument('--scales', nargs='+', type=int, default=[1, 10, 100])
+    run_parser.add_argument('--format', choices=['csv', 'arrow'], default='csv',
+                            help="the format of the synthesized corpus files, arrow is memory mapped by the ingestion.")
+    run_parser.add_argument('--perturb-rate', type=float, default=0.1, help="share of the words replaced in every copy.")
+    run_parser.add_argument('--transport', choices=TRANSPORTS, default='local')
+    run_parser.add_argument('--qdrant-storage-dir', default=None,
+                            help="the storage directory of the Qdrant server, to measure the index size with rest or grpc.")
+    run_parser.add_argument('--work-dir', default=None, help="where the corpora and local stores are written, a temporary directory by default.")
+    run_parser.add_argument('--seed', type=int, default=0)
+
+    ingest_parser = subparsers.add_parser('ingest', help="ingest one corpus file, used by run in a child process.")
+    ingest_parser.add_argument('corpus_file')
+    ingest_parser.add_argument('--collections-dir', type=Path, default=None)
+
+    for subparser in (run_parser, ingest_parser):
+        subparser.add_argument('--text-field', default='paragraph_text')
+        subparser.add_argument('--metadata-fields', nargs='*', default=['title', 'content_publish_date'])
+        subparser.add_argument('--late-interaction', action='store_true')
+        subparser.add_argument('--no-rebuild', action='store_true', help="skip the rebuild from the embedding store.")
+
+    args = parser.parse_args(argv)
+    if args.command == 'ingest':
+        report = ingest(args.corpus_file, args.text_field, args.metadata_fields, args.late_interaction,
+                        not args.no_rebuild, args.collections_dir)
+        print(json.dumps(report))
+        return 0
+
+    df = read_and_concatenate([args.corpus_file])
+    runs = []
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        for scale in args.scales:
+            scale_dir = Path(work_dir) / f"scale_{scale}"
+            scale_dir.mkdir()
+            scaled_df = scale_corpus(df, scale, args.text_field, args.perturb_rate, args.seed)
+            corpus_file = scale_dir / f"corpus.{args.format}"
+            if args.format == 'arrow':
+                write_columnar_corpus(scaled_df, str(corpus_file))
+            else:
+                scaled_df.to_csv(corpus_file, index=False)
+
+            run = {'scale': scale, 'corpus_bytes': corpus_file.stat().st_size,
+                   **run_scale(corpus_file, scale_dir, args)}
+            print(json.dumps(run, indent=2))
+            runs.append(run)
+
+    results = {
+        'corpus_file': Path(args.corpus_file).name,
+        'format': args.format,
+        'transport': args.transport,
+        'late_interaction': args.late_interaction,
+        'perturb_rate': args.perturb_rate,
+        'runs': runs,
+    }
+    results_dir.mkdir(exist_ok=True)
+    with open(results_dir / "ingestion.jsonl", 'a') as f:
+        f.write(json.dumps({'timestamp': time.time(), **results}) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Compares the two precise ranking stages of a collection created with late_interaction=True:
+    1. hybrid search + cohere rerank (two network services).
+    2. hybrid prefetch + late interaction (ColBERT) rescoring inside Qdrant (one query).
+Reports the latency percentiles of both paths, how much their top results agree,
+and the storage cost per point of every vector type.
+
+usage (from the repo root):
+    python -m benchmarks.late_interaction_benchmark ESPN_articles_colbert data/testsest/testset_questions.csv
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.qdrant_db import HybridSearcher, client, co, qdrant_config, dense_model, sparse_model
+from src.embedding_models import EmbeddingModels
+from src.utils.utility_functions import convert_search_dict_to_index_dict
+
+results_dir = Path(__file__).resolve().parent / "results"
+
+
+def cohere_path(collection_name: str, query: str, search_limit: int, reranker_limit: int) -> list:
+    hits = client.query(collection_name=collection_name, query_text=query, limit=search_limit)
+    documents = [hit.metadata['document'] for hit in hits]
+    response = co.rerank(model=qdrant_config['reranker'], query=query, documents=documents, top_n=reranker_limit)
+    return [documents[result.index] for result in response.results]
+
+
+def late_interaction_path(searcher: HybridSearcher, collection_name: str, query: str, reranker_limit: int) -> list:
+    contexts = searcher.search(collection_name, query, search_limit=reranker_limit)
+    return [context['document'] for context in contexts]
+
+
+def percentiles(latencies: list) -> dict:
+    return {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in (50, 90, 95, 99)}
+
+
+def storage_per_point(paragraphs: list, late_interaction_model: str) -> dict:
+    "average bytes per point of every vector type, measured on a sample of paragraphs."
+    embeddings = EmbeddingModels(dense_model, sparse_model, late_interaction_model).embed_documents(paragraphs)
+    dense_bytes = np.mean([len(vector) * 4 for vector in embeddings['dense']])
+    sparse_bytes = np.mean([len(vector.indices) * 8 for vector in embeddings['sparse']])
+    late_interaction_bytes = np.mean([len(vector) * len(vector[0]) * 4 for vector in embeddings['late_interaction']])
+    return {'dense_bytes': float(dense_bytes),
+            'sparse_bytes': float(sparse_bytes),
+            'late_interaction_bytes': float(late_interaction_bytes)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('collection_name', help="a collection created with late_interaction=True.")
+    parser.add_argument('questions_file', help="csv file with a question column.")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    args = parser.parse_args()
+
+    searcher = HybridSearcher()
+    late_interaction_model = searcher._late_interaction_model(args.collection_name)
+    if late_interaction_model is None:
+        raise ValueError(f"{args.collection_name} has no late interaction vectors.")
+
+    questions = pd.read_csv(args.questions_file)['question'].dropna().tolist()[:args.queries]
+    search_limit, reranker_limit = qdrant_config['search_limit'], qdrant_config['reranker_limit']
+
+    for question in questions[:args.warmup]:
+        cohere_path(args.collection_name, question, search_limit, reranker_limit)
+        late_interaction_path(searcher, args.collection_name, question, reranker_limit)
+
+    cohere_latencies, late_interaction_latencies, overlaps = [], [], []
+    for question in questions:
+        start = time.perf_counter()
+        cohere_docs = cohere_path(args.collection_name, question, search_limit, reranker_limit)
+        cohere_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        late_interaction_docs = late_interaction_path(searcher, args.collection_name, question, reranker_limit)
+        late_interaction_latencies.append(time.perf_counter() - start)
+
+        overlaps.append(len(set(cohere_docs) & set(late_interaction_docs)) / reranker_limit)
+
+    points, _ = client.scroll(args.collection_name, limit=200, with_payload=True)
+    paragraphs = [convert_search_dict_to_index_dict(point.payload)['document'] for point in points]
+
+    results = {
+        'collection_name': args.collection_name,
+        'late_interaction_model': late_interaction_model,
+        'queries': len(questions),
+        'cohere_latency_ms': percentiles(cohere_latencies),
+        'late_interaction_latency_ms': percentiles(late_interaction_latencies),
+        f'top_{reranker_limit}_overlap': float(np.mean(overlaps)),
+        'storage_per_point': storage_per_point(paragraphs, late_interaction_model),
+        'points_count': client.get_collection(args.collection_name).points_count,
+    }
+    print(json.dumps(results, indent=2))
+
+    results_dir.mkdir(exist_ok=True)
+    with open(results_dir / "late_interaction.jsonl", 'a') as f:
+        f.write(json.dumps({'timestamp': time.time(), **results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Open-loop load test of the /qa_chain endpoint, to find the throughput the service sustains
+and where it saturates.
+
+For every target QPS a fresh gunicorn serves benchmarks/load_test_app.py (src.app with fake
+reranker and LLM providers, see there) against the configured Qdrant, and questions from the
+question corpus are sent at Poisson arrival times for --duration seconds, whether or not the
+earlier requests finished. latencies are measured from the scheduled send time, so a backlog
+on the client side is counted as latency instead of silently lowering the load.
+
+Reported per target QPS:
+    - achieved throughput (successful responses per second).
+    - latency percentiles of the successful responses.
+    - error rate and the count of every status code (429/503 shed load, 504 deadline, ...).
+    - the per stage breakdown from the workers' metrics (search, rerank, generate, embedding,
+      admission and degradation counters).
+
+usage (from the repo root, with Qdrant running and the collection ingested, or --input-files to ingest it):
+    python -m benchmarks.load_test data/testsest/testset_questions.csv --collection ESPN_articles \
+        --qps 1 2 4 8 --duration 60 --workers 1 --threads 8
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from benchmarks.load_test_app import config, repo_root
+
+results_dir = Path(__file__).resolve().parent / "results"
+
+
+def percentiles(latencies: list) -> dict:
+    if not latencies:
+        return {}
+    return {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in (50, 90, 95, 99)}
+
+
+class Server:
+    "a gunicorn serving the load test app, its workers write their metrics to metrics_dir when they exit."
+
+    def __init__(self, port: int, workers: int, threads: int, fakes: Dict, api_key: str, metrics_dir: str):
+        self.url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            'LOAD_TEST_FAKES': json.dumps(fakes),
+            'LOAD_TEST_METRICS_DIR': metrics_dir,
+            'COLLECTIONS_API_KEY': api_key,
+        }
+        # the fake reranker replaces the Cohere client, but src.qdrant_db creates it at import.
+        env.setdefault('COHERE_API_KEY', 'load-test')
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'python:benchmarks.load_test_app',
+             '-w', str(workers), '--threads', str(threads), '-b', f"127.0.0.1:{port}",
+             '--timeout', '120', 'benchmarks.load_test_app:create_app()'],
+            cwd=repo_root, env=env,
+        )
+
+    def wait_ready(self, timeout: float):
+        expires_at = time.monotonic() + timeout
+        while time.monotonic() < expires_at:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Error: gunicorn exited with code {self._process.returncode}.")
+            try:
+                if httpx.get(f"{self.url}/metrics", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(1)
+        raise TimeoutError(f"Error: the app didn't start within {timeout} seconds.")
+
+    def stop(self):
+        "graceful shutdown, so every worker runs its worker_exit hook."
+        self._process.send_signal(signal.SIGTERM)
+        try:
+            self._process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+
+def ensure_collection(server: Server, api_key: str, collection_name: str, input_files: List[str],
+                      text_field: str, metadata_fields: List[str]):
+    "create and ingest the collection through the collections API, unless it's already there."
+    headers = {'X-API-Key': api_key}
+    if httpx.get(f"{server.url}/collections/{collection_name}", headers=headers).status_code == 200:
+        return
+    response = httpx.post(f"{server.url}/collections", headers=headers, json={
+        'collection_name': collection_name,
+        'input_files': input_files,
+        'text_field': text_field,
+        'metadata_fields': metadata_fields,
+    })
+    response.raise_for_status()
+    job_id = response.json()['data']['job']['job_id']
+    while True:
+        job = httpx.get(f"{server.url}/jobs/{job_id}", headers=headers).json()['data']
+        if job['status'] in ('succeeded', 'failed', 'cancelled'):
+            break
+        time.sleep(2)
+    if job['status'] != 'succeeded':
+        raise RuntimeError(f"Error: the ingestion of {collection_name} {job['status']}: {job.get('error')}")
+
+
+def run_open_loop(url: str, payloads: List[Dict], qps: float, duration: float, max_in_flight: int,
+                  timeout: float, seed: int) -> Dict:
+    """send the payloads at Poisson arrivals of rate qps, returns the client side results."""
+    rng = random.Random(seed)
+    results = []
+    results_lock = threading.Lock()
+
+    # no session cookie is kept, every request is a new user for the per user limit.
+    http_client = httpx.Client(
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+        timeout=timeout,
+    )
+
+    def send(payload: Dict, scheduled_at: float):
+        try:
+            status = http_client.post(f"{url}/qa_chain", json=payload).status_code
+        except httpx.TimeoutException:
+            status = 'client_timeout'
+        except httpx.HTTPError:
+            status = 'connection_error'
+        finished_at = time.perf_counter()
+        with results_lock:
+            results.append((status, finished_at - scheduled_at, finished_at))
+
+    start = time.perf_counter()
+    scheduled_at = start
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            scheduled_at += rng.expovariate(qps)
+            if scheduled_at - start > duration:
+                break
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, rng.choice(payloads), scheduled_at)
+            sent += 1
+    http_client.close()
+
+    statuses = Counter(str(status) for status, _, _ in results)
+    latencies = [latency for status, latency, _ in results if status == 200]
+    elapsed = max(finished_at for _, _, finished_at in results) - start if results else duration
+    return {
+        'sent': sent,
+        'offered_qps': sent / duration,
+        'throughput_qps': len(latencies) / elapsed,
+        'error_rate': 1 - len(latencies) / sent if sent else 0.0,
+        'statuses': dict(statuses),
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def merge_worker_metrics(metrics_dir: str) -> Dict:
+    """
+    the counters of all the workers are summed. a latency's count and mean are exact, its
+    percentiles are the count weighted average of the workers' percentiles (exact with one worker).
+    """
+    snapshots = [json.loads(path.read_text()) for path in Path(metrics_dir).glob("metrics-*.json")]
+    counters = Counter()
+    latencies = {}
+    for snapshot in snapshots:
+        counters.update(snapshot['counters'])
+        for name, summary in snapshot['latencies'].items():
+            latencies.setdefault(name, []).append(summary)
+
+    stages = {}
+    for name, summaries in sorted(latencies.items()):
+        count = sum(summary['count'] for summary in summaries)
+        stages[name] = {'count': count}
+        for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'):
+            stages[name][key] = sum(summary[key] * summary['count'] for summary in summaries) / count
+    return {'workers': len(snapshots), 'counters': dict(sorted(counters.items())), 'stages': stages}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('questions_file', help="csv file with a question column.")
+    parser.add_argument('--collection', default='ESPN_articles')
+    parser.add_argument('--qps', nargs='+', type=float, default=[1, 2, 4, 8],
+                        help="target rates, every rate runs against a fresh server.")
+    parser.add_argument('--duration', type=float, default=60, help="seconds of traffic per target rate.")
+    parser.add_argument('--workers', type=int, default=1, help="gunicorn workers.")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker.")
+    parser.add_argument('--port', type=int, default=5003)
+    parser.add_argument('--max-in-flight', type=int, default=512,
+                        help="client threads, requests beyond it wait on the client and count as latency.")
+    parser.add_argument('--timeout', type=float, default=config['qos']['deadline_seconds'] + 30,
+                        help="client side timeout of a request.")
+    parser.add_argument('--retrieval-mode', default=None)
+    parser.add_argument('--rerank-median-ms', type=float, default=config['load_test']['rerank']['median_ms'])
+    parser.add_argument('--rerank-p99-ms', type=float, default=config['load_test']['rerank']['p99_ms'])
+    parser.add_argument('--rerank-error-rate', type=float, default=config['load_test']['rerank']['error_rate'])
+    parser.add_argument('--llm-median-ms', type=float, default=config['load_test']['llm']['median_ms'])
+    parser.add_argument('--llm-p99-ms', type=float, default=config['load_test']['llm']['p99_ms'])
+    parser.add_argument('--llm-error-rate', type=float, default=config['load_test']['llm']['error_rate'])
+    parser.add_argument('--input-files', nargs='*', default=[],
+                        help="ingest these files (relative to the data directory) if the collection doesn't exist.")
+    parser.add_argument('--text-field', default='paragraph_text')
+    parser.add_argument('--metadata-fields', nargs='*', default=['title', 'content_publish_date'])
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fakes = {
+        'rerank': {'median_ms': args.rerank_median_ms, 'p99_ms': args.rerank_p99_ms, 'error_rate': args.rerank_error_rate},
+        'llm': {'median_ms': args.llm_median_ms, 'p99_ms': args.llm_p99_ms, 'error_rate': args.llm_error_rate},
+    }
+    questions = pd.read_csv(args.questions_file)['question'].dropna().tolist()
+    payloads = []
+    for question in questions:
+        payload = {'collection_name': args.collection, 'query': question}
+        if args.retrieval_mode:
+            payload['retrieval_mode'] = args.retrieval_mode
+        payloads.append(payload)
+    api_key = secrets.token_hex(16)
+
+    runs = []
+    for qps in args.qps:
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            server = Server(args.port, args.workers, args.threads, fakes, api_key, metrics_dir)
+            try:
+                server.wait_ready(args.startup_timeout)
+                if args.input_files:
+                    ensure_collection(server, api_key, args.collection, args.input_files,
+                                      args.text_field, args.metadata_fields)
+                run = run_open_loop(server.url, payloads, qps, args.duration, args.max_in_flight,
+                                    args.timeout, args.seed)
+            finally:
+                server.stop()
+            run = {'target_qps': qps, **run, 'server': merge_worker_metrics(metrics_dir)}
+        print(json.dumps(run, indent=2))
+        runs.append(run)
+
+    results = {
+        'collection': args.collection,
+        'questions': len(questions),
+        'duration_seconds': args.duration,
+        'workers': args.workers,
+        'threads': args.threads,
+        'retrieval_mode': args.retrieval_mode or config['qdrant']['retrieval_mode'],
+        'qos': {key: config['qos'][key] for key in ('deadline_seconds', 'max_concurrent', 'max_queue')},
+        'fakes': fakes,
+        'runs': runs,
+    }
+    results_dir.mkdir(exist_ok=True)
+    with open(results_dir / "load_test.jsonl", 'a') as f:
+        f.write(json.dumps({'timestamp': time.time(), **results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+The app served by the load test (benchmarks/load_test.py): src.app with the Cohere reranker
+and every LLM provider replaced by local fakes, so the load test measures the service and
+Qdrant without paying for, or being throttled by, the providers.
+
+The fakes sleep for a latency drawn from a log-normal distribution with the configured median
+and p99 (load_test in config.yaml, or the LOAD_TEST_FAKES json the load test passes), fail at
+the configured error rate and respect the request timeouts like the real clients do.
+
+This module is also the gunicorn config file, its worker_exit hook writes the metrics of every
+worker to LOAD_TEST_METRICS_DIR:
+    gunicorn -c python:benchmarks.load_test_app -w 1 --threads 8 -b 127.0.0.1:5003 \
+        "benchmarks.load_test_app:create_app()"
+"""
+import json
+import math
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import yaml
+from cohere import V2RerankResponse, V2RerankResponseResultsItem
+from requests.exceptions import ConnectionError
+
+from src.llm_providers.llm_connections import LLMStrategy
+
+repo_root = Path(__file__).resolve().parent.parent
+
+with open(repo_root / "config.yaml", 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+Z_99 = 2.3263
+
+
+class LatencyDistribution:
+    "a log-normal latency with the given median and 99th percentile, in milliseconds."
+
+    def __init__(self, median_ms: float, p99_ms: float, error_rate: float = 0.0):
+        if p99_ms < median_ms:
+            raise ValueError(f"Error: p99_ms ({p99_ms}) should be at least median_ms ({median_ms}).")
+        self._mu = math.log(median_ms / 1000)
+        self._sigma = math.log(p99_ms / median_ms) / Z_99
+        self.error_rate = error_rate
+
+    def sample(self) -> float:
+        "seconds"
+        return random.lognormvariate(self._mu, self._sigma)
+
+    def wait(self, timeout: Optional[float], timeout_error: type, name: str):
+        """sleep like a provider call would, raises timeout_error when the call would outlive
+        its timeout and ConnectionError at the error rate."""
+        latency = self.sample()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise timeout_error(f"The fake {name} didn't answer within {timeout:.2f} seconds.")
+        time.sleep(latency)
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"The fake {name} failed.")
+
+
+class FakeReranker:
+    "stands in for cohere.ClientV2 in HybridSearcher, keeps the fusion order of the documents."
+
+    def __init__(self, latency: LatencyDistribution):
+        self._latency = latency
+
+    def rerank(self, model: str, query: str, documents: List[str], top_n: int = None,
+               request_options: Dict = None, **kwargs) -> V2RerankResponse:
+        timeout = (request_options or {}).get('timeout_in_seconds')
+        self._latency.wait(timeout, httpx.TimeoutException, "reranker")
+        top_n = len(documents) if top_n is None else min(top_n, len(documents))
+        return V2RerankResponse(results=[
+            V2RerankResponseResultsItem(index=index, relevance_score=1 - index / len(documents))
+            for index in range(top_n)
+        ])
+
+
+class FakeLLMStrategy(LLMStrategy):
+    "answers every question with a canned text after a provider like delay."
+
+    def __init__(self, provider: str, model: str, latency: LatencyDistribution):
+        self.provider = provider
+        self.model = model
+        self._latency = latency
+
+    def generate_response(self, messages: list, temperature=0, timeout: Optional[float] = None) -> str:
+        self._latency.wait(timeout, TimeoutError, f"{self.provider}/{self.model}")
+        question = next((message['content'] for message in messages if str(message['content']).startswith("Question: ")), "")
+        return f"A fake answer of {self.model} to the {question}"
+
+
+def fakes_config() -> Dict:
+    fakes = os.getenv("LOAD_TEST_FAKES")
+    return json.loads(fakes) if fakes else config['load_test']
+
+
+def create_app():
+    "src.app with the fake providers, warmed up so the first requests don't load the models."
+    from src import qdrant_db
+    from src.app import app, limiter
+    from src.embedding_models import EmbeddingModels
+    from src.llm_providers.llm_connections import LLMClient
+    from src.utils.metrics import metrics
+
+    fakes = fakes_config()
+    qdrant_db.co = FakeReranker(LatencyDistribution(**fakes['rerank']))
+    llm_latency = LatencyDistribution(**fakes['llm'])
+    LLMClient._create_strategy = staticmethod(lambda provider, model: FakeLLMStrategy(provider, model, llm_latency))
+    # the load comes from one address and without session cookies, the per user limits don't apply.
+    limiter.enabled = False
+
+    EmbeddingModels(qdrant_db.dense_model, qdrant_db.sparse_model, qdrant_db.late_interaction_model).embed_query(
+        "load test warm up")
+    metrics.reset()
+    return app
+
+
+def worker_exit(server, worker):
+    "gunicorn hook, runs in the exiting worker."
+    metrics_dir = os.getenv("LOAD_TEST_METRICS_DIR")
+    if not metrics_dir:
+        return
+    from src.utils.metrics import metrics
+
+    with open(Path(metrics_dir) / f"metrics-{os.getpid()}.json", 'w') as f:
+        json.dump(metrics.snapshot(), f)
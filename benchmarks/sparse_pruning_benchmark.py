@@ -0,0 +1,148 @@
+"""
+Measures what pruning the SPLADE vectors costs and saves on a sample of the corpus.
+Every pruning setting gets its own temporary sparse only collection, and is compared to
+the unpruned vectors on:
+    - index size: the number of postings (terms) stored and their estimated bytes.
+    - sparse search latency percentiles, with the query pruning applied too.
+    - recall@k: the share of the unpruned top k results that the pruned search still returns.
+
+usage (from the repo root):
+    python -m benchmarks.sparse_pruning_benchmark data/espn/espn_stories.csv data/testsest/testset_questions.csv \
+        --top-k 64 128 --min-weight 0.1 0.3
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from fastembed import SparseTextEmbedding
+from qdrant_client import models
+
+from src.qdrant_db import client, sparse_model, sparse_index_config
+from src.embedding_models import prune_sparse_vector
+from src.model_store import fastembed_kwargs
+from src.utils.utility_functions import iter_input_batches
+
+results_dir = Path(__file__).resolve().parent / "results"
+
+# 4 bytes term id + 4 bytes weight per posting.
+POSTING_BYTES = 8
+
+
+def percentiles(latencies: list) -> dict:
+    return {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in (50, 90, 95, 99)}
+
+
+def prune(vector: models.SparseVector, top_k: int = None, min_weight: float = None) -> models.SparseVector:
+    indices, values = prune_sparse_vector(np.array(vector.indices), np.array(vector.values), top_k, min_weight)
+    return models.SparseVector(indices=indices.tolist(), values=values.tolist())
+
+
+def build_collection(collection_name: str, vectors: list, on_disk: bool, idf_modifier: bool):
+    vector_name = client.get_sparse_vector_field_name()
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={},
+        sparse_vectors_config={vector_name: models.SparseVectorParams(
+            index=models.SparseIndexParams(on_disk=on_disk),
+            modifier=models.Modifier.IDF if idf_modifier else None)},
+    )
+    points = [models.PointStruct(id=i, vector={vector_name: vector}) for i, vector in enumerate(vectors)]
+    client.upload_points(collection_name=collection_name, points=points, batch_size=256, wait=True)
+
+
+def search(collection_name: str, query_vectors: list, limit: int):
+    vector_name = client.get_sparse_vector_field_name()
+    latencies, results = [], []
+    for query_vector in query_vectors:
+        start = time.perf_counter()
+        response = client.query_points(collection_name=collection_name, query=query_vector,
+                                       using=vector_name, limit=limit)
+        latencies.append(time.perf_counter() - start)
+        results.append([point.id for point in response.points])
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus_file', help="csv/json/arrow corpus with a paragraph_text column.")
+    parser.add_argument('questions_file', help="csv file with a question column.")
+    parser.add_argument('--text-field', default='paragraph_text')
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--top-k', type=int, nargs='*', default=[32, 64, 128])
+    parser.add_argument('--min-weight', type=float, nargs='*', default=[0.1, 0.3])
+    parser.add_argument('--on-disk', action='store_true', default=sparse_index_config['on_disk'])
+    parser.add_argument('--idf-modifier', action='store_true', default=sparse_index_config['idf_modifier'])
+    args = parser.parse_args()
+
+    documents = []
+    for batch in iter_input_batches([args.corpus_file], [args.text_field]):
+        documents.extend(batch.column(args.text_field).to_pylist())
+        if len(documents) >= args.documents:
+            break
+    documents = documents[:args.documents]
+    questions = pd.read_csv(args.questions_file)['question'].dropna().tolist()[:args.queries]
+
+    model = SparseTextEmbedding(model_name=sparse_model, **fastembed_kwargs())
+    document_vectors = [models.SparseVector(indices=vector.indices.tolist(), values=vector.values.tolist())
+                        for vector in model.embed(documents, batch_size=32)]
+    query_vectors = [models.SparseVector(indices=vector.indices.tolist(), values=vector.values.tolist())
+                     for vector in model.query_embed(questions)]
+
+    settings = [('full', None, None)]
+    settings += [(f'top_{top_k}', top_k, None) for top_k in args.top_k]
+    settings += [(f'min_weight_{min_weight}', None, min_weight) for min_weight in args.min_weight]
+
+    baseline_results = None
+    report = []
+    for label, top_k, min_weight in settings:
+        collection_name = f"sparse_pruning_benchmark_{label}".replace('.', '_')
+        pruned_documents = [prune(vector, top_k, min_weight) for vector in document_vectors]
+        pruned_queries = [prune(vector, top_k, min_weight) for vector in query_vectors]
+        build_collection(collection_name, pruned_documents, args.on_disk, args.idf_modifier)
+        try:
+            search(collection_name, pruned_queries[:3], args.limit)
+            latencies, results = search(collection_name, pruned_queries, args.limit)
+        finally:
+            client.delete_collection(collection_name)
+
+        if baseline_results is None:
+            baseline_results = results
+        recall = np.mean([len(set(result) & set(baseline)) / max(len(baseline), 1)
+                          for result, baseline in zip(results, baseline_results)])
+        postings = sum(len(vector.indices) for vector in pruned_documents)
+        report.append({
+            'setting': label,
+            'top_k': top_k,
+            'min_weight': min_weight,
+            'postings': postings,
+            'index_bytes': postings * POSTING_BYTES,
+            'mean_document_terms': postings / len(pruned_documents),
+            'mean_query_terms': float(np.mean([len(vector.indices) for vector in pruned_queries])),
+            'latency_ms': percentiles(latencies),
+            f'recall_at_{args.limit}': float(recall),
+        })
+
+    results = {
+        'sparse_model': sparse_model,
+        'documents': len(documents),
+        'queries': len(questions),
+        'on_disk': args.on_disk,
+        'idf_modifier': args.idf_modifier,
+        'settings': report,
+    }
+    print(json.dumps(results, indent=2))
+
+    results_dir.mkdir(exist_ok=True)
+    with open(results_dir / "sparse_pruning.jsonl", 'a') as f:
+        f.write(json.dumps({'timestamp': time.time(), **results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the Qdrant transports (see src/qdrant_transport.py) on the same points and queries:
+    - bulk upsert throughput (points per second) into a temporary collection.
+    - hybrid search latency percentiles (dense + sparse prefetch fused with RRF).
+The corpus and the questions are embedded once, so only the transport and the server are measured.
+
+usage (from the repo root, rest and grpc need a running Qdrant server):
+    python -m benchmarks.transport_benchmark data/espn/espn_stories.csv data/testsest/testset_questions.csv \
+        --transports rest grpc local
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from qdrant_client import models
+
+from src.embedding_models import EmbeddingModels, build_points
+from src.qdrant_db import client, dense_model, sparse_model
+from src.qdrant_transport import TRANSPORTS, create_qdrant_client
+from src.utils.utility_functions import create_index_dict_from_batch, iter_input_batches
+
+results_dir = Path(__file__).resolve().parent / "results"
+
+COLLECTION_NAME = "transport_benchmark"
+
+
+def percentiles(latencies: list) -> dict:
+    return {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in (50, 90, 95, 99)}
+
+
+def bulk_upsert(qdrant_client, points: list, batch_size: int) -> float:
+    "upload the points to a new collection, returns the seconds it took."
+    if qdrant_client.collection_exists(COLLECTION_NAME):
+        qdrant_client.delete_collection(COLLECTION_NAME)
+    qdrant_client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=client.get_fastembed_vector_params(),
+        sparse_vectors_config=client.get_fastembed_sparse_vector_params(),
+    )
+    start = time.perf_counter()
+    qdrant_client.upload_points(collection_name=COLLECTION_NAME, points=points, batch_size=batch_size, wait=True)
+    return time.perf_counter() - start
+
+
+def hybrid_search(qdrant_client, query_embeddings: list, limit: int) -> list:
+    dense_name, sparse_name = client.get_vector_field_name(), client.get_sparse_vector_field_name()
+    latencies = []
+    for embeddings in query_embeddings:
+        start = time.perf_counter()
+        qdrant_client.query_points(
+            collection_name=COLLECTION_NAME,
+            prefetch=[
+                models.Prefetch(query=embeddings['dense'], using=dense_name, limit=limit),
+                models.Prefetch(query=embeddings['sparse'], using=sparse_name, limit=limit),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+        )
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus_file', help="csv/json/arrow corpus with a paragraph_text column.")
+    parser.add_argument('questions_file', help="csv file with a question column.")
+    parser.add_argument('--transports', nargs='+', choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument('--text-field', default='paragraph_text')
+    parser.add_argument('--metadata-fields', nargs='*', default=['title'])
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    documents, metadata = [], []
+    for batch in iter_input_batches([args.corpus_file], [args.text_field] + args.metadata_fields):
+        index_dict = create_index_dict_from_batch(batch, args.text_field, args.metadata_fields)
+        documents.extend(index_dict['documents'])
+        metadata.extend(index_dict['metadata'])
+        if len(documents) >= args.documents:
+            break
+    documents, metadata = documents[:args.documents], metadata[:args.documents]
+    questions = pd.read_csv(args.questions_file)['question'].dropna().tolist()[:args.queries]
+
+    embedding_models = EmbeddingModels(dense_model, sparse_model)
+    embeddings = embedding_models.embed_documents(documents, vectors=('dense', 'sparse'))
+    points = build_points(documents, metadata, embeddings,
+                          client.get_vector_field_name(), client.get_sparse_vector_field_name())
+    query_embeddings = [embedding_models.embed_query(question, ('dense', 'sparse')) for question in questions]
+
+    report = []
+    for transport in args.transports:
+        with tempfile.TemporaryDirectory() as local_dir:
+            qdrant_client = create_qdrant_client(transport, local_path=local_dir)
+            try:
+                upsert_seconds = bulk_upsert(qdrant_client, points, args.batch_size)
+                hybrid_search(qdrant_client, query_embeddings[:5], args.limit)
+                latencies = hybrid_search(qdrant_client, query_embeddings, args.limit)
+            finally:
+                qdrant_client.delete_collection(COLLECTION_NAME)
+                qdrant_client.close()
+        report.append({
+            'transport': transport,
+            'upsert_points_per_second': len(points) / upsert_seconds,
+            'search_latency_ms': percentiles(latencies),
+            'search_qps': len(latencies) / sum(latencies),
+        })
+
+    results = {'documents': len(points), 'queries': len(questions), 'limit': args.limit, 'transports': report}
+    print(json.dumps(results, indent=2))
+
+    results_dir.mkdir(exist_ok=True)
+    with open(results_dir / "transport.jsonl", 'a') as f:
+        f.write(json.dumps({'timestamp': time.time(), **results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
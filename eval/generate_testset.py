@@ -11,9 +11,16 @@ from ragas.testset.evolutions import simple, reasoning, multi_context
 
 import pandas as pd
 import yaml
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
 
 from src.utils.utility_functions import read_and_concatenate, update_section_with_kwargs
-from src.utils.llama_index_utils import docs_list_from_df
+from src.utils.llama_index_utils import stratified_docs_from_files, CachedEmbedding
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.dedup_utils import find_near_duplicates, normalize_text
 from src.utils.logger import get_logger
 
 from src.llm_providers.llama_index_llm import LLMServiceManager
@@ -37,23 +44,94 @@ ragas_models_config = config['ragas']
 llama_index_azure_openai = LLMServiceManager("azure_openai", ragas_models_config['critic_llm'],
                     ragas_models_config['eval_embeddings'])
 
-# set up generator llm, critic llm and embeddings to create the synthetic testset.    
+# set up generator llm, critic llm and embeddings to create the synthetic testset.
+# the documents embeddings are cached between runs, every shard process opens the same cache.
 generator_llm = llama_index_azure_openai.get_llm_model()
 critic_llm = llama_index_azure_openai.get_llm_model()
-embeddings = llama_index_azure_openai.get_embedding_model()
+embeddings = CachedEmbedding(llama_index_azure_openai.get_embedding_model(),
+                             EmbeddingCache(repo_root / config['testset']['embedding_cache']))
+
+EVOLUTIONS = {'simple': simple, 'reasoning': reasoning, 'multi_context': multi_context}
+
+
+def _generate_shard(shard_id: int, documents: List, test_size: int, distributions: Dict[str, float]) -> Tuple[pd.DataFrame, Dict]:
+    """runs in a worker process, generates the questions of one shard.
+    returns the testset df and the embedding cache hits and misses of the shard."""
+    generator = TestsetGenerator.from_llama_index(
+        generator_llm,
+        critic_llm,
+        embeddings
+    )
+    logger.info(f"Started to generate {test_size} questions from shard {shard_id} ({len(documents)} docs).")
+    testset = generator.generate_with_llamaindex_docs(
+        documents,
+        test_size=test_size,
+        raise_exceptions=False,
+        with_debugging_logs=False,
+        distributions={EVOLUTIONS[name]: share for name, share in distributions.items()},
+    )
+    df = testset.to_pandas()
+    df['shard'] = shard_id
+    cache = embeddings.cache
+    logger.info(f"Shard {shard_id} generated {len(df)} questions, embedding cache hit rate {cache.hit_rate():.1%}.")
+    return df, {'hits': cache.hits, 'misses': cache.misses}
+
+
+def split_into_shards(strata: Dict[Tuple, List], shards: int, seed: int) -> List[List]:
+    """
+    deal the strata to the shards in a random order, every shard gets whole strata (e.g. whole
+    articles) so multi context questions can still combine paragraphs of the same article.
+    """
+    strata_keys = list(strata.keys())
+    random.Random(seed).shuffle(strata_keys)
+    shard_docs = [[] for _ in range(min(shards, len(strata_keys)))]
+    for i, stratum in enumerate(strata_keys):
+        shard_docs[i % len(shard_docs)].extend(strata[stratum])
+    return shard_docs
+
+
+def deduplicate_questions(df: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    "drop the empty, the exactly repeated (after normalization) and the near duplicate questions."
+    df = df.dropna(subset=['question'])
+    df = df[df['question'].str.strip() != '']
+    df = df[~df['question'].map(normalize_text).duplicated()].reset_index(drop=True)
+    # questions are short, so they are compared by shingles of 3 words.
+    duplicates_df = find_near_duplicates(df['question'], threshold=threshold, shingle_size=3)
+    return df.drop(index=duplicates_df.index).reset_index(drop=True)
+
+
+def trim_to_distributions(df: pd.DataFrame, test_size: int, distributions: Dict[str, float], seed: int) -> pd.DataFrame:
+    """
+    sample test_size questions with the share of every evolution type from distributions,
+    a type that came short is filled with questions of the other types.
+    """
+    df = df.sample(frac=1, random_state=seed)
+    selected = []
+    for evolution_type, share in distributions.items():
+        selected.append(df[df['evolution_type'] == evolution_type].head(round(test_size * share)))
+    selected = pd.concat(selected)
+    missing = test_size - len(selected)
+    if missing > 0:
+        selected = pd.concat([selected, df.drop(index=selected.index).head(missing)])
+    return selected.head(test_size).reset_index(drop=True)
 
 
 def create_synthetic_ragas_df (input_files : list[str], text_field, metadata_fields, **kwargs) -> pd.DataFrame:
     """
     generates a synthetic testset using ragas API based on the data in the input files
+    the paragraphs of all the input files are streamed and sampled by stratum (testset.strata_fields,
+    e.g. the article title), the strata are split into shards that generate their share of the
+    questions in parallel processes, and the questions of all the shards are merged and deduplicated.
     Parameters
     ----------
-    input_files : list of files that will be converted to llama index docs (csv, xlsx...).
+    input_files : list of files that will be converted to llama index docs (csv, xlsx, arrow...).
     
     **kwargs: dict, available keys:
         - test_size: int, how many questions you want to produce.
         - distributions: dict, got three fields: simple, reasoning, multi_context.
           the sum of their values sould be equals to 1 with each value represent the part of each question type.
+        - shards, max_workers, strata_fields, docs_per_stratum, oversample, dedup_threshold, seed:
+          see the testset section of config.yaml.
 
     Returns
     -------
@@ -64,32 +142,37 @@ def create_synthetic_ragas_df (input_files : list[str], text_field, metadata_fie
     # set testset_config and update it according to the kwargs.
     testset_config = config['testset']
     testset_config = update_section_with_kwargs(testset_config, **kwargs)
-    
-    # set up the llama_index docs that the synthetic testset will be built on.      
-    #df = read_and_concatenate(input_files)
-    df = pd.read_csv(input_files[0])
-    docs = docs_list_from_df(df, text_field, metadata_fields)
-    
-    generator = TestsetGenerator.from_llama_index(
-        generator_llm,
-        critic_llm,
-        embeddings
-    )
-    logger.info(f"Started to Generate synthetic ragas df based on f{input_files}.")
-    
-    # create the testset
-    testset = generator.generate_with_llamaindex_docs(
-        docs,
-        test_size=testset_config['test_size'],
-        raise_exceptions=False,
-        with_debugging_logs=False,
-        distributions={simple: testset_config['distributions']['simple'],
-                       reasoning: testset_config['distributions']['reasoning'],
-                       multi_context: testset_config['distributions']['multi_context']},
-    )
-    
-    df = testset.to_pandas()
-    logger.info("Generated synthetic ragas df successfully.")
+    test_size = testset_config['test_size']
+    distributions = testset_config['distributions']
+    
+    # set up the llama_index docs that the synthetic testset will be built on.
+    strata = stratified_docs_from_files(input_files, text_field, metadata_fields, testset_config['strata_fields'],
+                                        testset_config['docs_per_stratum'], testset_config['seed'])
+    shard_docs = split_into_shards(strata, testset_config['shards'], testset_config['seed'])
+    docs_count = sum(len(docs) for docs in shard_docs)
+    
+    # every shard generates its share (by docs) of the questions, with some extra for the deduplication.
+    target_size = math.ceil(test_size * testset_config['oversample'])
+    shard_sizes = [max(1, round(target_size * len(docs) / docs_count)) for docs in shard_docs]
+    logger.info(f"Started to Generate synthetic ragas df based on {input_files}: {len(strata)} strata, "
+                f"{docs_count} docs, {len(shard_docs)} shards.")
+    
+    with ProcessPoolExecutor(max_workers=testset_config['max_workers'],
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(_generate_shard, shard_id, docs, shard_size, distributions)
+                   for shard_id, (docs, shard_size) in enumerate(zip(shard_docs, shard_sizes))]
+        results = [future.result() for future in futures]
+    
+    hits = sum(cache_stats['hits'] for _, cache_stats in results)
+    lookups = hits + sum(cache_stats['misses'] for _, cache_stats in results)
+    logger.info(f"Embedding cache hit rate {hits / lookups if lookups else 0:.1%} ({hits}/{lookups}).")
+    
+    df = pd.concat([shard_df for shard_df, _ in results], ignore_index=True)
+    generated_count = len(df)
+    df = deduplicate_questions(df, testset_config['dedup_threshold'])
+    df = trim_to_distributions(df, test_size, distributions, testset_config['seed'])
+    logger.info(f"Generated synthetic ragas df successfully: {len(df)} questions, "
+                f"{generated_count} generated before the deduplication.")
     
     return df
 
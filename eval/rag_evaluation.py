@@ -6,12 +6,16 @@ from ragas import evaluate
 from datasets import Dataset
 import pandas as pd
 import numpy as np
+import hashlib
+import json
 import time
 import yaml
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from src.llm_providers.llama_index_llm import LLMServiceManager
 from src.utils.logger import get_logger
+from src.utils.sqlite_store import SqliteStore
 
 logger = get_logger()
 
@@ -34,6 +38,55 @@ embeddings = llama_index_azure_openai.get_embedding_model()
 
 
 
+_SCORES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    score_key TEXT PRIMARY KEY,
+    metric TEXT NOT NULL,
+    score REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class ScoreCache(SqliteStore):
+    """
+    Persistent content addressed cache of RAGAS scores, keyed by the metric, the judge models
+    and the row's question, answer, contexts and ground truth, so re-evaluating after a change
+    sends only the rows that changed to the judge. stored in SQLite in WAL mode.
+    """
+
+    def __init__(self, db_path, judge_models: Dict[str, str], busy_timeout=30):
+        super().__init__(db_path, busy_timeout)
+        self._judge_models = judge_models
+        self._connection().executescript(_SCORES_SCHEMA)
+
+    def score_key(self, metric: str, row: Dict) -> str:
+        content = json.dumps({
+            'metric': metric,
+            'judge_models': self._judge_models,
+            'question': row['question'],
+            'answer': row['answer'],
+            'contexts': row['contexts'],
+            'ground_truth': row['ground_truth'],
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, score_key: str) -> Optional[float]:
+        row = self._connection().execute("SELECT score FROM scores WHERE score_key = ?", (score_key,)).fetchone()
+        return None if row is None else row[0]
+
+    def put_many(self, scores: List[tuple]):
+        "scores: (score_key, metric, score) tuples, the missing (NaN) scores are not cached so they are retried."
+        rows = [(score_key, metric, float(score), time.time()) for score_key, metric, score in scores
+                if score is not None and not np.isnan(score)]
+        with self._write() as conn:
+            conn.executemany("INSERT OR REPLACE INTO scores (score_key, metric, score, created_at) VALUES (?, ?, ?, ?)", rows)
+
+
+score_cache = ScoreCache(repo_root / ragas_models_config['score_cache'],
+                         {'eval_llm': ragas_models_config['eval_llm'], 'eval_embeddings': ragas_models_config['eval_embeddings']})
+
+
 def assemble_ragas_dataset(testset_df: pd.DataFrame) -> Dataset:
     "convert the testset_df generated from generate_testset.rag_answers_to_ragas_questions to HF dataset"
     
@@ -53,7 +106,7 @@ def assemble_ragas_dataset(testset_df: pd.DataFrame) -> Dataset:
     return ragas_ds
 
 
-def df_evaluation(testset_df: pd.DataFrame, metrics: list) -> pd.DataFrame:
+def df_evaluation(testset_df: pd.DataFrame, metrics: list, use_cache: bool = True) -> pd.DataFrame:
     """
 
     Parameters
@@ -62,6 +115,9 @@ def df_evaluation(testset_df: pd.DataFrame, metrics: list) -> pd.DataFrame:
         the testset_df generated from generate_testset.rag_answers_to_ragas_questions.
     metrics : list
         A list of ragas metrics (can only be taken from the metrics imported above.
+    use_cache : bool
+        look up the scores in the score cache first, only the (row, metric) pairs that are not
+        cached are sent to evaluate, and the new scores are added to the cache.
 
     Returns
     -------
@@ -81,9 +137,42 @@ def df_evaluation(testset_df: pd.DataFrame, metrics: list) -> pd.DataFrame:
         globals()[metric].embeddings = ragas_emb
 
     dataset = assemble_ragas_dataset(testset_df)
+    df_score = dataset.to_pandas()
+    rows = dataset.to_list()
+    
+    # the score key and the cached score (None on a miss) of every row and metric.
+    score_keys = {metric: [score_cache.score_key(metric, row) for row in rows] for metric in str_metrics}
+    cached_scores = {metric: [score_cache.get(key) if use_cache else None for key in keys]
+                     for metric, keys in score_keys.items()}
+    
+    # rows that miss the same metrics are evaluated together, usually all the new rows miss all of them.
+    missing_groups: Dict[tuple, List[int]] = {}
+    for i in range(len(rows)):
+        missing_metrics = tuple(metric for metric in str_metrics if cached_scores[metric][i] is None)
+        if missing_metrics:
+            missing_groups.setdefault(missing_metrics, []).append(i)
+    
+    for missing_metrics, row_indices in missing_groups.items():
+        score = evaluate(dataset.select(row_indices), metrics=[globals()[metric] for metric in missing_metrics],
+                         llm=ragas_llm, embeddings=embeddings)
+        group_df = score.to_pandas()
+        new_scores = []
+        for metric in missing_metrics:
+            for i, value in zip(row_indices, group_df[metric].tolist()):
+                cached_scores[metric][i] = value
+                new_scores.append((score_keys[metric][i], metric, value))
+        score_cache.put_many(new_scores)
     
-    score = evaluate(dataset, metrics=metrics, llm=ragas_llm, embeddings=embeddings)
-    df_score = score.to_pandas()
+    for metric in str_metrics:
+        df_score[metric] = [np.nan if value is None else value for value in cached_scores[metric]]
+    
+    evaluated = {metric: sum(len(row_indices) for missing_metrics, row_indices in missing_groups.items()
+                             if metric in missing_metrics) for metric in str_metrics}
+    hit_rates = ', '.join(f"{metric} {1 - evaluated[metric] / len(rows):.0%}" for metric in str_metrics) if rows else ''
+    total_lookups = len(rows) * len(str_metrics)
+    total_hits = total_lookups - sum(evaluated.values())
+    logger.info(f"Score cache hit rate {total_hits / total_lookups if total_lookups else 0:.1%} "
+                f"({total_hits}/{total_lookups}): {hit_rates}.")
     
     return df_score
 
@@ -1,12 +1,23 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, g
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from functools import wraps
+import hmac
 import os
+import time
 
 
-from src.qdrant_db import HybridSearcher  # Importing your HybridSearcher class
+from src.qdrant_db import HybridSearcher, QdrantCollectionManager, registry_path, SHARDING_SETTINGS  # Importing your HybridSearcher class
+from src.ingestion_jobs import IngestionJobQueue
+from src.utils.metrics import metrics
+from src.utils.logger import get_logger
+from src.utils.request_context import start_request, end_request, current_request_id, stage_timings
+from src.utils.qos import DeadlineExceeded, OverloadedError
+from src.llm_providers.llm_connections import CircuitOpenError
 from requests.exceptions import RequestException, ConnectionError
+from httpx import TimeoutException
+from openai import APITimeoutError
 from qdrant_client.http.exceptions import UnexpectedResponse
 from qdrant_client.http.api_client import ResponseHandlingException
 
@@ -24,6 +35,51 @@ limiter = Limiter(
 
 # Initialize the HybridSearcher
 searcher = HybridSearcher()
+collection_manager = QdrantCollectionManager()
+ingestion_queue = IngestionJobQueue(registry_path)
+logger = get_logger()
+
+@app.before_request
+def start_request_context():
+    # the caller's request id is kept, so the logs can be joined with the upstream ones.
+    g.request_start_time = time.perf_counter()
+    start_request(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def log_request(response):
+    """
+    Logs one record per request with its status, duration and the timings of the stages it went
+    through (search, rerank, generate, ...), and returns the request id in X-Request-ID.
+    """
+    # a request rejected by the rate limiter never started its context.
+    if current_request_id() is None:
+        start_request(request.headers.get('X-Request-ID'))
+    duration = time.perf_counter() - g.get('request_start_time', time.perf_counter())
+    response.headers['X-Request-ID'] = current_request_id()
+    logger.info(f"{request.method} {request.path} {response.status_code}", extra={
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'stages': {name: round(ms, 3) for name, ms in stage_timings().items()},
+    })
+    return response
+
+@app.teardown_request
+def end_request_context(exception=None):
+    end_request()
+
+def validate_qa_request(collection_name, shard_keys):
+    """the collections and shard keys are part of the key that coalesces identical requests,
+    so they should be strings (or integers for the shard keys), raises ValueError."""
+    if isinstance(collection_name, list):
+        if not all(isinstance(name, str) for name in collection_name):
+            raise ValueError("collection_name should be a collection name or a list of collection names.")
+    elif not isinstance(collection_name, str):
+        raise ValueError("collection_name should be a collection name or a list of collection names.")
+    if shard_keys and (not isinstance(shard_keys, list)
+                       or not all(isinstance(key, (str, int)) and not isinstance(key, bool) for key in shard_keys)):
+        raise ValueError("shard_keys should be a list of shard keys (strings or integers).")
 
 @app.route('/qa_chain', methods=['POST'])
 def qa_chain():
@@ -31,11 +87,13 @@ def qa_chain():
     Endpoint to call the QA_chain function.
     Expects a JSON payload with the following format:
     {
-        "collection_name": "your_collection_name",
+        "collection_name": "your_collection_name", a list of collections or a collection group,
         "query": "your_query",
         "prompt": "your_prompt",
         "model": "your_model",
-        "provider": "cohere" or "azure_openai"
+        "provider": "cohere" or "azure_openai",
+        "retrieval_mode": "sparse", "dense", "hybrid", "hybrid_rerank" or "auto" (optional),
+        "shard_keys": ["nba", "wnba"] (optional, only search these shard keys of custom sharded collections)
     }
     """
     user_limit = limit_user_requests()
@@ -51,6 +109,9 @@ def qa_chain():
         prompt = data.get('prompt')
         model = data.get('model')
         provider = data.get('provider')
+        retrieval_mode = data.get('retrieval_mode')
+        shard_keys = data.get('shard_keys')
+        validate_qa_request(collection_name, shard_keys)
 
         # Call QA_chain function
         kwargs = {}
@@ -60,6 +121,10 @@ def qa_chain():
             kwargs['model'] = model
         if provider:
             kwargs['provider'] = provider
+        if retrieval_mode:
+            kwargs['retrieval_mode'] = retrieval_mode
+        if shard_keys:
+            kwargs['shard_keys'] = shard_keys
         
         response = searcher.QA_chain(collection_name, query, **kwargs)        
 
@@ -69,6 +134,29 @@ def qa_chain():
             'data': response
         })
 
+    # Admission queue is full, shed the load
+    except OverloadedError as e:
+        response = jsonify({
+            'status': 'error',
+            'message': f"Overloaded: {str(e)} Please retry in {e.retry_after} seconds."
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    # Every LLM provider is failing, their circuit breakers are open
+    except CircuitOpenError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"LLM Error: {str(e)} Please try again later."
+        }), 503
+
+    # The request ran out of its time budget, or a provider call timed out
+    except (DeadlineExceeded, TimeoutException, APITimeoutError, TimeoutError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Timeout Error: The request did not finish within its deadline. {str(e)}"
+        }), 504
+
     # Specific error for invalid Cohere LLM model
     except ValueError as e:
         if "parameter model is of type number" in str(e):
@@ -121,6 +209,234 @@ def qa_chain():
             'message': f"Unexpected Error: {str(e)}"
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def get_metrics():
+    """
+    Counters and latency percentiles of this worker process, e.g.
+    qa_chain.requests, qa_chain.executions and qa_chain.deduplicated.
+    """
+    return jsonify({'status': 'success', 'data': metrics.snapshot()})
+
+def require_api_key(route):
+    """
+    The collections management endpoints are enabled only when the COLLECTIONS_API_KEY
+    environment variable is set, and every request has to send it in the X-API-Key header.
+    """
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        api_key = os.getenv('COLLECTIONS_API_KEY')
+        if not api_key:
+            return jsonify({
+                'status': 'error',
+                'message': "The collections API is disabled, set COLLECTIONS_API_KEY to enable it."
+            }), 403
+        if not hmac.compare_digest(request.headers.get('X-API-Key', ''), api_key):
+            return jsonify({
+                'status': 'error',
+                'message': "Invalid or missing X-API-Key header."
+            }), 401
+        return route(*args, **kwargs)
+    return wrapper
+
+def collection_status(collection_name):
+    collection_info = collection_manager.get_collection_info(collection_name)
+    collection_info['jobs'] = ingestion_queue.get_jobs(collection_name)
+    return collection_info
+
+def validate_ingestion(data):
+    """validate the ingestion payload and check that its files exist, raises ValueError.
+    returns the input_files, text_field and metadata_fields."""
+    input_files = data.get('input_files')
+    text_field = data.get('text_field', 'paragraph_text')
+    metadata_fields = data.get('metadata_fields')
+    if not isinstance(input_files, list) or not input_files or not all(isinstance(name, str) for name in input_files):
+        raise ValueError("input_files should be a non empty list of files names.")
+    if not isinstance(text_field, str) or not text_field:
+        raise ValueError("text_field should be a column name.")
+    if not isinstance(metadata_fields, list) or not all(isinstance(field, str) for field in metadata_fields):
+        raise ValueError("metadata_fields should be a list of columns names.")
+    for file_name in input_files:
+        ingestion_queue.resolve_input_file(file_name)
+    return input_files, text_field, metadata_fields
+
+def submit_ingestion(collection_name, data):
+    """validate the payload and queue an ingest job, returns the job record."""
+    job_id = ingestion_queue.submit(collection_name, *validate_ingestion(data))
+    return ingestion_queue.get_job(job_id)
+
+@app.route('/collections', methods=['GET'])
+@limiter.exempt
+@require_api_key
+def list_collections():
+    collections = [collection_manager.get_collection_info(name) for name in collection_manager.get_collections()]
+    return jsonify({'status': 'success', 'data': collections})
+
+@app.route('/collections', methods=['POST'])
+@limiter.exempt
+@require_api_key
+def create_collection():
+    """
+    Create a collection, and optionally queue the ingestion of files into it.
+    Expects a JSON payload with the following format:
+    {
+        "collection_name": "your_collection_name",
+        "input_files": ["espn/espn_stories.csv"],  (optional, relative to the data directory)
+        "text_field": "paragraph_text",
+        "metadata_fields": ["title", "content_publish_date"],
+        "normalize_metadata": true,  (optional, store the metadata once per article, see create_collection)
+        "shard_number": 4,  (optional, the sharding settings, the defaults are in the config, see create_collection)
+        "replication_factor": 1,
+        "write_consistency_factor": 1,
+        "shard_key_field": "site"
+    }
+    """
+    data = request.get_json() or {}
+    collection_name = data.get('collection_name')
+    if not isinstance(collection_name, str) or not collection_name:
+        return jsonify({'status': 'error', 'message': "Value Error: collection_name should be a non empty string."}), 400
+    
+    try:
+        collection_kwargs = {}
+        if 'normalize_metadata' in data:
+            if not isinstance(data['normalize_metadata'], bool):
+                raise ValueError("normalize_metadata should be a boolean.")
+            collection_kwargs['normalize_metadata'] = data['normalize_metadata']
+        for setting in SHARDING_SETTINGS:
+            if setting in data:
+                collection_kwargs[setting] = data[setting]
+        # the whole payload is checked before the collection is created, so a rejected request leaves nothing behind.
+        ingestion = validate_ingestion(data) if data.get('input_files') else None
+        collection_manager.create_collection(collection_name, **collection_kwargs)
+        response = {'collection_name': collection_name}
+        if ingestion is None:
+            return jsonify({'status': 'success', 'data': response}), 201
+        try:
+            job_id = ingestion_queue.submit(collection_name, *ingestion)
+        except Exception:
+            collection_manager.delete_collection(collection_name)
+            raise
+        response['job'] = ingestion_queue.get_job(job_id)
+        return jsonify({'status': 'success', 'data': response}), 202
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f"Value Error: {str(e)}"}), 400
+    except UnexpectedResponse as e:
+        return jsonify({'status': 'error', 'message': f"Unexpected Qdrant Response: {str(e)}"}), 409
+
+@app.route('/collections/<collection_name>', methods=['GET'])
+@limiter.exempt
+@require_api_key
+def get_collection(collection_name):
+    try:
+        return jsonify({'status': 'success', 'data': collection_status(collection_name)})
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Collection {collection_name} does not exist."}), 404
+
+@app.route('/collections/<collection_name>/files', methods=['POST'])
+@limiter.exempt
+@require_api_key
+def add_collection_files(collection_name):
+    """
+    Queue the ingestion of files into an existing collection, returns the job to poll.
+    Expects the same JSON payload as POST /collections, without collection_name.
+    """
+    try:
+        job = submit_ingestion(collection_name, request.get_json() or {})
+        return jsonify({'status': 'success', 'data': job}), 202
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Collection {collection_name} does not exist."}), 404
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f"Value Error: {str(e)}"}), 400
+
+@app.route('/collections/<collection_name>/reindex', methods=['POST'])
+@limiter.exempt
+@require_api_key
+def reindex_collection(collection_name):
+    """
+    Queue a blue/green reindex of a collection, returns the job to poll.
+    the collection keeps serving queries from its current version until the job switches it.
+    Expects an optional JSON payload with the same format as POST /collections/<name>/files,
+    without input_files the new version is built from the stored embeddings of the current files.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        job_id = ingestion_queue.submit(collection_name, data.get('input_files') or [],
+                                        data.get('text_field', 'paragraph_text'), data.get('metadata_fields') or [],
+                                        reindex=True)
+        return jsonify({'status': 'success', 'data': ingestion_queue.get_job(job_id)}), 202
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Collection {collection_name} does not exist."}), 404
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f"Value Error: {str(e)}"}), 400
+
+@app.route('/collections/<collection_name>', methods=['DELETE'])
+@limiter.exempt
+@require_api_key
+def delete_collection(collection_name):
+    if collection_name not in collection_manager.get_collections():
+        return jsonify({'status': 'error', 'message': f"Collection {collection_name} does not exist."}), 404
+    ingestion_queue.cancel_collection_jobs(collection_name)
+    try:
+        collection_manager.delete_collection(collection_name)
+    except UnexpectedResponse as e:
+        return jsonify({'status': 'error', 'message': f"Unexpected Qdrant Response: {str(e)}"}), 409
+    return jsonify({'status': 'success', 'data': {'collection_name': collection_name}})
+
+@app.route('/collection_groups', methods=['GET'])
+@limiter.exempt
+@require_api_key
+def list_collection_groups():
+    return jsonify({'status': 'success', 'data': collection_manager.get_collection_groups()})
+
+@app.route('/collection_groups/<group_name>', methods=['PUT'])
+@limiter.exempt
+@require_api_key
+def set_collection_group(group_name):
+    """
+    Define a group of collections, /qa_chain searches all of them when it gets the group name.
+    Expects a JSON payload with the following format:
+    {
+        "collections": ["ESPN_articles", "team_news"]
+    }
+    """
+    data = request.get_json() or {}
+    collections = data.get('collections')
+    if not isinstance(collections, list) or not all(isinstance(name, str) for name in collections):
+        return jsonify({'status': 'error', 'message': "Value Error: collections should be a list of collection names."}), 400
+    try:
+        collection_manager.set_collection_group(group_name, collections)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f"Value Error: {str(e)}"}), 400
+    return jsonify({'status': 'success', 'data': {'group_name': group_name, 'collections': collections}})
+
+@app.route('/collection_groups/<group_name>', methods=['DELETE'])
+@limiter.exempt
+@require_api_key
+def delete_collection_group(group_name):
+    if group_name not in collection_manager.get_collection_groups():
+        return jsonify({'status': 'error', 'message': f"Group {group_name} does not exist."}), 404
+    collection_manager.delete_collection_group(group_name)
+    return jsonify({'status': 'success', 'data': {'group_name': group_name}})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@limiter.exempt
+@require_api_key
+def get_job(job_id):
+    """Job status and progress: rows_embedded, points_upserted and points_per_second."""
+    try:
+        return jsonify({'status': 'success', 'data': ingestion_queue.get_job(job_id)})
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Job {job_id} does not exist."}), 404
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@limiter.exempt
+@require_api_key
+def cancel_job(job_id):
+    try:
+        return jsonify({'status': 'success', 'data': ingestion_queue.cancel(job_id)})
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Job {job_id} does not exist."}), 404
+
 def limit_user_requests():
     # Check if the request counter exists for the user; if not, initialize it
     if 'user_request_count' not in session:
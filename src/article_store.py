@@ -0,0 +1,89 @@
+import hashlib
+import json
+import threading
+from typing import Dict, List
+
+from src.utils.metrics import metrics
+from src.utils.sqlite_store import SqliteStore, parameter_chunks
+
+# the payload field that references the article of a point in collections with normalized metadata.
+ARTICLE_ID_FIELD = 'article_id'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    article_id INTEGER PRIMARY KEY,
+    metadata TEXT NOT NULL
+);
+"""
+
+
+def article_id(metadata: Dict) -> int:
+    """
+    the id of an article, derived from its metadata so every process (and every snapshot build)
+    gets the same id for the same article without coordinating. 63 bits, a sqlite integer.
+    """
+    content = json.dumps(metadata, sort_keys=True, default=str)
+    return int.from_bytes(hashlib.sha256(content.encode('utf-8')).digest()[:8], 'big') >> 1
+
+
+class ArticleStore(SqliteStore):
+    """
+    The metadata of the articles (site, country, title, author, publish date, ...) stored once
+    per article, for collections whose points only carry the paragraph and its article id.
+    the table is loaded into an in-process cache (see load), an article that was added by
+    another process after the load is read from SQLite on its first lookup and cached.
+    stored in SQLite in WAL mode, so the ingest jobs and the gunicorn workers can share it.
+    """
+
+    def __init__(self, db_path, busy_timeout=30):
+        super().__init__(db_path, busy_timeout)
+        self._lock = threading.Lock()
+        self._cache: Dict[int, Dict] = {}
+        self._loaded = False
+        self._connection().executescript(_SCHEMA)
+
+    def load(self):
+        "read the whole table into the cache, only the first call reads it."
+        if self._loaded:
+            return
+        articles = {row[0]: json.loads(row[1]) for row in self._connection().execute("SELECT article_id, metadata FROM articles")}
+        with self._lock:
+            self._cache.update(articles)
+            self._loaded = True
+
+    def put_many(self, metadata: List[Dict]) -> List[int]:
+        "store the articles that are not stored yet, returns the article id of every metadata dict."
+        article_ids = [article_id(meta) for meta in metadata]
+        with self._lock:
+            new_articles = {key: meta for key, meta in zip(article_ids, metadata) if key not in self._cache}
+        if new_articles:
+            with self._write() as conn:
+                conn.executemany("INSERT OR IGNORE INTO articles (article_id, metadata) VALUES (?, ?)",
+                                 [(key, json.dumps(meta, default=str)) for key, meta in new_articles.items()])
+            with self._lock:
+                self._cache.update(new_articles)
+        return article_ids
+
+    def get_many(self, article_ids: List[int]) -> List[Dict]:
+        "the metadata of every article id, an empty dict for unknown ids."
+        with self._lock:
+            missing = list({key for key in article_ids if key not in self._cache})
+        if missing:
+            metrics.increment("article_store.misses", len(missing))
+            conn = self._connection()
+            for chunk in parameter_chunks(missing):
+                rows = conn.execute(f"SELECT article_id, metadata FROM articles "
+                                    f"WHERE article_id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+                with self._lock:
+                    self._cache.update({row[0]: json.loads(row[1]) for row in rows})
+        with self._lock:
+            return [self._cache.get(key, {}) for key in article_ids]
+
+    def join(self, payloads: List[Dict]) -> List[Dict]:
+        "the payloads with their article id replaced by the article's metadata."
+        articles = self.get_many([payload[ARTICLE_ID_FIELD] for payload in payloads])
+        return [{**{key: value for key, value in payload.items() if key != ARTICLE_ID_FIELD}, **article}
+                for payload, article in zip(payloads, articles)]
+
+    def all_articles(self) -> List[Dict]:
+        return [json.loads(row[0]) for row in self._connection().execute("SELECT metadata FROM articles ORDER BY article_id")]
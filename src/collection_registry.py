@@ -0,0 +1,518 @@
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from qdrant_client import models
+
+from src.article_store import ARTICLE_ID_FIELD
+from src.utils.logger import get_logger
+from src.utils.sqlite_store import SqliteStore
+
+logger = get_logger()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    dense_model TEXT,
+    sparse_model TEXT,
+    points_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    late_interaction_model TEXT,
+    sparse_top_k INTEGER,
+    sparse_min_weight REAL,
+    physical_name TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    normalized_metadata INTEGER NOT NULL DEFAULT 0,
+    shard_number INTEGER,
+    replication_factor INTEGER,
+    write_consistency_factor INTEGER,
+    shard_key_field TEXT,
+    sparse_on_disk INTEGER,
+    idf_modifier INTEGER
+);
+CREATE TABLE IF NOT EXISTS collection_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection_name TEXT NOT NULL REFERENCES collections(name) ON DELETE CASCADE,
+    file_name TEXT NOT NULL,
+    checksum TEXT,
+    rows_count INTEGER,
+    points_count INTEGER,
+    ingest_seconds REAL,
+    dense_model TEXT,
+    sparse_model TEXT,
+    ingested_at REAL NOT NULL,
+    embedding_key TEXT
+);
+CREATE INDEX IF NOT EXISTS collection_files_by_collection ON collection_files(collection_name);
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    job_id TEXT PRIMARY KEY,
+    collection_name TEXT NOT NULL,
+    input_files TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    rows_embedded INTEGER NOT NULL DEFAULT 0,
+    points_upserted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    kind TEXT NOT NULL DEFAULT 'ingest'
+);
+CREATE INDEX IF NOT EXISTS ingest_jobs_by_collection ON ingest_jobs(collection_name);
+CREATE TABLE IF NOT EXISTS collection_groups (
+    group_name TEXT NOT NULL,
+    collection_name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (group_name, collection_name)
+);
+"""
+
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+# the physical Qdrant collections behind an alias are named <collection>__v<version>.
+VERSIONED_COLLECTION_NAME = re.compile(r'(?P<name>.+)__v(?P<version>\d+)')
+
+
+def physical_collection_name(collection_name: str, version: int) -> str:
+    return f"{collection_name}__v{version}"
+
+
+def _optional_flag(value) -> int:
+    "a boolean column that is NULL when the value is unknown."
+    return None if value is None else int(value)
+
+# columns that were added after the table was first created, added to older registries on open.
+_ADDED_COLUMNS = {
+    'collections': {'late_interaction_model': 'TEXT', 'sparse_top_k': 'INTEGER', 'sparse_min_weight': 'REAL',
+                    'physical_name': 'TEXT', 'version': 'INTEGER NOT NULL DEFAULT 0',
+                    'normalized_metadata': 'INTEGER NOT NULL DEFAULT 0', 'shard_number': 'INTEGER',
+                    'replication_factor': 'INTEGER', 'write_consistency_factor': 'INTEGER', 'shard_key_field': 'TEXT',
+                    'sparse_on_disk': 'INTEGER', 'idf_modifier': 'INTEGER'},
+    'collection_files': {'embedding_key': 'TEXT'},
+    'ingest_jobs': {'kind': "TEXT NOT NULL DEFAULT 'ingest'"},
+}
+
+
+class CollectionRegistry(SqliteStore):
+    """
+    Transactional registry of the Qdrant collections and the files ingested into them,
+    stored in SQLite in WAL mode so gunicorn workers and ingest jobs can share it:
+    readers never block, and writers are serialized by BEGIN IMMEDIATE transactions
+    instead of rewriting a whole file.
+    """
+
+    def __init__(self, db_path, busy_timeout=30):
+        super().__init__(db_path, busy_timeout)
+        self._connection().executescript(_SCHEMA)
+        self._add_missing_columns()
+
+    def _configure_connection(self, conn: sqlite3.Connection):
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+
+    def _add_missing_columns(self):
+        with self._write() as conn:
+            for table, columns in _ADDED_COLUMNS.items():
+                existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for column, column_type in columns.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def add_collection(self, collection_name: str, dense_model: str = None, sparse_model: str = None,
+                       late_interaction_model: str = None, sparse_top_k: int = None, sparse_min_weight: float = None,
+                       physical_name: str = None, version: int = 0, normalized_metadata: bool = False,
+                       shard_number: int = None, replication_factor: int = None, write_consistency_factor: int = None,
+                       shard_key_field: str = None, sparse_on_disk: bool = None, idf_modifier: bool = None):
+        """Register a new collection, raises ValueError if it's already registered.
+        sparse_top_k and sparse_min_weight are the pruning of the sparse vectors of its documents.
+        physical_name is the versioned Qdrant collection the collection name is an alias of,
+        None for collections that were created before aliases were used.
+        normalized_metadata: its points reference their article in the article store instead of
+        carrying the metadata.
+        shard_number, replication_factor, write_consistency_factor, shard_key_field: the sharding of
+        its Qdrant collections, so every new version is sharded the same way.
+        sparse_on_disk, idf_modifier: the sparse index of its Qdrant collections, None when unknown
+        (collections registered before they were recorded)."""
+        try:
+            with self._write() as conn:
+                conn.execute(
+                    """INSERT INTO collections (name, dense_model, sparse_model, late_interaction_model, sparse_top_k,
+                                              sparse_min_weight, physical_name, version, normalized_metadata, shard_number,
+                                              replication_factor, write_consistency_factor, shard_key_field,
+                                              sparse_on_disk, idf_modifier, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (collection_name, dense_model, sparse_model, late_interaction_model,
+                     sparse_top_k, sparse_min_weight, physical_name, version, int(normalized_metadata), shard_number,
+                     replication_factor, write_consistency_factor, shard_key_field, _optional_flag(sparse_on_disk),
+                     _optional_flag(idf_modifier), time.time()))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Error: collection {collection_name} is already registered.")
+
+    def remove_collection(self, collection_name: str):
+        """Remove a collection and its files from the registry, and from the groups it's in."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            conn.execute("DELETE FROM collection_groups WHERE collection_name = ?", (collection_name,))
+
+    def record_ingest(
+        self,
+        collection_name: str,
+        file_name: str,
+        checksum: str = None,
+        rows_count: int = None,
+        points_count: int = None,
+        ingest_seconds: float = None,
+        dense_model: str = None,
+        sparse_model: str = None,
+        embedding_key: str = None
+    ):
+        """Record a file that was ingested into a collection and add its points to the collection count.
+        embedding_key is the key of the file's vectors in the embedding store."""
+        with self._write() as conn:
+            cursor = conn.execute(
+                "UPDATE collections SET points_count = points_count + ? WHERE name = ?",
+                (points_count or 0, collection_name))
+            if cursor.rowcount == 0:
+                raise KeyError(collection_name)
+            conn.execute(
+                """INSERT INTO collection_files (collection_name, file_name, checksum, rows_count, points_count,
+                                                 ingest_seconds, dense_model, sparse_model, embedding_key, ingested_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (collection_name, file_name, checksum, rows_count, points_count,
+                 ingest_seconds, dense_model, sparse_model, embedding_key, time.time()))
+
+    def collection_exists(self, collection_name: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM collections WHERE name = ?", (collection_name,)).fetchone()
+        return row is not None
+
+    def get_collections(self) -> List[str]:
+        """Retrieve all collection names."""
+        rows = self._connection().execute("SELECT name FROM collections ORDER BY created_at, name")
+        return [row['name'] for row in rows]
+
+    def set_group(self, group_name: str, collection_names: List[str]):
+        """
+        Define (or redefine) a named group of collections that can be searched together,
+        raises ValueError if a collection isn't registered or the name is a collection's name.
+        """
+        if not collection_names:
+            raise ValueError(f"Error: the group {group_name} should have at least one collection.")
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM collections WHERE name = ?", (group_name,)).fetchone() is not None:
+                raise ValueError(f"Error: {group_name} is the name of a collection.")
+            registered = {row['name'] for row in conn.execute("SELECT name FROM collections")}
+            missing = [name for name in collection_names if name not in registered]
+            if missing:
+                raise ValueError(f"Error: the collections {missing} are not registered.")
+            conn.execute("DELETE FROM collection_groups WHERE group_name = ?", (group_name,))
+            conn.executemany("INSERT INTO collection_groups (group_name, collection_name, position) VALUES (?, ?, ?)",
+                             [(group_name, name, position) for position, name in enumerate(dict.fromkeys(collection_names))])
+
+    def remove_group(self, group_name: str):
+        with self._write() as conn:
+            conn.execute("DELETE FROM collection_groups WHERE group_name = ?", (group_name,))
+
+    def get_group(self, group_name: str) -> List[str]:
+        """The collections of a group, raises KeyError if there's no such group."""
+        rows = self._connection().execute(
+            "SELECT collection_name FROM collection_groups WHERE group_name = ? ORDER BY position", (group_name,)).fetchall()
+        if not rows:
+            raise KeyError(group_name)
+        return [row['collection_name'] for row in rows]
+
+    def get_groups(self) -> Dict[str, List[str]]:
+        groups = {}
+        for row in self._connection().execute(
+                "SELECT group_name, collection_name FROM collection_groups ORDER BY group_name, position"):
+            groups.setdefault(row['group_name'], []).append(row['collection_name'])
+        return groups
+
+    def get_collection(self, collection_name: str) -> Dict:
+        """Get the registry record of a collection, raises KeyError if it's not registered."""
+        row = self._connection().execute(
+            "SELECT * FROM collections WHERE name = ?", (collection_name,)).fetchone()
+        if row is None:
+            raise KeyError(collection_name)
+        return dict(row)
+
+    def get_collection_files(self, collection_name: str) -> List[str]:
+        """Get input files names for a specific collection, in ingestion order."""
+        self.get_collection(collection_name)
+        rows = self._connection().execute(
+            "SELECT file_name FROM collection_files WHERE collection_name = ? ORDER BY id", (collection_name,))
+        return [row['file_name'] for row in rows]
+
+    def get_ingest_history(self, collection_name: str) -> List[Dict]:
+        """Get the full ingest records (checksums, counts, timings, models) of a collection."""
+        rows = self._connection().execute(
+            "SELECT * FROM collection_files WHERE collection_name = ? ORDER BY id", (collection_name,))
+        return [dict(row) for row in rows]
+
+    def restore_collection(self, collection_name: str, collection_record: Dict, files: List[Dict],
+                           physical_name: str = None, version: int = 0):
+        """
+        Register a collection that was restored from a snapshot, with the collection record and
+        the ingest history it was built with. an existing registration of the name is replaced.
+        """
+        with self._write() as conn:
+            conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            conn.execute(
+                """INSERT INTO collections (name, dense_model, sparse_model, points_count, late_interaction_model,
+                                          sparse_top_k, sparse_min_weight, physical_name, version, normalized_metadata,
+                                          shard_number, replication_factor, write_consistency_factor, shard_key_field,
+                                          sparse_on_disk, idf_modifier, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (collection_name, collection_record['dense_model'], collection_record['sparse_model'],
+                 collection_record['points_count'], collection_record.get('late_interaction_model'),
+                 collection_record.get('sparse_top_k'), collection_record.get('sparse_min_weight'),
+                 physical_name, version, int(collection_record.get('normalized_metadata') or 0),
+                 collection_record.get('shard_number'), collection_record.get('replication_factor'),
+                 collection_record.get('write_consistency_factor'), collection_record.get('shard_key_field'),
+                 _optional_flag(collection_record.get('sparse_on_disk')),
+                 _optional_flag(collection_record.get('idf_modifier')), time.time()))
+            self._insert_files(conn, collection_name, files)
+
+    def switch_collection_version(self, collection_name: str, physical_name: str, version: int, files: List[Dict],
+                                  sparse_on_disk: bool = None, idf_modifier: bool = None):
+        """
+        Point a collection to a new physical version after a reindex, its ingest history, points count
+        and sparse index settings are replaced by the ones of the new version.
+        """
+        with self._write() as conn:
+            cursor = conn.execute(
+                """UPDATE collections SET physical_name = ?, version = ?, points_count = ?,
+                       sparse_on_disk = COALESCE(?, sparse_on_disk), idf_modifier = COALESCE(?, idf_modifier)
+                   WHERE name = ?""",
+                (physical_name, version, sum(file['points_count'] or 0 for file in files),
+                 _optional_flag(sparse_on_disk), _optional_flag(idf_modifier), collection_name))
+            if cursor.rowcount == 0:
+                raise KeyError(collection_name)
+            conn.execute("DELETE FROM collection_files WHERE collection_name = ?", (collection_name,))
+            self._insert_files(conn, collection_name, files)
+
+    @staticmethod
+    def _insert_files(conn: sqlite3.Connection, collection_name: str, files: List[Dict]):
+        conn.executemany(
+            """INSERT INTO collection_files (collection_name, file_name, checksum, rows_count, points_count,
+                                             ingest_seconds, dense_model, sparse_model, embedding_key, ingested_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [(collection_name, file['file_name'], file['checksum'], file['rows_count'], file['points_count'],
+              file['ingest_seconds'], file['dense_model'], file['sparse_model'], file.get('embedding_key'),
+              file.get('ingested_at') or time.time()) for file in files])
+
+    def import_json(self, json_path):
+        """
+        One time migration from the old qdrant_collections.json file,
+        only runs when the registry is still empty.
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM collections LIMIT 1").fetchone() is not None:
+                return
+            with open(json_path, 'r') as f:
+                collections_input_files = json.load(f)
+            now = time.time()
+            for collection_name, files_names in collections_input_files.items():
+                conn.execute("INSERT INTO collections (name, created_at) VALUES (?, ?)", (collection_name, now))
+                conn.executemany(
+                    "INSERT INTO collection_files (collection_name, file_name, ingested_at) VALUES (?, ?, ?)",
+                    [(collection_name, file_name, now) for file_name in files_names])
+        logger.info(f"Imported {len(collections_input_files)} collections from {json_path.name} to the registry.")
+
+    @staticmethod
+    def _custom_shard_key_field(qdrant_client, physical_name: str):
+        """the payload field the points of a custom sharded collection are sharded by: the field
+        whose value is the shard key of a point of one of its shard keys. None if there's no such point."""
+        cluster_info = qdrant_client.http.distributed_api.collection_cluster_info(physical_name).result
+        shard_keys = {shard.shard_key for shard in cluster_info.local_shards + cluster_info.remote_shards
+                      if shard.shard_key is not None}
+        for shard_key in shard_keys:
+            points, _ = qdrant_client.scroll(physical_name, limit=1, with_payload=True, with_vectors=False,
+                                             shard_key_selector=shard_key)
+            for point in points:
+                for field, value in (point.payload or {}).items():
+                    if value == shard_key or (isinstance(shard_key, str) and str(value) == shard_key):
+                        return field
+        return None
+
+    def _describe_qdrant_collection(self, qdrant_client, qdrant_name: str, vector_models: Dict[str, str],
+                                    late_interaction_model: str = None) -> Dict:
+        "the registry columns of a Qdrant collection that can be recovered from Qdrant itself."
+        info = qdrant_client.get_collection(qdrant_name)
+        params = info.config.params
+        vectors = params.vectors if isinstance(params.vectors, dict) else {}
+        dense_names = [name for name, vector_params in vectors.items() if vector_params.multivector_config is None]
+        multivector_names = [name for name, vector_params in vectors.items() if vector_params.multivector_config is not None]
+        sparse_vectors = params.sparse_vectors or {}
+        sparse_names = list(sparse_vectors.keys())
+        sparse_params = next(iter(sparse_vectors.values()), None)
+
+        points, _ = qdrant_client.scroll(qdrant_name, limit=1, with_payload=True, with_vectors=False)
+        payload = (points[0].payload or {}) if points else {}
+        shard_key_field = None
+        if params.sharding_method == models.ShardingMethod.CUSTOM:
+            try:
+                shard_key_field = self._custom_shard_key_field(qdrant_client, qdrant_name)
+            except Exception as e:
+                logger.warning(f"Couldn't find the shard key field of {qdrant_name}: {e}")
+
+        return {
+            # the vectors of an unknown model (e.g. one the config no longer uses) keep their field name.
+            'dense_model': ','.join(vector_models.get(name, name) for name in dense_names) or None,
+            'sparse_model': ','.join(vector_models.get(name, name) for name in sparse_names) or None,
+            'late_interaction_model': (late_interaction_model or ','.join(multivector_names)) if multivector_names else None,
+            'points_count': info.points_count or 0,
+            'normalized_metadata': int(ARTICLE_ID_FIELD in payload),
+            'shard_number': params.shard_number,
+            'replication_factor': params.replication_factor,
+            'write_consistency_factor': params.write_consistency_factor,
+            'shard_key_field': shard_key_field,
+            'sparse_on_disk': _optional_flag(sparse_params.index.on_disk if sparse_params and sparse_params.index else None),
+            'idf_modifier': int(sparse_params.modifier == models.Modifier.IDF) if sparse_params else None,
+        }
+
+    def rebuild_from_qdrant(self, qdrant_client, vector_models: Dict[str, str] = None, late_interaction_model: str = None):
+        """
+        Sync the registry with the collections that actually exist in Qdrant:
+        missing collections are registered with what Qdrant knows of them (their models, points
+        count, late interaction vectors, normalized metadata, sharding and sparse index), collections that no
+        longer exist are removed, and the files history is kept. the registered collections keep
+        their settings, only the ones they are missing are filled in.
+        versioned collections are registered under their alias, versions without an
+        alias (old or unfinished reindexes) are skipped.
+
+        Parameters
+        ----------
+        vector_models : the model name of every known vector field name, e.g. {'fast-bge-small-en': 'BAAI/bge-small-en'}.
+        late_interaction_model : the model of the multivector (late interaction) fields.
+        """
+        vector_models = vector_models or {}
+        aliases = {alias.collection_name: alias.alias_name for alias in qdrant_client.get_aliases().aliases}
+        qdrant_collections = {}
+        for description in qdrant_client.get_collections().collections:
+            collection_name, physical_name, version = description.name, None, 0
+            versioned = VERSIONED_COLLECTION_NAME.fullmatch(description.name)
+            if description.name in aliases:
+                collection_name, physical_name = aliases[description.name], description.name
+                version = int(versioned.group('version')) if versioned else 0
+            elif versioned:
+                continue
+            qdrant_collections[collection_name] = {
+                **self._describe_qdrant_collection(qdrant_client, description.name, vector_models, late_interaction_model),
+                'physical_name': physical_name,
+                'version': version,
+            }
+
+        with self._write() as conn:
+            registered = {row['name'] for row in conn.execute("SELECT name FROM collections")}
+            for collection_name in registered - qdrant_collections.keys():
+                conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            now = time.time()
+            for collection_name, collection in qdrant_collections.items():
+                conn.execute(
+                    """INSERT INTO collections (name, dense_model, sparse_model, late_interaction_model, points_count,
+                                              physical_name, version, normalized_metadata, shard_number,
+                                              replication_factor, write_consistency_factor, shard_key_field,
+                                              sparse_on_disk, idf_modifier, created_at)
+                       VALUES (:name, :dense_model, :sparse_model, :late_interaction_model, :points_count,
+                               :physical_name, :version, :normalized_metadata, :shard_number,
+                               :replication_factor, :write_consistency_factor, :shard_key_field,
+                               :sparse_on_disk, :idf_modifier, :created_at)
+                       ON CONFLICT(name) DO UPDATE SET points_count = excluded.points_count,
+                           physical_name = excluded.physical_name, version = excluded.version,
+                           dense_model = COALESCE(collections.dense_model, excluded.dense_model),
+                           sparse_model = COALESCE(collections.sparse_model, excluded.sparse_model),
+                           late_interaction_model = COALESCE(collections.late_interaction_model, excluded.late_interaction_model),
+                           normalized_metadata = MAX(collections.normalized_metadata, excluded.normalized_metadata),
+                           shard_number = COALESCE(collections.shard_number, excluded.shard_number),
+                           replication_factor = COALESCE(collections.replication_factor, excluded.replication_factor),
+                           write_consistency_factor = COALESCE(collections.write_consistency_factor,
+                                                               excluded.write_consistency_factor),
+                           shard_key_field = COALESCE(collections.shard_key_field, excluded.shard_key_field),
+                           sparse_on_disk = COALESCE(collections.sparse_on_disk, excluded.sparse_on_disk),
+                           idf_modifier = COALESCE(collections.idf_modifier, excluded.idf_modifier)""",
+                    {**collection, 'name': collection_name, 'created_at': now})
+        logger.info(f"Rebuilt the registry from Qdrant, {len(qdrant_collections)} collections found.")
+
+    def create_job(self, job_id: str, collection_name: str, input_files: List[str], kind: str = 'ingest'):
+        """Register a new queued job, kind is 'ingest' (add files) or 'reindex' (build a new version).
+        a reindex doesn't run next to other jobs of the collection, the points they add to the live version
+        would be lost when the alias switches to the new one, so a conflicting job raises ValueError."""
+        with self._write() as conn:
+            active_kinds = {row['kind'] for row in conn.execute(
+                f"SELECT kind FROM ingest_jobs WHERE collection_name = ? AND status IN {JOB_ACTIVE_STATUSES}",
+                (collection_name,))}
+            if 'reindex' in active_kinds:
+                raise ValueError(f"{collection_name} is being reindexed, retry when its reindex job is done.")
+            if kind == 'reindex' and active_kinds:
+                raise ValueError(f"{collection_name} has active ingest jobs, retry the reindex when they are done.")
+            conn.execute(
+                "INSERT INTO ingest_jobs (job_id, collection_name, input_files, status, kind, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, collection_name, json.dumps(input_files), 'queued', kind, time.time()))
+
+    def set_job_status(self, job_id: str, status: str, error: str = None):
+        """Move a job to running or to one of the final statuses (succeeded, failed, cancelled)."""
+        now = time.time()
+        with self._write() as conn:
+            if status == 'running':
+                conn.execute("UPDATE ingest_jobs SET status = ?, started_at = ? WHERE job_id = ?", (status, now, job_id))
+            else:
+                conn.execute("UPDATE ingest_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                             (status, error, now, job_id))
+
+    def add_job_progress(self, job_id: str, rows_embedded: int, points_upserted: int):
+        with self._write() as conn:
+            conn.execute(
+                """UPDATE ingest_jobs SET rows_embedded = rows_embedded + ?, points_upserted = points_upserted + ?
+                   WHERE job_id = ?""",
+                (rows_embedded, points_upserted, job_id))
+
+    def request_job_cancel(self, job_id: str) -> bool:
+        """Flag an active job for cancellation, returns False if the job already finished."""
+        self.get_job(job_id)
+        with self._write() as conn:
+            cursor = conn.execute(
+                f"UPDATE ingest_jobs SET cancel_requested = 1 WHERE job_id = ? AND status IN {JOB_ACTIVE_STATUSES}",
+                (job_id,))
+        return cursor.rowcount > 0
+
+    def is_job_cancel_requested(self, job_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT cancel_requested FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row['cancel_requested'])
+
+    def get_job(self, job_id: str) -> Dict:
+        """Get a job record with its throughput in points per second, raises KeyError if it doesn't exist."""
+        row = self._connection().execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return self._job_dict(row)
+
+    def get_jobs(self, collection_name: str = None, active_only: bool = False) -> List[Dict]:
+        query = "SELECT * FROM ingest_jobs WHERE 1 = 1"
+        params = []
+        if collection_name is not None:
+            query += " AND collection_name = ?"
+            params.append(collection_name)
+        if active_only:
+            query += f" AND status IN {JOB_ACTIVE_STATUSES}"
+        rows = self._connection().execute(query + " ORDER BY created_at", params)
+        return [self._job_dict(row) for row in rows]
+
+    @staticmethod
+    def _job_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['input_files'] = json.loads(job['input_files'])
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        throughput = None
+        if job['started_at'] is not None:
+            elapsed = (job['finished_at'] or time.time()) - job['started_at']
+            throughput = job['points_upserted'] / elapsed if elapsed > 0 else 0.0
+        job['points_per_second'] = throughput
+        return job
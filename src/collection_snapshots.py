@@ -0,0 +1,205 @@
+"""
+Build a collection once and ship it as a Qdrant snapshot, instead of embedding and
+ingesting the corpus in every environment.
+
+build: ingest the corpus into a throwaway Qdrant instance (QDRANT_BUILD_URL), export a
+    snapshot of the collection and write it to the snapshots directory together with
+    its registry metadata (<name>.snapshot.json), and the articles of a collection with
+    normalized metadata.
+restore: upload the snapshot to the serving Qdrant as a new version of the collection,
+    switch the collection alias to it and register it with the metadata it was built with,
+    its articles are added to the serving article store.
+
+Qdrant's embedded local mode has no snapshot API, so the build needs a server, e.g.
+    docker run --rm -p 6343:6333 qdrant/qdrant
+
+usage (from the repo root):
+    QDRANT_BUILD_URL=http://localhost:6343 python -m src.collection_snapshots build ESPN_articles \
+        data/espn/espn_stories.csv --metadata-fields title content_publish_date
+    python -m src.collection_snapshots restore snapshots/ESPN_articles.snapshot.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+from qdrant_client import QdrantClient
+
+from src.collection_registry import CollectionRegistry, physical_collection_name
+from src.model_store import model_version
+from src.article_store import ArticleStore
+from src.qdrant_db import (QdrantCollectionManager, client_url, registry_path, article_store_path, repo_root, config,
+                           dense_model, sparse_model)
+from src.utils.logger import get_logger
+from src.utils.utility_functions import file_checksum
+
+logger = get_logger()
+
+snapshots_dir = Path(os.getenv("SNAPSHOTS_DIR", repo_root / config['snapshots']['dir']))
+build_url = os.getenv("QDRANT_BUILD_URL", config['snapshots']['build_url'])
+
+
+def _download_snapshot(qdrant_url: str, collection_name: str, snapshot_name: str, output_path: Path):
+    url = f"{qdrant_url.rstrip('/')}/collections/{collection_name}/snapshots/{snapshot_name}"
+    with httpx.stream('GET', url, timeout=None) as response:
+        response.raise_for_status()
+        with open(output_path, 'wb') as f:
+            for chunk in response.iter_bytes(1024 * 1024):
+                f.write(chunk)
+
+
+def _upload_snapshot(qdrant_url: str, collection_name: str, snapshot_path: Path, checksum: str):
+    url = f"{qdrant_url.rstrip('/')}/collections/{collection_name}/snapshots/upload"
+    with open(snapshot_path, 'rb') as f:
+        response = httpx.post(url, params={'priority': 'snapshot', 'checksum': checksum, 'wait': 'true'},
+                              files={'snapshot': (snapshot_path.name, f)}, timeout=None)
+    response.raise_for_status()
+
+
+def build_snapshot(
+    collection_name: str,
+    input_files: List[str],
+    text_field: str,
+    metadata_fields: List[str],
+    late_interaction: bool = False,
+    normalize_metadata: bool = False,
+    qdrant_url: str = build_url,
+    output_dir: Path = snapshots_dir
+) -> Path:
+    """
+    Ingest the input files into a new collection on the build Qdrant, export its snapshot
+    and delete the collection from the build Qdrant.
+
+    Returns
+    -------
+    metadata_path : the path of the metadata file that restore_snapshot expects.
+    """
+    build_client = QdrantClient(qdrant_url)
+    if build_client.collection_exists(collection_name):
+        raise ValueError(f"Error: {collection_name} already exists on the build Qdrant {qdrant_url}.")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    snapshot_path = output_dir / f"{collection_name}.snapshot"
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as build_dir:
+        build_articles_path = Path(build_dir) / "articles.db"
+        manager = QdrantCollectionManager(build_client, Path(build_dir) / "registry.db", build_articles_path,
+                                          import_legacy_collections=False)
+        manager.create_collection(collection_name, late_interaction=late_interaction,
+                                  normalize_metadata=normalize_metadata)
+        try:
+            manager.add_data_to_collection(collection_name, input_files, text_field, metadata_fields)
+            collection_info = manager.get_collection_info(collection_name)
+            articles = ArticleStore(build_articles_path).all_articles()
+
+            physical_name = collection_info['physical_name']
+            snapshot = build_client.create_snapshot(physical_name, wait=True)
+            _download_snapshot(qdrant_url, physical_name, snapshot.name, snapshot_path)
+        finally:
+            manager.delete_collection(collection_name)
+
+    files = collection_info.pop('files')
+    metadata = {
+        'collection_name': collection_name,
+        'snapshot_file': snapshot_path.name,
+        'snapshot_sha256': file_checksum(snapshot_path),
+        'model_versions': {'dense_model': model_version(dense_model), 'sparse_model': model_version(sparse_model)},
+        'collection': collection_info,
+        'files': files,
+        'articles': articles,
+        'build_seconds': time.perf_counter() - start_time,
+        'built_at': time.time(),
+    }
+    metadata_path = output_dir / f"{collection_name}.snapshot.json"
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    logger.info(f"Built the snapshot of {collection_name} in {metadata['build_seconds']:.1f} seconds.")
+    return metadata_path
+
+
+def restore_snapshot(metadata_path, collection_name: str = None, qdrant_url: str = client_url,
+                     collection_registry_path=registry_path, articles_path=article_store_path):
+    """
+    Restore a snapshot built by build_snapshot into the serving Qdrant and register it.
+    the snapshot is restored as a new physical version and the collection alias is switched
+    to it, so an existing collection with the same name is replaced without downtime.
+
+    Parameters
+    ----------
+    metadata_path : the <name>.snapshot.json file, the snapshot file has to be next to it.
+    collection_name : restore under another name, the default is the name it was built with.
+    """
+    metadata_path = Path(metadata_path)
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    collection_name = collection_name or metadata['collection_name']
+
+    collection_record = metadata['collection']
+    if (collection_record['dense_model'], collection_record['sparse_model']) != (dense_model, sparse_model):
+        raise ValueError(f"Error: the snapshot was built with {collection_record['dense_model']} and "
+                         f"{collection_record['sparse_model']}, but the service embeds queries with "
+                         f"{dense_model} and {sparse_model}.")
+    if metadata['model_versions'] != {'dense_model': model_version(dense_model), 'sparse_model': model_version(sparse_model)}:
+        logger.warning(f"The snapshot of {collection_name} was built with other model files {metadata['model_versions']}.")
+
+    snapshot_path = metadata_path.parent / metadata['snapshot_file']
+    if file_checksum(snapshot_path) != metadata['snapshot_sha256']:
+        raise ValueError(f"Error: {snapshot_path} doesn't match the checksum in {metadata_path.name}.")
+
+    start_time = time.perf_counter()
+    # the article ids are derived from the articles, so the restored points reference the same ids.
+    ArticleStore(articles_path).put_many(metadata.get('articles', []))
+    qdrant_client = QdrantClient(qdrant_url)
+    manager = QdrantCollectionManager(qdrant_client, collection_registry_path, articles_path)
+    version = manager.next_version(collection_name)
+    physical_name = physical_collection_name(collection_name, version)
+    try:
+        _upload_snapshot(qdrant_url, physical_name, snapshot_path, metadata['snapshot_sha256'])
+        manager.switch_alias(collection_name, physical_name)
+    except Exception:
+        # the version isn't registered yet, so garbage_collect_versions would never delete it.
+        if qdrant_client.collection_exists(physical_name):
+            qdrant_client.delete_collection(physical_name)
+        raise
+    CollectionRegistry(collection_registry_path).restore_collection(
+        collection_name, collection_record, metadata['files'], physical_name, version)
+    manager.garbage_collect_versions(collection_name)
+    logger.info(f"Restored {collection_name} in {time.perf_counter() - start_time:.1f} seconds.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and restore collection snapshots.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="build a collection on the build Qdrant and export its snapshot.")
+    build_parser.add_argument('collection_name')
+    build_parser.add_argument('input_files', nargs='+')
+    build_parser.add_argument('--text-field', default='paragraph_text')
+    build_parser.add_argument('--metadata-fields', nargs='*', default=[])
+    build_parser.add_argument('--late-interaction', action='store_true')
+    build_parser.add_argument('--normalize-metadata', action='store_true',
+                              help="store the metadata once per article instead of in every point.")
+    build_parser.add_argument('--output-dir', default=snapshots_dir)
+
+    restore_parser = subparsers.add_parser('restore', help="restore a snapshot into the serving Qdrant.")
+    restore_parser.add_argument('metadata_file')
+    restore_parser.add_argument('--collection-name', default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        build_snapshot(args.collection_name, args.input_files, args.text_field, args.metadata_fields,
+                       late_interaction=args.late_interaction, normalize_metadata=args.normalize_metadata,
+                       output_dir=args.output_dir)
+    else:
+        restore_snapshot(args.metadata_file, args.collection_name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+from typing import Dict, List, Tuple
+import threading
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import models
+from fastembed import TextEmbedding, SparseTextEmbedding, LateInteractionTextEmbedding
+
+from src.model_store import fastembed_kwargs
+from src.utils.metrics import metrics
+
+LATE_INTERACTION_VECTOR_NAME = "late-interaction"
+
+
+class EmbeddingModels:
+    """
+    The fastembed models of a collection, loaded lazily and shared between all
+    instances in the process. Computes the dense, sparse and (optionally)
+    late interaction vectors of documents and queries in batches.
+    """
+    _models: Dict[Tuple[type, str], object] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, dense_model: str, sparse_model: str, late_interaction_model: str = None):
+        self.dense_model = dense_model
+        self.sparse_model = sparse_model
+        self.late_interaction_model = late_interaction_model
+
+    @classmethod
+    def _get_model(cls, model_class: type, model_name: str):
+        key = (model_class, model_name)
+        with cls._lock:
+            if key not in cls._models:
+                cls._models[key] = model_class(model_name=model_name, **fastembed_kwargs())
+            return cls._models[key]
+
+    @staticmethod
+    def _to_sparse_vector(embedding, top_k: int = None, min_weight: float = None) -> models.SparseVector:
+        indices, values = prune_sparse_vector(embedding.indices, embedding.values, top_k, min_weight)
+        return models.SparseVector(indices=indices.tolist(), values=values.tolist())
+
+    def embed_documents(self, documents: List[str], batch_size: int = 32,
+                        vectors=('dense', 'sparse', 'late_interaction')) -> Dict[str, list]:
+        """
+        vectors: the vector types to compute, e.g. only late_interaction when the
+            dense and sparse vectors are read from the embedding store.
+
+        Returns
+        -------
+        embeddings : Dict
+            contains the keys dense (list of float lists), sparse (list of unpruned SparseVector)
+            and late_interaction (list of per token float lists), if the collection has a late interaction model.
+        """
+        start_time = time.perf_counter()
+        embeddings = {}
+        if 'dense' in vectors:
+            dense = self._get_model(TextEmbedding, self.dense_model).embed(documents, batch_size=batch_size)
+            embeddings['dense'] = [vector.tolist() for vector in dense]
+        if 'sparse' in vectors:
+            sparse = self._get_model(SparseTextEmbedding, self.sparse_model).embed(documents, batch_size=batch_size)
+            embeddings['sparse'] = [self._to_sparse_vector(vector) for vector in sparse]
+        if 'late_interaction' in vectors and self.late_interaction_model is not None:
+            late_interaction = self._get_model(LateInteractionTextEmbedding, self.late_interaction_model).embed(
+                documents, batch_size=batch_size)
+            embeddings['late_interaction'] = [vector.tolist() for vector in late_interaction]
+        metrics.observe("embedding.documents", time.perf_counter() - start_time)
+        return embeddings
+
+    def embed_query(self, query: str, vectors=('dense', 'sparse', 'late_interaction'),
+                    sparse_top_k: int = None, sparse_min_weight: float = None) -> Dict[str, object]:
+        """
+        the same as embed_documents, for a single query using the query embedding of each model.
+        vectors: the vector types to compute, so a single vector search doesn't pay for the others.
+        """
+        start_time = time.perf_counter()
+        embeddings = {}
+        if 'dense' in vectors:
+            dense = next(iter(self._get_model(TextEmbedding, self.dense_model).query_embed(query)))
+            embeddings['dense'] = dense.tolist()
+        if 'sparse' in vectors:
+            sparse = next(iter(self._get_model(SparseTextEmbedding, self.sparse_model).query_embed(query)))
+            embeddings['sparse'] = self._to_sparse_vector(sparse, sparse_top_k, sparse_min_weight)
+        if 'late_interaction' in vectors and self.late_interaction_model is not None:
+            late_interaction = next(iter(
+                self._get_model(LateInteractionTextEmbedding, self.late_interaction_model).query_embed(query)))
+            embeddings['late_interaction'] = late_interaction.tolist()
+        metrics.observe("embedding.query", time.perf_counter() - start_time)
+        return embeddings
+
+    def late_interaction_vector_params(self) -> models.VectorParams:
+        """
+        The late interaction vectors are only used to rescore the prefetched candidates,
+        so they are kept on disk without an HNSW graph (m=0).
+        """
+        model = self._get_model(LateInteractionTextEmbedding, self.late_interaction_model)
+        dim = len(next(iter(model.query_embed("dimension probe")))[0])
+        return models.VectorParams(
+            size=dim,
+            distance=models.Distance.COSINE,
+            multivector_config=models.MultiVectorConfig(comparator=models.MultiVectorComparator.MAX_SIM),
+            hnsw_config=models.HnswConfigDiff(m=0),
+            on_disk=True
+        )
+
+
+def prune_sparse_vector(indices: np.ndarray, values: np.ndarray, top_k: int = None,
+                        min_weight: float = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    drop the weak expansion terms of a SPLADE vector: the terms below min_weight, and then all
+    but the top_k heaviest terms. the heaviest term is always kept so the vector is never empty.
+    every dropped term is one posting less in the sparse index (documents) or one posting list
+    less to traverse (queries).
+    """
+    if len(values) == 0:
+        return indices, values
+    if min_weight is not None:
+        keep = values >= min_weight
+        if not keep.any():
+            keep = values == values.max()
+        indices, values = indices[keep], values[keep]
+    if top_k is not None and len(values) > top_k:
+        top = np.sort(np.argpartition(values, -top_k)[-top_k:])
+        indices, values = indices[top], values[top]
+    return indices, values
+
+
+def prune_sparse_vectors(vectors: List[models.SparseVector], top_k: int = None,
+                         min_weight: float = None) -> List[models.SparseVector]:
+    "prune_sparse_vector for a batch of documents, a no-op when there is nothing to prune."
+    if top_k is None and min_weight is None:
+        return vectors
+    pruned = []
+    for vector in vectors:
+        indices, values = prune_sparse_vector(np.asarray(vector.indices), np.asarray(vector.values), top_k, min_weight)
+        pruned.append(models.SparseVector(indices=indices.tolist(), values=values.tolist()))
+    return pruned
+
+
+def build_points(documents: List[str], metadata: List[dict], embeddings: Dict[str, list],
+                 dense_vector_name: str, sparse_vector_name: str) -> List[models.PointStruct]:
+    """
+    build the points of a batch, with the same payload format as QdrantClient.add
+    ({"document": text, **metadata}), so both ingestion paths are searched the same way.
+    """
+    points = []
+    for i, (document, meta) in enumerate(zip(documents, metadata)):
+        vector = {dense_vector_name: embeddings['dense'][i], sparse_vector_name: embeddings['sparse'][i]}
+        if 'late_interaction' in embeddings:
+            vector[LATE_INTERACTION_VECTOR_NAME] = embeddings['late_interaction'][i]
+        points.append(models.PointStruct(id=uuid.uuid4().hex, vector=vector, payload={"document": document, **meta}))
+    return points
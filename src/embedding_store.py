@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import pyarrow as pa
+from qdrant_client import models
+
+from src.model_store import model_version
+from src.utils.utility_functions import read_corpus_batches
+
+EMBEDDINGS_SCHEMA = pa.schema([
+    ('content_hash', pa.string()),
+    ('document', pa.string()),
+    ('metadata', pa.string()),
+    ('dense', pa.list_(pa.float32())),
+    ('sparse_indices', pa.list_(pa.int32())),
+    ('sparse_values', pa.list_(pa.float32())),
+])
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingWriter:
+    "appends embedded batches to an embeddings file that is still being written."
+
+    def __init__(self, writer: pa.ipc.RecordBatchFileWriter):
+        self._writer = writer
+
+    def write(self, index_dict: Dict[str, List], embeddings: Dict[str, list]):
+        documents = index_dict['documents']
+        batch = pa.record_batch([
+            pa.array([content_hash(document) for document in documents], pa.string()),
+            pa.array(documents, pa.string()),
+            pa.array([json.dumps(meta, default=str) for meta in index_dict['metadata']], pa.string()),
+            pa.array(embeddings['dense'], pa.list_(pa.float32())),
+            pa.array([vector.indices for vector in embeddings['sparse']], pa.list_(pa.int32())),
+            pa.array([vector.values for vector in embeddings['sparse']], pa.list_(pa.float32())),
+        ], schema=EMBEDDINGS_SCHEMA)
+        self._writer.write_batch(batch)
+
+
+class EmbeddingStore:
+    """
+    Arrow files with the dense and (unpruned) sparse vectors of every ingested file,
+    so a collection can be rebuilt or cloned with other index settings by uploading
+    the stored vectors instead of embedding the corpus again.
+
+    The files are grouped by model version (see model_store.model_version) and keyed by
+    the checksum of the source file and the fields that were ingested from it, every row
+    also keeps the hash of its own text.
+    """
+
+    def __init__(self, store_dir, dense_model: str, sparse_model: str):
+        dense_version, sparse_version = model_version(dense_model), model_version(sparse_model)
+        models_key = hashlib.sha256(f"{dense_version}|{sparse_version}".encode('utf-8')).hexdigest()[:16]
+        self._dir = Path(store_dir) / models_key
+        self._models = {'dense_model': dense_version, 'sparse_model': sparse_version}
+
+    @staticmethod
+    def embedding_key(checksum: str, text_field: str, metadata_fields: List[str]) -> str:
+        "the key of a source file's embeddings, the same file ingested with other fields gets another key."
+        fields = json.dumps([text_field] + list(metadata_fields))
+        return hashlib.sha256(f"{checksum}|{fields}".encode('utf-8')).hexdigest()
+
+    def path(self, embedding_key: str) -> Path:
+        return self._dir / f"{embedding_key}.arrow"
+
+    def exists(self, embedding_key: str) -> bool:
+        return embedding_key is not None and self.path(embedding_key).exists()
+
+    @contextmanager
+    def writer(self, embedding_key: str) -> Iterator[EmbeddingWriter]:
+        """
+        write the embeddings of a source file batch by batch, the file becomes visible
+        only when the whole source file was written, a failed or cancelled ingest leaves nothing behind.
+        """
+        self._dir.mkdir(parents=True, exist_ok=True)
+        models_file = self._dir / "models.json"
+        if not models_file.exists():
+            models_file.write_text(json.dumps(self._models, indent=2))
+
+        path = self.path(embedding_key)
+        # unique per writer, the threads of a process may write the same key concurrently.
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, EMBEDDINGS_SCHEMA) as writer:
+                    yield EmbeddingWriter(writer)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def read(self, embedding_key: str, batch_size: int = None) -> Iterator[Tuple[Dict[str, List], Dict[str, list]]]:
+        """
+        memory map the stored embeddings of a source file.
+
+        Returns
+        -------
+        an iterator of (index_dict, embeddings) tuples, in the formats of create_index_dict_from_batch
+        and EmbeddingModels.embed_documents, ready for build_points.
+        """
+        for batch in read_corpus_batches(self.path(embedding_key), batch_size=batch_size):
+            index_dict = {
+                'documents': batch.column('document').to_pylist(),
+                'metadata': [json.loads(meta) for meta in batch.column('metadata').to_pylist()],
+            }
+            dense = batch.column('dense')
+            dense_matrix = dense.flatten().to_numpy().reshape(len(dense), -1)
+            embeddings = {
+                'dense': dense_matrix.tolist(),
+                'sparse': [models.SparseVector(indices=indices, values=values) for indices, values in
+                           zip(batch.column('sparse_indices').to_pylist(), batch.column('sparse_values').to_pylist())],
+            }
+            yield index_dict, embeddings
@@ -10,8 +10,11 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 import json
 import pandas as pd
+import numpy as np
 from typing import List
 
+from src.utils.dedup_utils import normalize_text, find_near_duplicates
+
 
 def collect_espn_urls () -> List:
     """
@@ -96,33 +99,67 @@ def convert_urls_to_df (urls: List[str]) -> pd.DataFrame:
     df = df.explode('paragraph_text')
     return df
     
-def filter_articles_df (df, min_len = 50) -> pd.DataFrame:
+def filter_articles_df (df, min_len = 50, near_duplicate_threshold = 0.85, num_perm = 128,
+                        shingle_size = 5, return_report = False):
     """
     Parameters
     ----------
     df : The Pandas df given from the convert_urls_to_df function.
     min_len: the min len for the paragraph_text.
+    near_duplicate_threshold: the estimated jaccard similarity above which a paragraph
+        is dropped as a near duplicate of an earlier one, None disables the near duplicates detection.
+    num_perm: number of MinHash permutations used for the near duplicates detection.
+    shingle_size: number of words in every shingle of the near duplicates detection.
+    return_report: if True, return a report df of the dropped rows as well.
     
     Returns
     -------
     A filtered data frame based on the following rules:
         1. paragraph_text contains over the min_len (the defult is 50 charecters).
-        2. remove paragraph_text duplicates
-        3. remove rows that their paragraph_text contains special chrecters that are used by espn as side notes
-        4. remove paragraph_text that contains the word 'cookies' to avoid any cookies notification paragraphs in my df
-        5. drop all rows with null values
+        2. remove rows that their paragraph_text contains special chrecters that are used by espn as side notes
+        3. remove paragraph_text that contains the word 'cookies' to avoid any cookies notification paragraphs in my df
+        4. drop all rows with null values
+        5. remove paragraph_text duplicates, after normalizing case, punctuation and whitespace
+        6. remove paragraph_text near duplicates (syndicated or lightly edited paragraphs)
+    if return_report is True, also returns report_df with the index of every dropped row,
+    the reason it was dropped, and for duplicates the index of the kept row and the similarity.
     """
-    df = df.drop_duplicates(subset='paragraph_text')
+    df = df.reset_index(drop=True)
+    text = df['paragraph_text'].fillna('').astype(str)
     
-    df = df[df['paragraph_text'].str.len() > min_len]
-
-    df = df[~df['paragraph_text'].str.contains(r'[•|]', regex=True)]
+    # rules 1-4 in a single pass, the named groups tell which pattern matched.
+    matches = text.str.extract(r'(?P<side_note>[•|])|(?P<cookies>cookies)')
+    reason = np.select(
+        [df.isna().any(axis=1), text.str.len() <= min_len, matches['side_note'].notna(), matches['cookies'].notna()],
+        ['null_values', 'too_short', 'side_note', 'cookies'],
+        default='')
+    reason = pd.Series(reason, index=df.index)
+    report_df = pd.DataFrame({'reason': reason[reason != '']})
     
-    df = df[~df['paragraph_text'].str.contains('cookies')]
+    kept_text = text[reason == '']
     
-    df = df.dropna(how='any')
+    # rule 5, exact duplicates after normalization.
+    normalized = kept_text.map(normalize_text)
+    first_index = pd.Series(kept_text.index, index=kept_text.index).groupby(normalized.values).transform('first')
+    exact_duplicates = first_index[first_index != first_index.index]
+    report_df = pd.concat([report_df, pd.DataFrame({'reason': 'exact_duplicate',
+                                                    'duplicate_of': exact_duplicates,
+                                                    'similarity': 1.0})])
+    kept_text = kept_text.drop(exact_duplicates.index)
     
-    return df
+    # rule 6, near duplicates using MinHash LSH.
+    if near_duplicate_threshold is not None:
+        near_duplicates = find_near_duplicates(kept_text, near_duplicate_threshold, num_perm, shingle_size)
+        near_duplicates['reason'] = 'near_duplicate'
+        report_df = pd.concat([report_df, near_duplicates])
+        kept_text = kept_text.drop(near_duplicates.index)
+    
+    filtered_df = df.loc[kept_text.index]
+    
+    if return_report:
+        report_df = report_df.join(df['paragraph_text']).sort_index()
+        return filtered_df, report_df
+    return filtered_df
 
 def main ():
     
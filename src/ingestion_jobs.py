@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+
+from src.collection_registry import CollectionRegistry
+from src.qdrant_transport import is_local_transport
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+current_file = Path(__file__)
+repo_root = current_file.resolve().parent.parent
+config_path = repo_root / "config.yaml"
+
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+ingestion_config = config['ingestion']
+
+
+class IngestionCancelled(Exception):
+    """Raised inside an ingest job when its cancellation was requested."""
+
+
+def _lower_priority(niceness: int):
+    "worker process initializer, indexing gets less CPU than the processes that serve queries."
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+def _run_ingestion_job(registry_path: str, job_id: str, collection_name: str, input_files: List[str],
+                       text_field: str, metadata_fields: List[str], reindex: bool = False):
+    """Runs in a worker process, the progress and the final status are written to the registry.
+    a reindex job without input files rebuilds the collection from the embedding store."""
+    from src.qdrant_db import QdrantCollectionManager
+
+    registry = CollectionRegistry(registry_path)
+    if registry.is_job_cancel_requested(job_id):
+        registry.set_job_status(job_id, 'cancelled')
+        return
+
+    registry.set_job_status(job_id, 'running')
+
+    def report_progress(rows_count: int):
+        registry.add_job_progress(job_id, rows_count, rows_count)
+        if registry.is_job_cancel_requested(job_id):
+            raise IngestionCancelled(job_id)
+
+    try:
+        if reindex:
+            QdrantCollectionManager().reindex_collection(
+                collection_name, input_files or None, text_field, metadata_fields, progress_callback=report_progress)
+        else:
+            QdrantCollectionManager().add_data_to_collection(
+                collection_name, input_files, text_field, metadata_fields, progress_callback=report_progress)
+    except IngestionCancelled:
+        registry.set_job_status(job_id, 'cancelled')
+        logger.info(f"Ingest job {job_id} was cancelled.")
+    except Exception as e:
+        registry.set_job_status(job_id, 'failed', error=str(e))
+        logger.error(f"Ingest job {job_id} failed: {e}")
+    else:
+        registry.set_job_status(job_id, 'succeeded')
+        logger.info(f"Ingest job {job_id} finished successfully.")
+
+
+class IngestionJobQueue:
+    """
+    Runs add_data_to_collection jobs in a pool of low priority worker processes,
+    so embedding and upserting never share the GIL or the CPU priority of the query path.
+    Jobs are tracked in the collection registry, so any gunicorn worker can report
+    their progress or cancel them.
+    """
+
+    def __init__(self, registry_path, max_workers=ingestion_config['max_workers'],
+                 niceness=ingestion_config['niceness']):
+        self._registry_path = str(registry_path)
+        self._registry = CollectionRegistry(registry_path)
+        self._data_dir = (repo_root / ingestion_config['data_dir']).resolve()
+        self._max_workers = max_workers
+        self._niceness = niceness
+        self._executor = None
+        self._futures: Dict[str, Future] = {}
+
+    def _get_executor(self) -> Executor:
+        # created lazily so the worker processes are spawned only when the first job is submitted.
+        if self._executor is None and is_local_transport():
+            # the embedded Qdrant can only be used by this process, so the jobs run in threads.
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='ingestion')
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_lower_priority,
+                initargs=(self._niceness,)
+            )
+        return self._executor
+
+    def resolve_input_file(self, file_name: str) -> str:
+        """Resolve an input file relative to the data directory, files outside of it are rejected."""
+        file_path = (self._data_dir / file_name).resolve()
+        if not file_path.is_relative_to(self._data_dir):
+            raise ValueError(f"input file {file_name} is outside of the data directory.")
+        if not file_path.is_file():
+            raise ValueError(f"input file {file_name} does not exist.")
+        return str(file_path)
+
+    def submit(self, collection_name: str, input_files: List[str], text_field: str, metadata_fields: List[str],
+               reindex: bool = False) -> str:
+        """
+        Queue an ingest job and return its id.
+
+        Parameters
+        ----------
+        collection_name : the registered collection the files will be added to.
+        input_files : files names relative to the data directory.
+        text_field, metadata_fields : see QdrantCollectionManager.add_data_to_collection.
+        reindex : build a new version of the collection from the input files (or, when there are none,
+            from its stored embeddings) and switch to it, see QdrantCollectionManager.reindex_collection.
+            raises ValueError when it would run next to another job of the collection (see CollectionRegistry.create_job).
+        """
+        if not self._registry.collection_exists(collection_name):
+            raise KeyError(collection_name)
+        input_paths = [self.resolve_input_file(file_name) for file_name in input_files]
+
+        job_id = uuid.uuid4().hex
+        self._registry.create_job(job_id, collection_name, input_files, kind='reindex' if reindex else 'ingest')
+        future = self._get_executor().submit(
+            _run_ingestion_job, self._registry_path, job_id, collection_name,
+            input_paths, text_field, metadata_fields, reindex)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        logger.info(f"Queued ingest job {job_id} for {collection_name}.")
+        return job_id
+
+    def cancel(self, job_id: str) -> Dict:
+        """
+        Cancel a job: a queued job in this process is dropped from the pool,
+        a running job stops after its current batch. Points that were already
+        upserted by a cancelled job stay in the collection.
+        """
+        self._registry.request_job_cancel(job_id)
+        future = self._futures.pop(job_id, None)
+        if future is not None and future.cancel():
+            self._registry.set_job_status(job_id, 'cancelled')
+        return self._registry.get_job(job_id)
+
+    def cancel_collection_jobs(self, collection_name: str):
+        for job in self._registry.get_jobs(collection_name, active_only=True):
+            self.cancel(job['job_id'])
+
+    def get_job(self, job_id: str) -> Dict:
+        return self._registry.get_job(job_id)
+
+    def get_jobs(self, collection_name: str = None) -> List[Dict]:
+        return self._registry.get_jobs(collection_name)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,158 @@
+import asyncio
 import os
+import time
+from typing import Any, List, Optional
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.constants import DEFAULT_EMBED_BATCH_SIZE
+from llama_index.core.llms import LLM, CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
 from llama_index.llms.cohere import Cohere as LlamaIndexCohere
 from llama_index.embeddings.cohere import CohereEmbedding
 from llama_index.llms.azure_openai import AzureOpenAI as LlamaIndexAzureOpenAI
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from dotenv import load_dotenv
 
+from src.llm_providers.recording import ProviderRecorder, recorder
+
 load_dotenv()
 
+
+class RecordingEmbedding(BaseEmbedding):
+    """
+    llama index embedding model that records (or replays) the vectors of a provider embedding model
+    with the provider recorder (see src/llm_providers/recording.py). every text is recorded on its own,
+    keyed by the provider, the model, the input type and the text, so batches replay however they are split.
+    the model name is the configured one (e.g. the azure deployment), in replay mode there is no embedding
+    model to ask for it.
+    """
+    _embedding: Optional[BaseEmbedding] = PrivateAttr()
+    _provider: str = PrivateAttr()
+    _recorder: ProviderRecorder = PrivateAttr()
+
+    def __init__(self, embedding: Optional[BaseEmbedding], provider: str, model_name: str,
+                 provider_recorder: ProviderRecorder = recorder, **kwargs):
+        embed_batch_size = embedding.embed_batch_size if embedding is not None else DEFAULT_EMBED_BATCH_SIZE
+        super().__init__(model_name=model_name, embed_batch_size=embed_batch_size, **kwargs)
+        self._embedding = embedding
+        self._provider = provider
+        self._recorder = provider_recorder
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RecordingEmbedding"
+
+    def _request(self, input_type: str, text: str) -> dict:
+        return {'provider': self._provider, 'model': self.model_name, 'input_type': input_type, 'text': text}
+
+    def _load(self, input_type: str, texts: List[str]):
+        "the recorded vectors of the texts and their total latency."
+        recorded = [self._recorder.load('embedding', self._request(input_type, text)) for text in texts]
+        return [vector for vector, _ in recorded], sum(latency for _, latency in recorded)
+
+    def _replay(self, input_type: str, texts: List[str]) -> List[List[float]]:
+        vectors, latency = self._load(input_type, texts)
+        if self._recorder.replay_latency:
+            time.sleep(latency)
+        return vectors
+
+    async def _areplay(self, input_type: str, texts: List[str]) -> List[List[float]]:
+        vectors, latency = self._load(input_type, texts)
+        if self._recorder.replay_latency:
+            await asyncio.sleep(latency)
+        return vectors
+
+    def _record(self, input_type: str, texts: List[str], vectors: List[List[float]], latency: float) -> List[List[float]]:
+        for text, vector in zip(texts, vectors):
+            self._recorder.save('embedding', self._request(input_type, text), vector, latency / len(texts))
+        return vectors
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        if self._recorder.mode == 'replay':
+            return self._replay('query', [query])[0]
+        start_time = time.perf_counter()
+        vector = self._embedding.get_query_embedding(query)
+        return self._record('query', [query], [vector], time.perf_counter() - start_time)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        if self._recorder.mode == 'replay':
+            return (await self._areplay('query', [query]))[0]
+        start_time = time.perf_counter()
+        vector = await self._embedding.aget_query_embedding(query)
+        return self._record('query', [query], [vector], time.perf_counter() - start_time)[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self._recorder.mode == 'replay':
+            return self._replay('text', texts)
+        start_time = time.perf_counter()
+        vectors = self._embedding.get_text_embedding_batch(texts)
+        return self._record('text', texts, vectors, time.perf_counter() - start_time)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self._recorder.mode == 'replay':
+            return await self._areplay('text', texts)
+        start_time = time.perf_counter()
+        vectors = await self._embedding.aget_text_embedding_batch(texts)
+        return self._record('text', texts, vectors, time.perf_counter() - start_time)
+
+
+class RecordingLLM(CustomLLM):
+    """
+    llama index llm that records (or replays) the completions of a provider llm, e.g. the RAGAS
+    judge, keyed by the provider, the model, the prompt and the completion arguments.
+    chat goes through complete (see CustomLLM), streaming returns the whole completion at once.
+    """
+    _llm: Optional[LLM] = PrivateAttr()
+    _provider: str = PrivateAttr()
+    _model_name: str = PrivateAttr()
+    _recorder: ProviderRecorder = PrivateAttr()
+
+    def __init__(self, llm: Optional[LLM], provider: str, model_name: str,
+                 provider_recorder: ProviderRecorder = recorder, **kwargs):
+        super().__init__(**kwargs)
+        self._llm = llm
+        self._provider = provider
+        self._model_name = model_name
+        self._recorder = provider_recorder
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RecordingLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        if self._llm is not None:
+            return self._llm.metadata
+        return LLMMetadata(model_name=self._model_name)
+
+    def _request(self, prompt: str, formatted: bool, kwargs: dict) -> dict:
+        return {'provider': self._provider, 'model': self._model_name, 'prompt': prompt, 'formatted': formatted, **kwargs}
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self._recorder.call('completion', self._request(prompt, formatted, kwargs),
+                                   lambda: self._llm.complete(prompt, formatted=formatted, **kwargs).text)
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        async def provider_call():
+            return (await self._llm.acomplete(prompt, formatted=formatted, **kwargs)).text
+
+        text = await self._recorder.acall('completion', self._request(prompt, formatted, kwargs), provider_call)
+        return CompletionResponse(text=text)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        response = self.complete(prompt, formatted=formatted, **kwargs)
+        yield CompletionResponse(text=response.text, delta=response.text)
+
+
 class LLMServiceManager:
     def __init__(self, provider: str, llm_model: str, embedding_model: str):
         self.provider = provider.lower()
@@ -16,12 +162,25 @@ class LLMServiceManager:
         self._initialize_services()
 
     def _initialize_services(self):
+        if self.provider not in ('cohere', 'azure_openai'):
+            raise ValueError(f"Unsupported provider: {self.provider}")
+        # the configured names, the recordings are keyed by them in record and replay mode.
+        llm_model_name, embedding_model_name = self.llm_model, self.embedding_model
+
+        if recorder.mode == 'replay':
+            # everything is served from the recordings, so the provider clients (and their keys) aren't created.
+            self.llm_model = RecordingLLM(None, self.provider, llm_model_name)
+            self.embedding_model = RecordingEmbedding(None, self.provider, embedding_model_name)
+            return
+
         if self.provider == 'cohere':
             self._initialize_cohere_services()
-        elif self.provider == 'azure_openai':
-            self._initialize_azure_openai_services()
         else:
-            raise ValueError(f"Unsupported provider: {self.provider}")
+            self._initialize_azure_openai_services()
+
+        if recorder.mode == 'record':
+            self.llm_model = RecordingLLM(self.llm_model, self.provider, llm_model_name)
+            self.embedding_model = RecordingEmbedding(self.embedding_model, self.provider, embedding_model_name)
 
 
     def _initialize_cohere_services(self):
@@ -1,9 +1,19 @@
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from openai import AzureOpenAI
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional
+import httpx
+import numpy as np
+from openai import APIConnectionError, AzureOpenAI
 import cohere
 from dotenv import load_dotenv
 
+from src.llm_providers.recording import ProviderRecorder, recorder
+from src.utils.metrics import metrics
+
 
 load_dotenv()
 
@@ -11,7 +21,8 @@ load_dotenv()
 # Abstract Strategy Interface
 class LLMStrategy(ABC):
     @abstractmethod
-    def generate_response(self, messages: list, temperature: float) -> str:
+    def generate_response(self, messages: list, temperature: float, timeout: Optional[float] = None) -> str:
+        """timeout: seconds the provider call may take, None keeps the client default."""
         pass
 
 # Concrete Strategy for Azure OpenAI
@@ -24,14 +35,17 @@ class AzureOpenAIStrategy(LLMStrategy):
             api_version = os.environ['AZURE_OPENAI_API_VERSION'],
         )
 
-    def generate_response(self, messages: list, temperature=0) -> str:
+    def generate_response(self, messages: list, temperature=0, timeout: Optional[float] = None) -> str:
         url = str(self.client.base_url)
         azure_deployment = url.rstrip('/').split('/')[-1]
         
+        # the openai client treats timeout=None as no timeout, so it's only passed when set.
+        request_options = {"timeout": timeout} if timeout is not None else {}
         response = self.client.chat.completions.create(
             model=azure_deployment,
             messages=messages,
-            temperature=temperature
+            temperature=temperature,
+            **request_options
         )
         return response.choices[0].message.content
     
@@ -42,17 +56,246 @@ class CohereStrategy(LLMStrategy):
         self.client = cohere.ClientV2(api_key=os.environ['COHERE_API_KEY'])
         self.model = model
 
-    def generate_response(self, messages: list, temperature=0) -> str:
+    def generate_response(self, messages: list, temperature=0, timeout: Optional[float] = None) -> str:
+        request_options = {"timeout_in_seconds": timeout} if timeout is not None else None
         response = self.client.chat(
             model=self.model,
             messages = messages,
             temperature=temperature,
+            request_options=request_options,
         )
         
         return response.message.content[0].text.strip()
 
+# Records the responses of another strategy, or replays them without it
+class RecordingLLMStrategy(LLMStrategy):
+    """
+    Wraps a provider strategy with the provider recorder (see src/llm_providers/recording.py),
+    the recording is keyed by the provider, the model, the messages and the temperature.
+    in replay mode there is no inner strategy, so no API keys or network are needed.
+    """
+    def __init__(self, provider: str, model: str, strategy: Optional[LLMStrategy], provider_recorder: ProviderRecorder = recorder):
+        self.provider = provider
+        self.model = model
+        self.strategy = strategy
+        self._recorder = provider_recorder
+
+    def generate_response(self, messages: list, temperature=0, timeout: Optional[float] = None) -> str:
+        request = {'provider': self.provider, 'model': self.model, 'messages': messages, 'temperature': temperature}
+        return self._recorder.call(
+            'generate', request,
+            lambda: self.strategy.generate_response(messages, temperature=temperature, timeout=timeout),
+            timeout=timeout,
+        )
+
+
+class CircuitOpenError(Exception):
+    """Raised when every provider of a request has an open circuit breaker."""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a provider after failure_threshold consecutive failures.
+    After reset_timeout seconds one trial request is let through (half open),
+    its success closes the breaker and its failure opens it again.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self._reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        "gives back the trial slot of a request that was allowed but never sent."
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self._failure_threshold:
+                if self._opened_at is None:
+                    metrics.increment(f"llm.circuit_opened.{self.name}")
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """the recent latencies of a provider/model, used to decide when a request is slow enough to hedge."""
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percentile: float, min_samples: int, default: float) -> float:
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return default
+            return float(np.percentile(self._latencies, percentile))
+
+
+# the breakers and the latency trackers outlive the per request LLMClient instances.
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_latency_trackers: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def get_circuit_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> CircuitBreaker:
+    with _registry_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _circuit_breakers[name]
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    with _registry_lock:
+        if name not in _latency_trackers:
+            _latency_trackers[name] = LatencyTracker()
+        return _latency_trackers[name]
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """whether the error is the provider's fault: a timeout, a connection error or a 5xx response.
+    the other errors (an invalid model, a bad request...) would fail with any provider."""
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError, APIConnectionError)):
+        return True
+    # the openai and cohere errors of an HTTP response carry its status code.
+    status_code = getattr(error, 'status_code', None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class HedgedLLMStrategy(LLMStrategy):
+    """
+    Composite strategy: sends the request to the primary strategy, and if it didn't answer
+    within the hedge_percentile of its recent latencies (or failed), sends the same request
+    to the fallback strategy. The first successful response wins.
+    The losing request is cancelled if it didn't start yet, otherwise its result is discarded
+    and it ends at the latest when its timeout expires.
+    Only the provider failures (see is_provider_failure) count toward the breakers and fall back,
+    the other errors of the primary are raised as they are.
+    Each strategy has a circuit breaker, a strategy with an open breaker is skipped. the fallback's
+    breaker is only asked when the hedge is actually sent, so a half open fallback keeps its trial
+    for a request that reaches it.
+    Any LLMStrategy can be composed, so it can be tested with local fake strategies.
+    """
+    def __init__(
+        self,
+        primary: LLMStrategy,
+        fallback: LLMStrategy,
+        primary_breaker: CircuitBreaker,
+        fallback_breaker: CircuitBreaker,
+        primary_latency: LatencyTracker,
+        hedge_percentile: float = 95,
+        initial_hedge_delay: float = 5.0,
+        min_samples: int = 20,
+        executor: ThreadPoolExecutor = _hedge_executor
+    ):
+        self.primary = primary
+        self.fallback = fallback
+        self._breakers = {'primary': primary_breaker, 'fallback': fallback_breaker}
+        self._primary_latency = primary_latency
+        self._hedge_percentile = hedge_percentile
+        self._initial_hedge_delay = initial_hedge_delay
+        self._min_samples = min_samples
+        self._executor = executor
+
+    def _call(self, role: str, messages: list, temperature: float, timeout: Optional[float]) -> str:
+        strategy = self.primary if role == 'primary' else self.fallback
+        start_time = time.perf_counter()
+        try:
+            response = strategy.generate_response(messages, temperature=temperature, timeout=timeout)
+        except Exception as e:
+            if is_provider_failure(e):
+                self._breakers[role].record_failure()
+            else:
+                self._breakers[role].release()
+            raise
+        self._breakers[role].record_success()
+        if role == 'primary':
+            self._primary_latency.record(time.perf_counter() - start_time)
+        return response
+
+    def _cancel(self, futures: Dict):
+        for future, role in futures.items():
+            if future.cancel():
+                # the request never started, so it didn't use its breaker's trial.
+                self._breakers[role].release()
+
+    def generate_response(self, messages: list, temperature=0, timeout: Optional[float] = None) -> str:
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+
+        def remaining():
+            return max(0.0, expires_at - time.monotonic()) if expires_at is not None else None
+
+        if self._breakers['primary'].allow_request():
+            first_role, pending_roles = 'primary', ['fallback']
+        elif self._breakers['fallback'].allow_request():
+            first_role, pending_roles = 'fallback', []
+        else:
+            raise CircuitOpenError("All LLM providers are unavailable (circuit breakers are open).")
+
+        futures = {self._executor.submit(self._call, first_role, messages, temperature, timeout): first_role}
+        hedge_delay = self._primary_latency.percentile(
+            self._hedge_percentile, self._min_samples, self._initial_hedge_delay)
+        last_error = None
+
+        while futures:
+            wait_timeout = hedge_delay if pending_roles else remaining()
+            if pending_roles and remaining() is not None:
+                wait_timeout = min(wait_timeout, remaining())
+            done, _ = wait(futures, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                role = futures.pop(future)
+                if future.exception() is None:
+                    self._cancel(futures)
+                    if role == 'fallback':
+                        metrics.increment("llm.hedge_won")
+                    return future.result()
+                last_error = future.exception()
+                if role == 'primary' and not is_provider_failure(last_error):
+                    # the request itself is wrong, the fallback would fail the same way.
+                    self._cancel(futures)
+                    raise last_error
+
+            if not done and (not pending_roles or remaining() == 0):
+                self._cancel(futures)
+                raise TimeoutError(f"No LLM provider answered within {timeout} seconds.")
+            
+            if pending_roles and (not done or not futures):
+                # the primary is slow or failed, send the hedged request if its breaker lets it through.
+                role = pending_roles.pop(0)
+                if self._breakers[role].allow_request():
+                    metrics.increment("llm.hedged_requests")
+                    futures[self._executor.submit(self._call, role, messages, temperature, remaining())] = role
+
+        raise last_error
+
+
 class LLMClient:
-    def __init__(self, provider: str, model):
+    def __init__(self, provider: str, model, hedge_config: dict = None):
         """
         Initializes the LLM client based on the provider.
 
@@ -63,27 +306,58 @@ class LLMClient:
                     - deployment_model (str): The deployment model name.
                 For Cohere:
                     - model (str): The model name (default: "command-r-plus-08-2024").
+            hedge_config (dict): when it's enabled, requests are hedged to a fallback
+                provider/model (see HedgedLLMStrategy). keys: enabled, fallback_provider,
+                fallback_model, percentile, initial_delay_seconds, min_samples,
+                breaker_failure_threshold, breaker_reset_seconds.
         """
+        self.strategy = self._create_strategy(provider, model)
+        
+        if hedge_config and hedge_config['enabled']:
+            fallback_provider = hedge_config['fallback_provider'].lower()
+            fallback_model = hedge_config['fallback_model']
+            if (fallback_provider, fallback_model) != (provider.lower(), model):
+                breaker_args = (hedge_config['breaker_failure_threshold'], hedge_config['breaker_reset_seconds'])
+                self.strategy = HedgedLLMStrategy(
+                    primary=self.strategy,
+                    fallback=self._create_strategy(fallback_provider, fallback_model),
+                    primary_breaker=get_circuit_breaker(provider.lower(), *breaker_args),
+                    fallback_breaker=get_circuit_breaker(fallback_provider, *breaker_args),
+                    primary_latency=get_latency_tracker(f"{provider.lower()}/{model}"),
+                    hedge_percentile=hedge_config['percentile'],
+                    initial_hedge_delay=hedge_config['initial_delay_seconds'],
+                    min_samples=hedge_config['min_samples']
+                )
+    
+    @staticmethod
+    def _create_strategy(provider: str, model) -> LLMStrategy:
         provider = provider.lower()
 
+        if provider not in ("azure_openai", "cohere"):
+            raise ValueError(f"Unsupported provider: {provider}")
+        if recorder.mode == 'replay':
+            return RecordingLLMStrategy(provider, model, None)
+        
         if provider == "azure_openai":
-            self.strategy = AzureOpenAIStrategy(model)
-        elif provider == "cohere":
-            self.strategy = CohereStrategy(model)
+            strategy = AzureOpenAIStrategy(model)
         else:
-            raise ValueError(f"Unsupported provider: {provider}")
+            strategy = CohereStrategy(model)
+        if recorder.mode == 'record':
+            strategy = RecordingLLMStrategy(provider, model, strategy)
+        return strategy
 
-    def generate_response(self, messages: list) -> str:
+    def generate_response(self, messages: list, timeout: Optional[float] = None) -> str:
         """
         Generates a response using the selected LLM strategy.
 
         Args:
             messages (list): List of messages to send to the LLM.
+            timeout (float): seconds the provider call may take, None keeps the client default.
 
         Returns:
             str: The generated response.
         """
-        return self.strategy.generate_response(messages)
+        return self.strategy.generate_response(messages, timeout=timeout)
 
 
 # Usage Example
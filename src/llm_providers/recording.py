@@ -0,0 +1,185 @@
+"""
+Record/replay of the provider calls (LLM generation, Cohere rerank and the llama index llms and embeddings),
+so end to end measurements can run offline and reproducibly.
+
+provider_recording.mode (or PROVIDER_RECORDING_MODE):
+    off - the providers are called directly.
+    record - the providers are called, and every request, response and latency is saved.
+    replay - the saved responses are served without the network, a request that was not
+        recorded raises RecordingNotFound. with replay_latency the recorded latencies are
+        slept too (and a recorded call slower than the request timeout times out).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+import yaml
+from cohere import V2RerankResponse
+
+from src.utils.metrics import metrics
+from src.utils.sqlite_store import SqliteStore
+
+current_file = Path(__file__)
+repo_root = current_file.resolve().parent.parent.parent
+config_path = repo_root / "config.yaml"
+
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+recording_config = config['provider_recording']
+
+RECORDING_MODES = ('off', 'record', 'replay')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    request_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    request BLOB NOT NULL,
+    response BLOB NOT NULL,
+    latency REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+"""
+
+
+class RecordingNotFound(KeyError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class ProviderRecorder(SqliteStore):
+    """
+    The on-disk store of the recorded provider calls, keyed by the sha256 of the call kind and
+    its request (everything that changes the response, not the timeouts). the requests and the
+    responses are stored as zlib compressed json in SQLite (WAL mode), so parallel workers can
+    record to, and replay from, the same file.
+    """
+
+    def __init__(self, db_path, mode: str = 'off', replay_latency: bool = False, busy_timeout=30):
+        if mode not in RECORDING_MODES:
+            raise ValueError(f"Error: the recording mode should be one of {RECORDING_MODES}, but got {mode}.")
+        self.mode = mode
+        self.replay_latency = replay_latency
+        super().__init__(db_path, busy_timeout)
+        # with the recording off the file is never created.
+        if mode != 'off':
+            self._connection().executescript(_SCHEMA)
+
+    @staticmethod
+    def request_key(kind: str, request: Dict) -> str:
+        content = json.dumps({'kind': kind, 'request': request}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def save(self, kind: str, request: Dict, response, latency: float):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO recordings (request_key, kind, request, response, latency, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.request_key(kind, request), kind, _pack(request), _pack(response), latency, time.time()))
+
+    def load(self, kind: str, request: Dict) -> Tuple[object, float]:
+        "the recorded response and latency of the request."
+        row = self._connection().execute("SELECT response, latency FROM recordings WHERE request_key = ?",
+                                         (self.request_key(kind, request),)).fetchone()
+        if row is None:
+            metrics.increment(f"recording.{kind}.misses")
+            raise RecordingNotFound(f"Error: no recorded {kind} response for this request.")
+        metrics.increment(f"recording.{kind}.hits")
+        return _unpack(row[0]), row[1]
+
+    def call(self, kind: str, request: Dict, provider_call: Callable[[], object], timeout: Optional[float] = None,
+             timeout_error: type = TimeoutError):
+        """
+        record or replay one provider call.
+        provider_call makes the real call and returns a json serializable response, it's not
+        called in replay mode. failed calls are not recorded.
+        """
+        if self.mode == 'replay':
+            response, latency = self.load(kind, request)
+            if self.replay_latency:
+                if timeout is not None and latency > timeout:
+                    time.sleep(timeout)
+                    raise timeout_error(f"The recorded {kind} call took {latency:.2f} seconds, more than its timeout.")
+                time.sleep(latency)
+            return response
+
+        start_time = time.perf_counter()
+        response = provider_call()
+        if self.mode == 'record':
+            self.save(kind, request, response, time.perf_counter() - start_time)
+        return response
+
+    async def acall(self, kind: str, request: Dict, provider_call: Callable[[], Awaitable[object]],
+                    timeout: Optional[float] = None, timeout_error: type = TimeoutError):
+        "call for coroutines, the recorded latency is awaited, so a replay doesn't block the event loop."
+        if self.mode == 'replay':
+            response, latency = self.load(kind, request)
+            if self.replay_latency:
+                if timeout is not None and latency > timeout:
+                    await asyncio.sleep(timeout)
+                    raise timeout_error(f"The recorded {kind} call took {latency:.2f} seconds, more than its timeout.")
+                await asyncio.sleep(latency)
+            return response
+
+        start_time = time.perf_counter()
+        response = await provider_call()
+        if self.mode == 'record':
+            self.save(kind, request, response, time.perf_counter() - start_time)
+        return response
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return bool(default)
+    return value.lower() in ('1', 'true', 'yes')
+
+
+recorder = ProviderRecorder(
+    Path(os.getenv("PROVIDER_RECORDING_PATH", repo_root / recording_config['path'])),
+    mode=os.getenv("PROVIDER_RECORDING_MODE", recording_config['mode']),
+    replay_latency=_env_flag("PROVIDER_REPLAY_LATENCY", recording_config['replay_latency']),
+)
+
+
+class RecordingReranker:
+    """
+    Stands in for the cohere client in HybridSearcher, records or replays its rerank calls,
+    keyed by the model, the query, the documents, top_n and the other rerank arguments.
+    """
+
+    def __init__(self, client, provider_recorder: ProviderRecorder = recorder):
+        self._client = client
+        self._recorder = provider_recorder
+
+    def rerank(self, model: str, query: str, documents: list, top_n: int = None, request_options: Dict = None, **kwargs):
+        request = {'model': model, 'query': query, 'documents': documents, 'top_n': top_n, **kwargs}
+        response = self._recorder.call(
+            'rerank', request,
+            lambda: self._client.rerank(model=model, query=query, documents=documents, top_n=top_n,
+                                        request_options=request_options, **kwargs).dict(),
+            timeout=(request_options or {}).get('timeout_in_seconds'),
+            timeout_error=httpx.TimeoutException,
+        )
+        return V2RerankResponse(**response)
+
+
+def create_reranker(client_factory: Callable[[], object], provider_recorder: ProviderRecorder = recorder):
+    "the reranker client, wrapped by the recorder unless it's off. in replay mode the client isn't created."
+    if provider_recorder.mode == 'replay':
+        return RecordingReranker(None, provider_recorder)
+    if provider_recorder.mode == 'record':
+        return RecordingReranker(client_factory(), provider_recorder)
+    return client_factory()
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import yaml
+from fastembed import TextEmbedding, SparseTextEmbedding, LateInteractionTextEmbedding
+from fastembed.common.model_management import ModelManagement
+
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+current_file = Path(__file__)
+repo_root = current_file.resolve().parent.parent
+config_path = repo_root / "config.yaml"
+
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+qdrant_config = config['qdrant']
+models_config = config['models']
+
+cache_dir = Path(os.getenv("MODEL_CACHE_DIR", repo_root / models_config['cache_dir']))
+manifest_path = cache_dir / "manifest.json"
+
+MODEL_CLASSES = {
+    'dense': TextEmbedding,
+    'sparse': SparseTextEmbedding,
+    'late_interaction': LateInteractionTextEmbedding,
+}
+
+
+def is_offline() -> bool:
+    "offline mode never touches the network, models are loaded only from the cache directory."
+    offline = os.getenv("MODEL_STORE_OFFLINE")
+    if offline is None:
+        return bool(models_config['offline'])
+    return offline.lower() in ('1', 'true', 'yes')
+
+
+def fastembed_kwargs() -> Dict:
+    """
+    the keyword arguments every fastembed model (and QdrantClient.set_model) is created with:
+    the managed cache directory, the ONNX threads and, in offline mode, local_files_only.
+    fastembed uses the same number for the intra-op and the inter-op threads, the inter-op
+    pool is idle anyway since the sessions run the graph sequentially.
+    """
+    return {
+        'cache_dir': str(cache_dir),
+        'threads': models_config['onnx_threads'],
+        'local_files_only': is_offline(),
+    }
+
+
+def configured_models() -> List[Tuple[str, str]]:
+    "(kind, model name) of every model the service may load."
+    models = [('dense', qdrant_config['dense_model']), ('sparse', qdrant_config['sparse_model'])]
+    if qdrant_config.get('late_interaction_model'):
+        models.append(('late_interaction', qdrant_config['late_interaction_model']))
+    return models
+
+
+def _model_description(kind: str, model_name: str) -> Dict:
+    for description in MODEL_CLASSES[kind].list_supported_models():
+        if description['model'].lower() == model_name.lower():
+            return description
+    raise ValueError(f"Error: {model_name} is not a supported {kind} fastembed model.")
+
+
+def _sha256(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _load_manifest() -> Dict:
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def model_version(model_name: str) -> str:
+    """
+    the model name and the checksum of its model file from the manifest, when it's there,
+    so a quantized model and its original don't share stored embeddings.
+    """
+    entry = _load_manifest().get(model_name)
+    if entry is None:
+        return model_name
+    return f"{model_name}@{entry['sha256'][:12]}"
+
+
+def quantize_model(model_file: Path):
+    """
+    replace an ONNX model with its dynamically quantized (int8 weights) version,
+    the original is kept next to it as <model_file>.fp32.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    original_file = model_file.with_name(model_file.name + '.fp32')
+    if not original_file.exists():
+        # the cached file is usually a symlink to a blob, keep a real copy of the original weights.
+        original_file.write_bytes(model_file.read_bytes())
+    quantized_file = model_file.with_name(model_file.name + '.int8')
+    quantize_dynamic(model_input=str(original_file), model_output=str(quantized_file), weight_type=QuantType.QInt8)
+    os.replace(quantized_file, model_file)
+
+
+def download_models():
+    """
+    Download every configured model into the cache directory, quantize the models listed
+    in models.quantize, and write a manifest with the checksum of every model file.
+    Meant to run while the image is built, so the container starts without the network.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest()
+    quantize = set(models_config['quantize'] or [])
+
+    for kind, model_name in configured_models():
+        description = _model_description(kind, model_name)
+        model_dir = ModelManagement.download_model(description, cache_dir)
+        model_file = Path(model_dir) / description['model_file']
+
+        entry = manifest.get(model_name, {})
+        if model_name in quantize and not entry.get('quantized'):
+            logger.info(f"Quantizing {model_name}.")
+            quantize_model(model_file)
+        manifest[model_name] = {
+            'kind': kind,
+            'model_file': str(model_file.relative_to(cache_dir)),
+            'sha256': _sha256(model_file),
+            'quantized': model_name in quantize or bool(entry.get('quantized')),
+        }
+        logger.info(f"{model_name} is stored in {model_dir}.")
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def verify_models() -> List[str]:
+    """
+    Load every configured model from the cache only (local_files_only) and embed a probe,
+    the model files have to match the checksums in the manifest.
+
+    Returns
+    -------
+    errors : List of the problems found, empty if every model is ready for offline use.
+    """
+    manifest = _load_manifest()
+    kwargs = {**fastembed_kwargs(), 'local_files_only': True}
+    errors = []
+    for kind, model_name in configured_models():
+        entry = manifest.get(model_name)
+        if entry is None:
+            errors.append(f"{model_name} is missing from the manifest, run the download command.")
+            continue
+        model_file = cache_dir / entry['model_file']
+        if not model_file.exists() or _sha256(model_file) != entry['sha256']:
+            errors.append(f"{model_name}: {model_file} is missing or doesn't match the manifest checksum.")
+            continue
+        try:
+            model = MODEL_CLASSES[kind](model_name=model_name, **kwargs)
+            next(iter(model.query_embed("offline verification probe")))
+        except Exception as e:
+            errors.append(f"{model_name} can't be loaded offline: {e}")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local fastembed model cache.")
+    parser.add_argument('command', choices=['download', 'verify'],
+                        help="download: fetch (and quantize) the configured models, verify: check they load offline.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'download':
+        download_models()
+        return 0
+
+    errors = verify_models()
+    for error in errors:
+        logger.error(error)
+    if errors:
+        return 1
+    logger.info(f"All models load offline from {cache_dir}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,32 @@
-from src.utils.utility_functions import create_index_dict_from_df, read_and_concatenate, convert_search_dict_to_index_dict, update_section_with_kwargs
+from src.utils.utility_functions import create_index_dict_from_batch, iter_input_batches, convert_search_dict_to_index_dict, update_section_with_kwargs, file_checksum
+from src.collection_registry import CollectionRegistry, physical_collection_name, VERSIONED_COLLECTION_NAME
+from src.embedding_models import EmbeddingModels, build_points, prune_sparse_vectors, LATE_INTERACTION_VECTOR_NAME
+from src.embedding_store import EmbeddingStore
+from src.article_store import ArticleStore, ARTICLE_ID_FIELD
+from src.retrieval_router import RETRIEVAL_MODES, select_retrieval_mode, candidate_depth, rerank_text
+from src.model_store import fastembed_kwargs
+from src.qdrant_transport import create_qdrant_client, client_url, is_local_client
 from src.llm_providers.llm_connections import LLMClient
+from src.llm_providers.recording import create_reranker
 from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+from src.utils.request_context import request_cache
+from src.utils.single_flight import SingleFlight
+from src.utils.qos import Deadline, AdmissionController
 
 import cohere
-from typing import List, Dict
+import contextvars
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Optional, Tuple, Union
 import yaml
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, models
 from dotenv import load_dotenv
 
 from pathlib import Path
-import json
+import math
+import threading
+import time
 import os
 
 load_dotenv()
@@ -28,170 +45,898 @@ qdrant_config = config['qdrant']
 
 dense_model = qdrant_config['dense_model']
 sparse_model = qdrant_config['sparse_model']
+late_interaction_model = qdrant_config['late_interaction_model']
 chunk_size = qdrant_config['chunk_size']
-client_url = os.getenv("QDRANT_URL", qdrant_config['client'])
+ingest_batch_size = config['ingestion']['batch_size']
+registry_path = os.getenv("QDRANT_REGISTRY_PATH", repo_root / qdrant_config['registry'])
 
 
-client = QdrantClient(client_url)
-client.set_model(dense_model)
-client.set_sparse_model(sparse_model)
+client = create_qdrant_client()
+client.set_model(dense_model, **fastembed_kwargs())
+client.set_sparse_model(sparse_model, **fastembed_kwargs())
 
 llm_config = config['llm']
+qos_config = config['qos']
+sparse_index_config = config['sparse_index']
+reindex_config = config['reindex']
+embedding_store_dir = os.getenv("EMBEDDING_STORE_DIR", repo_root / config['embedding_store']['dir'])
+article_store_path = os.getenv("ARTICLE_STORE_PATH", repo_root / config['article_store']['path'])
+article_store = ArticleStore(article_store_path)
+federation_config = config['federation']
+sharding_config = config['sharding']
+
+SHARDING_SETTINGS = ('shard_number', 'replication_factor', 'write_consistency_factor', 'shard_key_field')
+SPARSE_INDEX_SETTINGS = ('sparse_on_disk', 'idf_modifier')
+
+
+def validate_sharding(shard_number: int = None, replication_factor: int = None, write_consistency_factor: int = None,
+                      shard_key_field: str = None) -> Dict:
+    "the sharding settings of a collection, raises ValueError for invalid ones."
+    for name, value in (('shard_number', shard_number), ('replication_factor', replication_factor),
+                        ('write_consistency_factor', write_consistency_factor)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            raise ValueError(f"Error: {name} should be a positive integer, but got {value}.")
+    if write_consistency_factor is not None and write_consistency_factor > (replication_factor or 1):
+        raise ValueError(f"Error: write_consistency_factor ({write_consistency_factor}) can't be more than "
+                         f"replication_factor ({replication_factor or 1}).")
+    if shard_key_field is not None and (not isinstance(shard_key_field, str) or not shard_key_field):
+        raise ValueError(f"Error: shard_key_field should be a payload field name, but got {shard_key_field}.")
+    return {'shard_number': shard_number, 'replication_factor': replication_factor,
+            'write_consistency_factor': write_consistency_factor, 'shard_key_field': shard_key_field}
+
+
+def shard_key_value(metadata: Dict, shard_key_field: str):
+    "the shard key of a document, Qdrant shard keys are strings or integers."
+    value = metadata.get(shard_key_field)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        raise ValueError(f"Error: the shard key field {shard_key_field} is missing from a document's metadata, "
+                         f"it should be one of the metadata fields.")
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value if isinstance(value, int) and not isinstance(value, bool) else str(value)
 
 
 class QdrantCollectionManager:
-    _collections_file = repo_root / 'qdrant_collections.json'
+    _legacy_collections_file = repo_root / 'qdrant_collections.json'
     
-    def __init__(self):
-        self._client = client
+    def __init__(self, qdrant_client: QdrantClient = client, collection_registry_path=registry_path,
+                 articles_path=article_store_path, import_legacy_collections: bool = True):
+        """by default the serving Qdrant, registry and article store, the snapshot builder passes its own.
+        import_legacy_collections: migrate qdrant_collections.json into an empty registry, only for the
+        serving registry, a throwaway one (e.g. of a snapshot build) has to start empty."""
+        self._client = qdrant_client
         self._dense_model = dense_model
         self._sparse_model = sparse_model
-        self.collections_input_files = self._load_collections()
+        self._registry = CollectionRegistry(collection_registry_path)
+        if import_legacy_collections:
+            self._registry.import_json(self._legacy_collections_file)
+        self._embedding_store = EmbeddingStore(embedding_store_dir, dense_model, sparse_model)
+        self._article_store = ArticleStore(articles_path)
+        self._shard_keys: Dict[str, set] = {}
+        self._shard_keys_lock = threading.Lock()
     
-    def _load_collections(self) -> Dict[str, List[str]]:
-        """Load collections from persistent storage."""
-        try:
-            with open(self._collections_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-    
-    def _save_collections(self):
-        """Save collections to persistent storage."""
-        with open(self._collections_file, 'w') as f:
-            json.dump(self.collections_input_files, f)
-    
-    def create_collection(self, collection_name: str):
-        """Create a new Qdrant collection."""
-        self._client.set_model(self._dense_model)
-        self._client.set_sparse_model(self._sparse_model)
+    def _create_physical_collection(self, physical_name: str, late_interaction: bool, sparse_on_disk: bool,
+                                    idf_modifier: bool, bulk_load: bool = False, sharding: Dict = None) -> str:
+        """create a physical Qdrant collection, returns its late interaction model (or None).
+        with bulk_load=True the HNSW indexing is disabled until the upload is done (see reindex_collection).
+        sharding: the SHARDING_SETTINGS of the collection, with a shard_key_field the collection is
+        custom sharded and its shard keys are created by the ingestion."""
+        sharding = sharding or {}
+        self._client.set_model(self._dense_model, **fastembed_kwargs())
+        self._client.set_sparse_model(self._sparse_model, **fastembed_kwargs())
+        
+        vectors_config = self._client.get_fastembed_vector_params()
+        collection_late_interaction_model = None
+        if late_interaction:
+            collection_late_interaction_model = late_interaction_model
+            embedding_models = EmbeddingModels(self._dense_model, self._sparse_model, late_interaction_model)
+            vectors_config[LATE_INTERACTION_VECTOR_NAME] = embedding_models.late_interaction_vector_params()
         
+        sparse_vectors_config = self._client.get_fastembed_sparse_vector_params(
+            on_disk=sparse_on_disk,
+            modifier=models.Modifier.IDF if idf_modifier else None
+        )
+        optimizers_config = None
+        if bulk_load:
+            optimizers_config = models.OptimizersConfigDiff(indexing_threshold=reindex_config['bulk_indexing_threshold'])
+        custom_sharding = sharding.get('shard_key_field') is not None and not is_local_client(self._client)
         self._client.create_collection(
-            collection_name=collection_name,
-            vectors_config=self._client.get_fastembed_vector_params(),
-            sparse_vectors_config=self._client.get_fastembed_sparse_vector_params(), 
-            on_disk_payload=True
+            collection_name=physical_name,
+            vectors_config=vectors_config,
+            sparse_vectors_config=sparse_vectors_config, 
+            optimizers_config=optimizers_config,
+            on_disk_payload=True,
+            shard_number=sharding.get('shard_number'),
+            sharding_method=models.ShardingMethod.CUSTOM if custom_sharding else None,
+            replication_factor=sharding.get('replication_factor'),
+            write_consistency_factor=sharding.get('write_consistency_factor')
         )
-        self.collections_input_files[collection_name] = []
-        self._save_collections()
+        return collection_late_interaction_model
+    
+    def create_collection(
+        self,
+        collection_name: str,
+        late_interaction: bool = False,
+        sparse_top_k: int = sparse_index_config['document_top_k'],
+        sparse_min_weight: float = sparse_index_config['document_min_weight'],
+        sparse_on_disk: bool = sparse_index_config['on_disk'],
+        idf_modifier: bool = sparse_index_config['idf_modifier'],
+        normalize_metadata: bool = config['ingestion']['normalize_metadata'],
+        shard_number: int = sharding_config['shard_number'],
+        replication_factor: int = sharding_config['replication_factor'],
+        write_consistency_factor: int = sharding_config['write_consistency_factor'],
+        shard_key_field: str = sharding_config['shard_key_field']
+    ):
+        """Create a new Qdrant collection.
+        the collection name is an alias of the physical collection <collection_name>__v1,
+        so it can later be reindexed without downtime (see reindex_collection).
+        with late_interaction=True the points also get a late interaction (ColBERT)
+        multivector that HybridSearcher uses to rescore the hybrid candidates inside Qdrant.
+        sparse_top_k, sparse_min_weight: pruning of the documents sparse vectors, recorded in the
+        registry so every file added to the collection is pruned the same way.
+        sparse_on_disk: keep the sparse inverted index on disk (mmap) instead of in RAM.
+        idf_modifier: let Qdrant weight the sparse terms by their inverse document frequency.
+        normalize_metadata: store the metadata of every article once in the article store, the points
+        only carry the paragraph and the article id, and HybridSearcher joins the metadata back
+        after the search. the payloads, and what every search transfers and decodes, are smaller.
+        shard_number: the number of shards, they are searched and written in parallel. with a
+        shard_key_field it's the number of shards of every shard key.
+        replication_factor: the copies of every shard, on a cluster they are placed on different nodes.
+        write_consistency_factor: the replicas that have to acknowledge a write.
+        shard_key_field: custom sharding, every value of this metadata field (e.g. league or season)
+        gets its own shards, and searches with shard_keys only query their shards (see HybridSearcher.search).
+        a single node server holds all the shards, the embedded local Qdrant has no sharding and
+        filters on the field instead."""
+        if self._registry.collection_exists(collection_name):
+            raise ValueError(f"Error: collection {collection_name} is already registered.")
+        sharding = validate_sharding(shard_number, replication_factor, write_consistency_factor, shard_key_field)
+        
+        physical_name = physical_collection_name(collection_name, 1)
+        collection_late_interaction_model = self._create_physical_collection(
+            physical_name, late_interaction, sparse_on_disk, idf_modifier, sharding=sharding)
+        try:
+            self.switch_alias(collection_name, physical_name)
+        except Exception:
+            self._client.delete_collection(physical_name)
+            raise
+        self._registry.add_collection(collection_name, self._dense_model, self._sparse_model,
+                                      collection_late_interaction_model, sparse_top_k, sparse_min_weight,
+                                      physical_name=physical_name, version=1, normalized_metadata=normalize_metadata,
+                                      sparse_on_disk=sparse_on_disk, idf_modifier=idf_modifier, **sharding)
         logger.info(f"Created {collection_name} successfully.")
     
+    def _upload_batch(self, collection_name: str, index_dict: Dict[str, List], embeddings: Dict[str, list],
+                      embedding_models: EmbeddingModels, collection_record: Dict, chunk_size: int):
+        """prune the sparse vectors of a batch for the collection and upload it.
+        the late interaction vectors are never stored, they are embedded here when they are missing."""
+        if collection_record['late_interaction_model'] is not None and 'late_interaction' not in embeddings:
+            embeddings = {**embeddings, **embedding_models.embed_documents(
+                index_dict['documents'], batch_size=chunk_size, vectors=('late_interaction',))}
+        embeddings = {**embeddings, 'sparse': prune_sparse_vectors(
+            embeddings['sparse'], collection_record['sparse_top_k'], collection_record['sparse_min_weight'])}
+        metadata = index_dict['metadata']
+        shard_key_field = collection_record['shard_key_field']
+        if shard_key_field is not None:
+            shard_keys = [shard_key_value(meta, shard_key_field) for meta in metadata]
+        if collection_record['normalized_metadata']:
+            metadata = [{ARTICLE_ID_FIELD: key} for key in self._article_store.put_many(metadata)]
+            if shard_key_field is not None:
+                # the local Qdrant filters on the shard key field, so it stays in the payload.
+                metadata = [{**meta, shard_key_field: shard_key} for meta, shard_key in zip(metadata, shard_keys)]
+        points = build_points(index_dict['documents'], metadata, embeddings,
+                              self._client.get_vector_field_name(), self._client.get_sparse_vector_field_name())
+        start_time = time.perf_counter()
+        if shard_key_field is None or is_local_client(self._client):
+            self._client.upload_points(collection_name=collection_name, points=points, batch_size=chunk_size, wait=True)
+        else:
+            points_by_shard_key = {}
+            for point, shard_key in zip(points, shard_keys):
+                points_by_shard_key.setdefault(shard_key, []).append(point)
+            for shard_key, shard_points in points_by_shard_key.items():
+                self._ensure_shard_key(collection_name, shard_key, collection_record)
+                self._client.upload_points(collection_name=collection_name, points=shard_points, batch_size=chunk_size,
+                                           wait=True, shard_key_selector=shard_key)
+        metrics.observe("ingestion.upload", time.perf_counter() - start_time)
+    
+    def _ensure_shard_key(self, collection_name: str, shard_key, collection_record: Dict):
+        """create the shards of a new shard key of a custom sharded collection."""
+        physical_name = self._alias_target(collection_name) or collection_name
+        with self._shard_keys_lock:
+            if shard_key in self._shard_keys.setdefault(physical_name, set()):
+                return
+            try:
+                self._client.create_shard_key(physical_name, shard_key, shards_number=collection_record['shard_number'],
+                                              replication_factor=collection_record['replication_factor'])
+            except Exception as e:
+                # created by an earlier ingestion of the collection.
+                if 'already exists' not in str(e):
+                    raise
+            self._shard_keys[physical_name].add(shard_key)
+    
+    def _upload_stored_embeddings(self, collection_name: str, embedding_key: str, embedding_models: EmbeddingModels,
+                                  collection_record: Dict, chunk_size: int, progress_callback: Callable[[int], None] = None) -> int:
+        """upload the stored vectors of a source file, returns the number of uploaded points."""
+        rows_count = 0
+        for index_dict, embeddings in self._embedding_store.read(embedding_key, ingest_batch_size):
+            self._upload_batch(collection_name, index_dict, embeddings, embedding_models, collection_record, chunk_size)
+            rows_count += len(index_dict['documents'])
+            if progress_callback is not None:
+                progress_callback(len(index_dict['documents']))
+        return rows_count
+    
+    def _ingest_file(self, target_name: str, collection_record: Dict, embedding_models: EmbeddingModels, file_path: str,
+                     text_field: str, metadata_fields: List[str], chunk_size: int,
+                     progress_callback: Callable[[int], None] = None) -> Dict:
+        """embed (or read from the embedding store) and upload one input file, returns its ingest record."""
+        start_time = time.perf_counter()
+        checksum = file_checksum(file_path)
+        embedding_key = EmbeddingStore.embedding_key(checksum, text_field, metadata_fields)
+        
+        if self._embedding_store.exists(embedding_key):
+            rows_count = self._upload_stored_embeddings(target_name, embedding_key, embedding_models,
+                                                        collection_record, chunk_size, progress_callback)
+        else:
+            rows_count = 0
+            with self._embedding_store.writer(embedding_key) as embedding_writer:
+                for batch in iter_input_batches([file_path], [text_field] + metadata_fields, ingest_batch_size):
+                    index_dict = create_index_dict_from_batch(batch, text_field, metadata_fields)
+                    embeddings = embedding_models.embed_documents(index_dict['documents'], batch_size=chunk_size)
+                    embedding_writer.write(index_dict, embeddings)
+                    
+                    self._upload_batch(target_name, index_dict, embeddings, embedding_models,
+                                       collection_record, chunk_size)
+                    rows_count += batch.num_rows
+                    if progress_callback is not None:
+                        progress_callback(batch.num_rows)
+        
+        return {
+            'file_name': Path(file_path).name,
+            'checksum': checksum,
+            'rows_count': rows_count,
+            'points_count': rows_count,
+            'ingest_seconds': time.perf_counter() - start_time,
+            'dense_model': self._dense_model,
+            'sparse_model': self._sparse_model,
+            'embedding_key': embedding_key,
+        }
+    
+    def _copy_stored_file(self, target_name: str, collection_record: Dict, embedding_models: EmbeddingModels,
+                          file_record: Dict, chunk_size: int, progress_callback: Callable[[int], None] = None) -> Dict:
+        """upload an already ingested file from the embedding store, returns its new ingest record."""
+        start_time = time.perf_counter()
+        rows_count = self._upload_stored_embeddings(target_name, file_record['embedding_key'], embedding_models,
+                                                    collection_record, chunk_size, progress_callback)
+        return {
+            'file_name': file_record['file_name'],
+            'checksum': file_record['checksum'],
+            'rows_count': rows_count,
+            'points_count': rows_count,
+            'ingest_seconds': time.perf_counter() - start_time,
+            'dense_model': self._dense_model,
+            'sparse_model': self._sparse_model,
+            'embedding_key': file_record['embedding_key'],
+        }
+    
+    def _check_stored_files(self, file_records: List[Dict]):
+        missing_files = [file_record['file_name'] for file_record in file_records
+                         if not self._embedding_store.exists(file_record['embedding_key'])]
+        if missing_files:
+            raise ValueError(f"Error: the embeddings of {missing_files} are not in the embedding store, "
+                             f"add them to a collection again to store them.")
+    
     def add_data_to_collection(
         self, 
         collection_name: str, 
         input_files: List[str], 
         text_field: str, 
         metadata_fields: List[str], 
-        chunk_size = chunk_size
+        chunk_size = chunk_size,
+        progress_callback: Callable[[int], None] = None
     ):
+        """Embed and upload the input files to the collection, batch by batch.
+        columnar corpus files (.arrow/.feather) are memory mapped instead of parsed.
+        the dense and sparse vectors are kept in the embedding store, a file that was already
+        embedded (with the same fields and models) is uploaded from the store without embedding it again.
+        every file is recorded in the registry with its checksum, counts and timing.
+        progress_callback is called with the number of rows of every uploaded batch,
+        it can stop the ingestion by raising an exception."""
+        collection_record = self._registry.get_collection(collection_name)
+        embedding_models = EmbeddingModels(self._dense_model, self._sparse_model,
+                                           collection_record['late_interaction_model'])
         
-        df = read_and_concatenate(input_files)
-        index_dict = create_index_dict_from_df(df, text_field, metadata_fields)
+        for file_path in input_files:
+            file_record = self._ingest_file(collection_name, collection_record, embedding_models, file_path,
+                                            text_field, metadata_fields, chunk_size, progress_callback)
+            self._registry.record_ingest(collection_name, **file_record)
+            logger.info(f"Added {file_record['file_name']} successfully.")
+    
+    def rebuild_collection(self, source_collection_name: str, collection_name: str, chunk_size=chunk_size, **collection_kwargs):
+        """
+        Create a new collection with the points of an existing one, uploaded from the embedding store
+        instead of embedding the corpus again, e.g. to try other index or pruning settings.
         
-        self._client.add(
-            collection_name=collection_name,
-            documents=index_dict['documents'],
-            metadata=index_dict['metadata'],
-            batch_size=chunk_size
-        )  
-        files_names = [file_path.split('/')[-1] for file_path in input_files]
+        Parameters
+        ----------
+        source_collection_name : the registered collection to copy, all of its files must be in the embedding store.
+        collection_name : the name of the new collection.
+        **collection_kwargs : the settings of the new collection, see create_collection.
+            the new collection has the late interaction vectors, normalized metadata, sharding and sparse index
+            settings of the source unless they are given.
+        """
+        source_record = self._registry.get_collection(source_collection_name)
+        source_files = self._registry.get_ingest_history(source_collection_name)
+        self._check_stored_files(source_files)
+        
+        collection_kwargs.setdefault('late_interaction', source_record['late_interaction_model'] is not None)
+        collection_kwargs.setdefault('normalize_metadata', bool(source_record['normalized_metadata']))
+        for setting in SHARDING_SETTINGS:
+            collection_kwargs.setdefault(setting, source_record[setting])
+        for setting in SPARSE_INDEX_SETTINGS:
+            if source_record[setting] is not None:
+                collection_kwargs.setdefault(setting, bool(source_record[setting]))
+        self.create_collection(collection_name, **collection_kwargs)
+        collection_record = self._registry.get_collection(collection_name)
+        embedding_models = EmbeddingModels(self._dense_model, self._sparse_model,
+                                           collection_record['late_interaction_model'])
+        
+        for file_record in source_files:
+            new_file_record = self._copy_stored_file(collection_name, collection_record, embedding_models, file_record, chunk_size)
+            self._registry.record_ingest(collection_name, **new_file_record)
+        logger.info(f"Rebuilt {source_collection_name} as {collection_name} from the embedding store.")
+    
+    def _versions(self, collection_name: str) -> List[Tuple[int, str]]:
+        "(version, physical name) of every physical collection of a collection, oldest first."
+        versions = []
+        for description in self._client.get_collections().collections:
+            versioned = VERSIONED_COLLECTION_NAME.fullmatch(description.name)
+            if versioned and versioned.group('name') == collection_name:
+                versions.append((int(versioned.group('version')), description.name))
+        return sorted(versions)
+    
+    def _alias_target(self, collection_name: str) -> str:
+        "the physical collection an alias points to, or None if the name isn't an alias."
+        for alias in self._client.get_aliases().aliases:
+            if alias.alias_name == collection_name:
+                return alias.collection_name
+        return None
+    
+    def next_version(self, collection_name: str) -> int:
+        versions = [version for version, _ in self._versions(collection_name)]
+        return max(versions, default=0) + 1
+    
+    def switch_alias(self, collection_name: str, physical_name: str):
+        """
+        point the collection name to another physical collection, the alias is
+        deleted and created in a single atomic operation, so queries never fail.
+        a collection that was created before aliases is deleted right before its
+        alias is created, the only moment its name doesn't resolve.
+        """
+        operations = [models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=physical_name, alias_name=collection_name))]
+        if self._alias_target(collection_name) is not None:
+            operations.insert(0, models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=collection_name)))
+        elif self._client.collection_exists(collection_name):
+            self._client.delete_collection(collection_name)
+        self._client.update_collection_aliases(change_aliases_operations=operations)
+    
+    def garbage_collect_versions(self, collection_name: str, keep_versions: int = reindex_config['keep_versions']):
+        """delete the physical versions of a collection that its alias doesn't point to,
+        except the newest keep_versions of them (to switch back to)."""
+        active = self._alias_target(collection_name)
+        inactive = [physical_name for _, physical_name in self._versions(collection_name) if physical_name != active]
+        if keep_versions:
+            inactive = inactive[:-keep_versions]
+        for physical_name in inactive:
+            self._client.delete_collection(physical_name)
+            logger.info(f"Deleted the old version {physical_name} of {collection_name}.")
+    
+    def _wait_for_index(self, physical_name: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._client.get_collection(physical_name).status == models.CollectionStatus.GREEN:
+                return
+            time.sleep(1)
+        logger.warning(f"{physical_name} is still indexing after {timeout} seconds, switching to it anyway.")
+    
+    def reindex_collection(
+        self,
+        collection_name: str,
+        input_files: List[str] = None,
+        text_field: str = 'paragraph_text',
+        metadata_fields: List[str] = None,
+        chunk_size = chunk_size,
+        progress_callback: Callable[[int], None] = None,
+        sparse_on_disk: bool = None,
+        idf_modifier: bool = None
+    ):
+        """
+        Blue/green reindex: build a new physical version of the collection next to the live one,
+        then switch the collection alias to it and delete the old versions.
+        queries keep using the old version until the switch, and the bulk upload doesn't build the
+        HNSW graph (indexing_threshold from reindex.bulk_indexing_threshold) so it doesn't compete
+        with them for the optimizer, the indexing threshold is restored after the upload and the
+        switch waits (up to reindex.index_wait_seconds) for the index to be built.
+        
+        Parameters
+        ----------
+        collection_name : the registered collection to reindex.
+        input_files : the files of the new version, the defult is the current files from the embedding store.
+        text_field, metadata_fields : see add_data_to_collection, only used with input_files.
+        sparse_on_disk, idf_modifier : the sparse index settings of the new version, see create_collection.
+            by default the ones the collection was created with (the sparse_index config for the
+            collections registered before they were recorded).
+        
+        the points ingested into the live version while the new one is built would be lost at the switch,
+        so the ingestion jobs don't run next to a reindex job (see CollectionRegistry.create_job).
+        """
+        collection_record = self._registry.get_collection(collection_name)
+        sparse_index = {'sparse_on_disk': sparse_on_disk, 'idf_modifier': idf_modifier}
+        for setting, config_key in (('sparse_on_disk', 'on_disk'), ('idf_modifier', 'idf_modifier')):
+            if sparse_index[setting] is None:
+                stored = collection_record[setting]
+                sparse_index[setting] = bool(stored) if stored is not None else sparse_index_config[config_key]
+        current_files = self._registry.get_ingest_history(collection_name)
+        if input_files is None:
+            self._check_stored_files(current_files)
+        
+        version = self.next_version(collection_name)
+        physical_name = physical_collection_name(collection_name, version)
+        self._create_physical_collection(physical_name, collection_record['late_interaction_model'] is not None,
+                                         sparse_index['sparse_on_disk'], sparse_index['idf_modifier'], bulk_load=True,
+                                         sharding={setting: collection_record[setting] for setting in SHARDING_SETTINGS})
+        embedding_models = EmbeddingModels(self._dense_model, self._sparse_model,
+                                           collection_record['late_interaction_model'])
+        try:
+            if input_files is None:
+                file_records = [self._copy_stored_file(physical_name, collection_record, embedding_models, file_record,
+                                                       chunk_size, progress_callback) for file_record in current_files]
+            else:
+                file_records = [self._ingest_file(physical_name, collection_record, embedding_models, file_path,
+                                                  text_field, metadata_fields or [], chunk_size, progress_callback)
+                                for file_path in input_files]
+            
+            self._client.update_collection(
+                collection_name=physical_name,
+                optimizers_config=models.OptimizersConfigDiff(indexing_threshold=reindex_config['indexing_threshold']))
+            self._wait_for_index(physical_name, reindex_config['index_wait_seconds'])
+            self.switch_alias(collection_name, physical_name)
+        except BaseException:
+            self._client.delete_collection(physical_name)
+            raise
         
-        self.collections_input_files[collection_name].extend(files_names)
-        self._save_collections()
-        logger.info(f"Added {files_names} successfully.")
+        self._registry.switch_collection_version(collection_name, physical_name, version, file_records, **sparse_index)
+        logger.info(f"Switched {collection_name} to {physical_name}.")
+        self.garbage_collect_versions(collection_name)
     
     def delete_collection(self, collection_name: str):
-        """Delete a collection and its associated files."""
-        del self.collections_input_files[collection_name]
-        self._client.delete_collection(collection_name=collection_name)
-        self._save_collections()
+        """Delete a collection, its alias and all of its physical versions, and its associated files."""
+        if self._alias_target(collection_name) is not None:
+            self._client.update_collection_aliases(change_aliases_operations=[
+                models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=collection_name))])
+            for _, physical_name in self._versions(collection_name):
+                self._client.delete_collection(physical_name)
+        else:
+            self._client.delete_collection(collection_name=collection_name)
+        self._registry.remove_collection(collection_name)
         logger.info(f"Deleted {collection_name} successfully.")
         
     def get_collections(self) -> List[str]:
         """Retrieve all collection names."""
-        return list(self.collections_input_files.keys())
+        return self._registry.get_collections()
     
     def get_collection_files(self, collection_name: str) -> List[str]:
         """Get input files for a specific collection."""
-        return self.collections_input_files[collection_name]
+        return self._registry.get_collection_files(collection_name)
+    
+    def get_collection_info(self, collection_name: str) -> Dict:
+        """Get the registry record of a collection together with its ingest history."""
+        collection_info = self._registry.get_collection(collection_name)
+        collection_info['files'] = self._registry.get_ingest_history(collection_name)
+        return collection_info
+    
+    def set_collection_group(self, group_name: str, collection_names: List[str]):
+        """Define a group of collections that HybridSearcher searches together under the group name."""
+        self._registry.set_group(group_name, collection_names)
     
+    def delete_collection_group(self, group_name: str):
+        self._registry.remove_group(group_name)
+    
+    def get_collection_groups(self) -> Dict[str, List[str]]:
+        return self._registry.get_groups()
+    
+    def rebuild_registry(self):
+        """Rebuild the registry from the collections that exist in Qdrant."""
+        self._client.set_model(self._dense_model, **fastembed_kwargs())
+        self._client.set_sparse_model(self._sparse_model, **fastembed_kwargs())
+        vector_models = {self._client.get_vector_field_name(): self._dense_model,
+                         self._client.get_sparse_vector_field_name(): self._sparse_model}
+        self._registry.rebuild_from_qdrant(self._client, vector_models, late_interaction_model)
             
         
 
-co = cohere.ClientV2(api_key=os.environ['COHERE_API_KEY'])
+# replay mode never creates the cohere client, so it needs no API key (see src/llm_providers/recording.py).
+co = create_reranker(lambda: cohere.ClientV2(api_key=os.environ['COHERE_API_KEY']))
+
+def normalize_query(query: str) -> str:
+    "the query in lower case with collapsed whitespace, used to detect identical questions."
+    return ' '.join(query.lower().split()) if isinstance(query, str) else query
+
+# the per collection queries of the federated searches of the process.
+_federation_executor = ThreadPoolExecutor(max_workers=federation_config['max_workers'], thread_name_prefix="federated-search")
+
+def merge_normalized_results(collection_names: List[str], results: List[Tuple[List[Dict], List[float]]],
+                             limit: int) -> Tuple[List[Dict], List[float]]:
+    """
+    merge the (answers, scores) of several collections into the top limit answers.
+    the raw scores of different collections are not comparable (the fusion scores depend on
+    the ranks, and the corpora differ), so the scores of every collection are min-max normalized
+    first: its best answer gets 1 and its worst 0 (a single answer, or equal scores, get 1).
+    every answer gets the name of its collection in its metadata.
+    """
+    merged = []
+    for collection_name, (answers, scores) in zip(collection_names, results):
+        if not scores:
+            continue
+        best, worst = max(scores), min(scores)
+        for answer, score in zip(answers, scores):
+            normalized_score = (score - worst) / (best - worst) if best > worst else 1.0
+            answer['metadata']['collection'] = collection_name
+            merged.append((normalized_score, answer))
+    merged.sort(key=lambda item: item[0], reverse=True)
+    merged = merged[:limit]
+    return [answer for _, answer in merged], [score for score, _ in merged]
 
 class HybridSearcher ():
+    # shared by all the searchers of the process, so identical in flight requests are coalesced.
+    _single_flight = SingleFlight("qa_chain")
+    _admission = AdmissionController(
+        max_concurrent=qos_config['max_concurrent'],
+        max_queue=qos_config['max_queue'],
+        queue_timeout=qos_config['queue_timeout_seconds'],
+        retry_after=qos_config['retry_after_seconds']
+    )
+    
+    def __init__(self):
+        self._registry = CollectionRegistry(registry_path)
+        article_store.load()
+    
+    def _collection_record(self, collection_name: str) -> Optional[Dict]:
+        """the registry record of the collection, None if it's not registered.
+        a request reads it once (see request_cache), so its searches see a single version of the collection."""
+        cache = request_cache()
+        key = ('collection_record', collection_name)
+        if cache is not None and key in cache:
+            return cache[key]
+        try:
+            record = self._registry.get_collection(collection_name)
+        except KeyError:
+            record = None
+        if cache is not None:
+            cache[key] = record
+        return record
     
+    def _late_interaction_model(self, collection_name: str):
+        "the late interaction model of the collection, None if it has no late interaction vectors."
+        record = self._collection_record(collection_name)
+        return record['late_interaction_model'] if record is not None else None
+    
+    def _shard_key_field(self, collection_name: str):
+        "the payload field the collection is custom sharded by, None if it isn't."
+        record = self._collection_record(collection_name)
+        return record['shard_key_field'] if record is not None else None
+    
+    def _normalized_metadata(self, collection_name: str) -> bool:
+        "whether the points of the collection reference their article instead of carrying its metadata."
+        record = self._collection_record(collection_name)
+        return bool(record['normalized_metadata']) if record is not None else False
+    
+    def _embed_query(self, query: str, retrieval_mode: str, late_interaction_model_name: str = None) -> Dict[str, object]:
+        "only the query vectors the retrieval mode needs are computed."
+        vectors = {'dense': ('dense',), 'sparse': ('sparse',)}.get(retrieval_mode, ('dense', 'sparse', 'late_interaction'))
+        return EmbeddingModels(dense_model, sparse_model, late_interaction_model_name).embed_query(
+            query, vectors, sparse_index_config['query_top_k'], sparse_index_config['query_min_weight'])
+    
+    def _query_points(self, collection_name: str, query_embeddings: Dict[str, object], search_limit: int,
+                      retrieval_mode: str, timeout: int = None, shard_keys: List = None,
+                      fusion: models.Fusion = models.Fusion.RRF) -> List[models.ScoredPoint]:
+        """
+        one Qdrant query per retrieval mode:
+            dense / sparse - a single vector search.
+            hybrid - the dense and sparse candidates are fused inside Qdrant, with RRF by default.
+            hybrid_rerank - the same as hybrid, and for collections with late interaction vectors
+                the fused candidates are rescored by MaxSim over the multivectors.
+        fusion: RRF scores only depend on the ranks, DBSF sums the normalized dense and sparse
+            scores so the fused scores keep the gaps of the raw scores (see _retrieve_contexts).
+        shard_keys: for custom sharded collections only their shards are queried, the local
+            Qdrant filters on the shard key field instead. other collections ignore them.
+        """
+        late_interaction_model_name = None
+        if retrieval_mode == 'hybrid_rerank' and 'late_interaction' in query_embeddings:
+            late_interaction_model_name = self._late_interaction_model(collection_name)
+        
+        shard_key_field = self._shard_key_field(collection_name) if shard_keys else None
+        query_filter, shard_key_selector = None, None
+        if shard_key_field is not None and is_local_client(client):
+            query_filter = models.Filter(must=[models.FieldCondition(key=shard_key_field,
+                                                                     match=models.MatchAny(any=list(shard_keys)))])
+        elif shard_key_field is not None:
+            shard_key_selector = list(shard_keys)
+        
+        dense_vector_name = client.get_vector_field_name()
+        sparse_vector_name = client.get_sparse_vector_field_name()
+        
+        if retrieval_mode == 'dense':
+            query_kwargs = {'query': query_embeddings['dense'], 'using': dense_vector_name}
+        elif retrieval_mode == 'sparse':
+            query_kwargs = {'query': query_embeddings['sparse'], 'using': sparse_vector_name}
+        else:
+            prefetch_limit = search_limit
+            if late_interaction_model_name is not None:
+                prefetch_limit = max(qdrant_config['late_interaction_prefetch_limit'], search_limit)
+            hybrid_prefetch = [
+                models.Prefetch(query=query_embeddings['dense'], using=dense_vector_name, limit=prefetch_limit,
+                                filter=query_filter),
+                models.Prefetch(query=query_embeddings['sparse'], using=sparse_vector_name, limit=prefetch_limit,
+                                filter=query_filter),
+            ]
+            query_kwargs = {'prefetch': hybrid_prefetch, 'query': models.FusionQuery(fusion=fusion)}
+            if late_interaction_model_name is not None:
+                query_kwargs = {
+                    'prefetch': models.Prefetch(limit=prefetch_limit, **query_kwargs),
+                    'query': query_embeddings['late_interaction'],
+                    'using': LATE_INTERACTION_VECTOR_NAME,
+                }
+        
+        response = client.query_points(
+            collection_name=collection_name,
+            limit=search_limit,
+            with_payload=True,
+            timeout=timeout,
+            query_filter=query_filter,
+            shard_key_selector=shard_key_selector,
+            **query_kwargs
+        )
+        return response.points
     
-    def search(self, collection_name: str, query: str, search_limit=qdrant_config['search_limit']) -> List[Dict[str, List[str]]]:
-        " query the Qdrant collection and return the top answers based on the limit."
+    def search(self, collection_name: str, query: str, search_limit=qdrant_config['search_limit'], timeout: int = None,
+               retrieval_mode: str = 'hybrid_rerank', shard_keys: List = None) -> List[Dict[str, List[str]]]:
+        return self.search_with_scores(collection_name, query, search_limit, timeout, retrieval_mode, shard_keys)[0]
+    
+    def search_with_scores(self, collection_name: str, query: str, search_limit=qdrant_config['search_limit'],
+                           timeout: int = None, retrieval_mode: str = 'hybrid_rerank',
+                           shard_keys: List = None, fusion: models.Fusion = models.Fusion.RRF) -> Tuple[List[Dict], List[float]]:
+        """ query the Qdrant collection and return the top answers based on the limit.
+        collection_name is the registered name, an alias of the collection's current physical
+        version, so a reindex switches the searches atomically.
+        timeout: seconds Qdrant may spend on the query.
+        retrieval_mode: 'sparse', 'dense', 'hybrid' or 'hybrid_rerank' (see _query_points).
+        fusion: the fusion of the dense and sparse candidates in the hybrid modes (see _query_points).
+        shard_keys: only search these shard keys (e.g. leagues or seasons) of a custom sharded collection.
+        the answers of collections with normalized metadata get their article's metadata from the article store.
+        search returns the answers, search_with_scores returns them with their Qdrant scores
+        (the fusion scores for the hybrid modes), in descending order."""
         if not isinstance(collection_name, str):
             raise ValueError (f"Error: collection_name should be a string, but got {type(collection_name).__name__}.")
         if not isinstance(query, str):
             raise ValueError (f"Error: query should be a string, but got {type(query).__name__}.")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError (f"Error: retrieval_mode should be one of {RETRIEVAL_MODES}, but got {retrieval_mode}.")
         
-        search_result = client.query(
-        collection_name=collection_name,
-        query_text=query,
-        query_filter=None,  
-        limit=search_limit,  
-        )
+        late_interaction_model_name = None
+        if retrieval_mode == 'hybrid_rerank':
+            late_interaction_model_name = self._late_interaction_model(collection_name)
+        query_embeddings = self._embed_query(query, retrieval_mode, late_interaction_model_name)
+        return self._search_collection(collection_name, query_embeddings, search_limit, timeout, retrieval_mode,
+                                       shard_keys, fusion)
+    
+    def _search_collection(self, collection_name: str, query_embeddings: Dict[str, object], search_limit: int,
+                           timeout: int, retrieval_mode: str, shard_keys: List = None,
+                           fusion: models.Fusion = models.Fusion.RRF) -> Tuple[List[Dict], List[float]]:
+        start_time = time.perf_counter()
+        points = self._query_points(collection_name, query_embeddings, search_limit, retrieval_mode, timeout,
+                                    shard_keys, fusion)
+        metrics.observe(f"retrieval.{retrieval_mode}.search", time.perf_counter() - start_time)
+        retrieved_answers = [point.payload for point in points]
         
+        if self._normalized_metadata(collection_name):
+            start_time = time.perf_counter()
+            retrieved_answers = article_store.join(retrieved_answers)
+            metrics.observe("retrieval.article_join", time.perf_counter() - start_time)
         
-        retrieved_answers = [hit.metadata for hit in search_result]
         # organize retrieved context to only two keys: document and metadata.
         retrieved_answers = [convert_search_dict_to_index_dict(item) for item in retrieved_answers]
         
-        return retrieved_answers    
+        return retrieved_answers, [point.score for point in points]
+    
+    def resolve_collections(self, collection_name: Union[str, List[str]]) -> List[str]:
+        """the collections to search: a list of collections, a group defined in the registry
+        (see CollectionRegistry.set_group) or a single collection."""
+        if isinstance(collection_name, (list, tuple)):
+            if not collection_name:
+                raise ValueError("Error: the list of collections is empty.")
+            return list(dict.fromkeys(collection_name))
+        if isinstance(collection_name, str) and self._collection_record(collection_name) is None:
+            try:
+                return self._registry.get_group(collection_name)
+            except KeyError:
+                pass
+        return [collection_name]
+    
+    def federated_search(self, collection_names: List[str], query: str, search_limit=qdrant_config['search_limit'],
+                         timeout: int = None, retrieval_mode: str = 'hybrid_rerank',
+                         shard_keys: List = None, fusion: models.Fusion = models.Fusion.RRF) -> Tuple[List[Dict], List[float]]:
+        """
+        search several collections at once, the query is embedded once and the collections are
+        queried concurrently, one Qdrant query each. the answers are merged by their normalized
+        scores (see merge_normalized_results) and tagged with their collection in the metadata.
+        a single collection is the same as search_with_scores.
+        """
+        if len(collection_names) == 1:
+            return self.search_with_scores(collection_names[0], query, search_limit, timeout, retrieval_mode,
+                                           shard_keys, fusion)
+        self._check_federated_search(collection_names, query, retrieval_mode)
+        query_embeddings = self._embed_federated_query(collection_names, query, retrieval_mode)
+        return self._federated_query(collection_names, query_embeddings, search_limit, timeout, retrieval_mode,
+                                     shard_keys, fusion)
+    
+    def _check_federated_search(self, collection_names: List[str], query: str, retrieval_mode: str):
+        for collection_name in collection_names:
+            if not isinstance(collection_name, str):
+                raise ValueError (f"Error: collection_name should be a string, but got {type(collection_name).__name__}.")
+        if not isinstance(query, str):
+            raise ValueError (f"Error: query should be a string, but got {type(query).__name__}.")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError (f"Error: retrieval_mode should be one of {RETRIEVAL_MODES}, but got {retrieval_mode}.")
+    
+    def _embed_federated_query(self, collection_names: List[str], query: str, retrieval_mode: str) -> Dict[str, object]:
+        "the query vectors of the collections, the late interaction one is from the first collection that has it."
+        late_interaction_model_name = None
+        if retrieval_mode == 'hybrid_rerank':
+            late_interaction_models = [self._late_interaction_model(name) for name in collection_names]
+            late_interaction_model_name = next((model for model in late_interaction_models if model is not None), None)
+        return self._embed_query(query, retrieval_mode, late_interaction_model_name)
+    
+    def _federated_query(self, collection_names: List[str], query_embeddings: Dict[str, object], search_limit: int,
+                         timeout: int, retrieval_mode: str, shard_keys: List = None,
+                         fusion: models.Fusion = models.Fusion.RRF) -> Tuple[List[Dict], List[float]]:
+        "the federated search of an embedded query (see federated_search)."
+        if len(collection_names) == 1:
+            return self._search_collection(collection_names[0], query_embeddings, search_limit, timeout,
+                                           retrieval_mode, shard_keys, fusion)
+        start_time = time.perf_counter()
+        # every task runs in a copy of the request context, so its stage timings are the request's.
+        futures = [_federation_executor.submit(contextvars.copy_context().run, self._search_collection, collection_name,
+                                               query_embeddings, search_limit, timeout, retrieval_mode, shard_keys, fusion)
+                   for collection_name in collection_names]
+        results = [future.result() for future in futures]
+        metrics.observe("retrieval.federated.search", time.perf_counter() - start_time)
+        return merge_normalized_results(collection_names, results, search_limit)
     
+    def resolve_retrieval_mode(self, query: str, retrieval_mode: str = None) -> str:
+        """the configured mode when retrieval_mode is None, and the router's choice when it's 'auto'."""
+        retrieval_mode = retrieval_mode or qdrant_config['retrieval_mode']
+        if retrieval_mode == 'auto':
+            retrieval_mode = select_retrieval_mode(query, config['retrieval_router'])
+            metrics.increment(f"retrieval.auto.{retrieval_mode}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError (f"Error: retrieval_mode should be 'auto' or one of {RETRIEVAL_MODES}, but got {retrieval_mode}.")
+        return retrieval_mode
         
-    def search_with_rerank(self, collection_name: str, query: str, reranker_limit = qdrant_config['reranker_limit']) -> List[str]:
+    def search_with_rerank(self, collection_name: Union[str, List[str]], query: str, reranker_limit = qdrant_config['reranker_limit'],
+                           deadline: Deadline = None, retrieval_mode: str = None, shard_keys: List = None) -> List[str]:
         """
         Parameters
         ----------
+        collection_name: a collection, a list of collections or a group of collections from the registry,
+            several collections are searched together (see federated_search) and reranked once.
         query: the query that has been asked in the serach function.
+        deadline: the time budget of the request, when it's running low the search limit is
+            reduced and the rerank is skipped (or abandoned on timeout) in favour of the fusion order.
+        retrieval_mode: 'sparse', 'dense', 'hybrid', 'hybrid_rerank' or 'auto', the default is
+            qdrant.retrieval_mode from the config. only hybrid_rerank uses a reranker, the other
+            modes return the top reranker_limit search results.
+        shard_keys: only search these shard keys of the custom sharded collections (see search).
         
         Returns
         -------
         rellevant_contexts: List
-        the top 5 paragraphs sorted in a descending oreder based
+        the top reranker_limit paragraphs sorted in a descending oreder based
         on the score of the cohere's rerank-v3.5 reranking model.
+        the number of fused candidates that are reranked adapts to the query: it stops at the first
+        clear gap in the DBSF fusion scores, and only when the first qdrant.search_limit candidates
+        are flat the search goes on to qdrant.rerank_max_candidates.
+        collections with late interaction vectors are already rescored inside Qdrant,
+        so unless late_interaction_rerank is disabled the external reranker is skipped.
         """
+        collection_names = self.resolve_collections(collection_name)
+        retrieval_mode = self.resolve_retrieval_mode(query, retrieval_mode)
+        metrics.increment(f"retrieval.mode.{retrieval_mode}")
+        start_time = time.perf_counter()
+        contexts = self._retrieve_contexts(collection_names, query, reranker_limit, deadline, retrieval_mode, shard_keys)
+        metrics.observe(f"retrieval.{retrieval_mode}.total", time.perf_counter() - start_time)
+        return contexts
+    
+    def _retrieve_contexts(self, collection_names: List[str], query: str, reranker_limit: int, deadline: Deadline,
+                           retrieval_mode: str, shard_keys: List = None) -> List[str]:
+        max_candidates = qdrant_config['rerank_max_candidates']
+        search_timeout = None
+        if deadline is not None:
+            if deadline.remaining() < qos_config['reduce_search_below_seconds']:
+                max_candidates = min(max_candidates, qos_config['reduced_search_limit'])
+                metrics.increment("qa_chain.degraded.reduced_search_limit")
+            search_timeout = max(1, math.ceil(deadline.stage_budget('search')))
         
-        raw_contexts = self.search(collection_name,query)
+        rescored_in_qdrant = (qdrant_config['late_interaction_rerank']
+                              and all(self._late_interaction_model(name) is not None for name in collection_names))
+        if retrieval_mode != 'hybrid_rerank' or rescored_in_qdrant:
+            contexts, _ = self.federated_search(collection_names, query, search_limit=reranker_limit, timeout=search_timeout,
+                                                retrieval_mode=retrieval_mode, shard_keys=shard_keys)
+            return [str(context).replace('\\' , "") for context in contexts]
         
-        documents_for_rerank = []
-        for context in raw_contexts:
-            document_str = str(context)
-            document_str = document_str.replace('\\' , "")
-            documents_for_rerank.append(document_str)
-            
-       
-        response = co.rerank(
-            model=qdrant_config['reranker'],
-            query="What is the capital of the United States?",
-            documents=documents_for_rerank,
-            top_n=5,
-        )
+        # the candidates are fused with DBSF: RRF scores only depend on the ranks, so their gaps say
+        # nothing about the query. only the candidates above the first clear gap are reranked (see
+        # candidate_depth), and the deeper search is only run when the first candidates are flat.
+        self._check_federated_search(collection_names, query, retrieval_mode)
+        start_time = time.perf_counter()
+        query_embeddings = self._embed_federated_query(collection_names, query, retrieval_mode)
+        search_limit = min(qdrant_config['search_limit'], max_candidates)
+        raw_contexts, scores = self._federated_query(collection_names, query_embeddings, search_limit, search_timeout,
+                                                     retrieval_mode, shard_keys, models.Fusion.DBSF)
+        depth = candidate_depth(scores, reranker_limit, search_limit, qdrant_config['rerank_gap_ratio'])
+        if depth == search_limit < max_candidates:
+            metrics.increment("qa_chain.rerank.deep_search")
+            raw_contexts, scores = self._federated_query(collection_names, query_embeddings, max_candidates, search_timeout,
+                                                         retrieval_mode, shard_keys, models.Fusion.DBSF)
+            depth = candidate_depth(scores, reranker_limit, max_candidates, qdrant_config['rerank_gap_ratio'])
+        metrics.observe("qa_chain.search", time.perf_counter() - start_time)
+        candidates = [str(context).replace('\\' , "") for context in raw_contexts[:depth]]
+        metrics.increment("qa_chain.rerank.candidates", depth)
         
-        reranked_docs = []
-        for result in response.results:
-            doc_string = documents_for_rerank[result.index].replace('\\' , "")
-            reranked_docs.append(doc_string)
+        request_options = None
+        if deadline is not None:
+            if deadline.remaining() < qos_config['skip_rerank_below_seconds']:
+                metrics.increment("qa_chain.degraded.skipped_rerank")
+                return candidates[:reranker_limit]
+            request_options = {"timeout_in_seconds": deadline.stage_budget('rerank')}
         
+        # the reranker only scores the passages, cut to max_tokens_per_doc words here and to as many tokens by Cohere.
+        max_tokens_per_doc = qdrant_config['rerank_max_tokens_per_doc']
+        documents_for_rerank = [rerank_text(context['document'], max_tokens_per_doc) for context in raw_contexts[:depth]]
+        start_time = time.perf_counter()
+        try:
+            response = co.rerank(
+                model=qdrant_config['reranker'],
+                query=query,
+                documents=documents_for_rerank,
+                top_n=reranker_limit,
+                max_tokens_per_doc=max_tokens_per_doc,
+                request_options=request_options,
+            )
+        except httpx.TimeoutException:
+            if deadline is None:
+                raise
+            logger.warning("The rerank timed out, using the fusion order instead.")
+            metrics.increment("qa_chain.degraded.rerank_timeout")
+            return candidates[:reranker_limit]
+        metrics.observe("qa_chain.rerank", time.perf_counter() - start_time)
         
-        return reranked_docs    
-            
-      
+        return [candidates[result.index] for result in response.results]
     
-    def QA_chain (self, collection_name: str, query: str, **kwargs) -> Dict[str, str]:
+    def QA_chain (self, collection_name: Union[str, List[str]], query: str, retrieval_mode: str = None, shard_keys: List = None,
+                  **kwargs) -> Dict[str, str]:
         """
         Parameters
         ----------
-        collection_name : str
-            the name of the rellevant Qdrant collection.
+        collection_name : str or List[str]
+            the name of the rellevant Qdrant collection, a list of collections or a group of
+            collections from the registry, searched together with a single rerank and generation.
         query : str
             the question you want to ask.
+        retrieval_mode : str
+            'sparse', 'dense', 'hybrid', 'hybrid_rerank' or 'auto' (see search_with_rerank),
+            the default is qdrant.retrieval_mode from the config.
+        shard_keys : list
+            only search these shard keys (e.g. leagues) of the custom sharded collections.
         **kwargs: dict, available keys:
             - prompt: instructions to help the llm to provide a quality answer.
             - model: the llm that will be used to generate the answer.
@@ -200,10 +945,15 @@ class HybridSearcher ():
         Returns
         -------
         qa_dict : Dict
-            contains 3 keys: query - the same query from the input.
+            contains 4 keys: query - the same query from the input.
             context - the context that helped the llm to answer the query.
             answer - the answer that the llm generated.
-
+            retrieval_mode - the mode that retrieved the context.
+        
+        concurrent requests with the same collection, normalized query, retrieval mode, shard keys, provider,
+        model and prompt share one execution of the pipeline (see SingleFlight).
+        every execution has to be admitted by the admission controller (raises OverloadedError)
+        and has to finish within qos.deadline_seconds (raises DeadlineExceeded).
         """
         # Access openai configuration from YAML
         updated_config = update_section_with_kwargs(llm_config, **kwargs)
@@ -211,17 +961,40 @@ class HybridSearcher ():
         provider = updated_config['provider']
         prompt = updated_config['prompt']
         model = updated_config['model']
-        llm_client = LLMClient(provider, model)
         
-        contexts = self.search_with_rerank(collection_name, query)
+        retrieval_mode = self.resolve_retrieval_mode(query, retrieval_mode)
+        collection_names = self.resolve_collections(collection_name)
+        
+        metrics.increment("qa_chain.requests")
+        deadline = Deadline(qos_config['deadline_seconds'], qos_config['stage_shares'])
+        shard_keys = list(shard_keys) if shard_keys else None
+        key = (tuple(collection_names), normalize_query(query), retrieval_mode, tuple(shard_keys or ()), provider, model, prompt)
+        qa_dict = self._single_flight.do(key, self._run_qa_chain, collection_names, query, provider, model, prompt, deadline,
+                                         retrieval_mode, shard_keys)
+        
+        return {**qa_dict, 'question': query}
+    
+    def _run_qa_chain(self, collection_names: List[str], query: str, provider: str, model: str, prompt: str, deadline: Deadline,
+                      retrieval_mode: str, shard_keys: List = None) -> Dict[str, str]:
+        with self._admission.admit(deadline):
+            return self._answer(collection_names, query, provider, model, prompt, deadline, retrieval_mode, shard_keys)
+    
+    def _answer(self, collection_names: List[str], query: str, provider: str, model: str, prompt: str, deadline: Deadline,
+                retrieval_mode: str, shard_keys: List = None) -> Dict[str, str]:
+        llm_client = LLMClient(provider, model, hedge_config=llm_config['hedge'])
+        
+        contexts = self.search_with_rerank(collection_names, query, deadline=deadline, retrieval_mode=retrieval_mode,
+                                           shard_keys=shard_keys)
         
     
         messages = [{"role": "system", "content": prompt},
                    {"role": "user", "content": "Question: " + query},
                    {"role": "user", "content": contexts}]
         
-        response = llm_client.generate_response(messages)
-        qa_dict = {'question': query, 'context': contexts, 'answer': response}
+        start_time = time.perf_counter()
+        response = llm_client.generate_response(messages, timeout=deadline.stage_budget('generate'))
+        metrics.observe("qa_chain.generate", time.perf_counter() - start_time)
+        qa_dict = {'question': query, 'context': contexts, 'answer': response, 'retrieval_mode': retrieval_mode}
         
         return qa_dict
         
@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+
+import yaml
+from qdrant_client import QdrantClient
+from qdrant_client.local.qdrant_local import QdrantLocal
+
+current_file = Path(__file__)
+repo_root = current_file.resolve().parent.parent
+config_path = repo_root / "config.yaml"
+
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+qdrant_config = config['qdrant']
+
+TRANSPORTS = ('rest', 'grpc', 'local')
+
+transport = os.getenv("QDRANT_TRANSPORT", qdrant_config['transport'])
+client_url = os.getenv("QDRANT_URL", qdrant_config['client'])
+local_path = os.getenv("QDRANT_LOCAL_PATH", qdrant_config['local_path'])
+
+
+def create_qdrant_client(transport: str = transport, url: str = client_url, local_path: str = local_path) -> QdrantClient:
+    """
+    Parameters
+    ----------
+    transport :
+        rest - JSON over HTTP to url.
+        grpc - protobuf over a single HTTP/2 channel to the gRPC port of the same host, the channel
+            is kept alive and shared by every thread that uses the client. calls that have no gRPC
+            endpoint (e.g. snapshots downloads) still go over REST.
+        local - an embedded in-process Qdrant, stored in local_path or in memory when it's ':memory:'.
+            it's meant for small single node deployments and tests, only one process can open a path.
+    url : the Qdrant server, for rest and grpc.
+    local_path : the storage directory of the local mode, relative to the repo root.
+    """
+    if transport == 'rest':
+        return QdrantClient(url=url)
+    if transport == 'grpc':
+        return QdrantClient(
+            url=url,
+            grpc_port=qdrant_config['grpc_port'],
+            prefer_grpc=True,
+            grpc_options={
+                'grpc.keepalive_time_ms': qdrant_config['grpc_keepalive_ms'],
+                'grpc.keepalive_permit_without_calls': 1,
+            },
+        )
+    if transport == 'local':
+        location = local_path if local_path == ':memory:' else str(repo_root / local_path)
+        # gunicorn threads and the in-process ingestion jobs share the local client.
+        if location == ':memory:':
+            return QdrantClient(location=location, force_disable_check_same_thread=True)
+        return QdrantClient(path=location, force_disable_check_same_thread=True)
+    raise ValueError(f"Error: the Qdrant transport should be one of {TRANSPORTS}, but got {transport}.")
+
+
+def is_local_transport() -> bool:
+    "the embedded Qdrant lives in this process, so other processes can't use it."
+    return transport == 'local'
+
+
+def is_local_client(qdrant_client: QdrantClient) -> bool:
+    "the client is an embedded Qdrant, which ignores the sharding settings and has no shard keys."
+    return isinstance(qdrant_client._client, QdrantLocal)
@@ -0,0 +1,82 @@
+import re
+from typing import Dict, List
+
+RETRIEVAL_MODES = ('sparse', 'dense', 'hybrid', 'hybrid_rerank')
+
+_QUESTION_WORDS = {'who', 'what', 'when', 'where', 'why', 'how', 'which', 'whom', 'whose',
+                   'is', 'are', 'was', 'were', 'did', 'does', 'do', 'can', 'could', 'should', 'will'}
+_TOKEN = re.compile(r"[\w'-]+")
+
+
+def query_features(query: str) -> Dict[str, float]:
+    """
+    Parameters
+    ----------
+    query : the question of the user.
+
+    Returns
+    -------
+    features : Dict
+        tokens - number of word tokens.
+        entity_share - share of the tokens that look like named entities (capitalized
+            words that don't open the query, numbers, or words in quotes).
+        is_question - the query opens with a question word or ends with a question mark.
+    """
+    tokens = _TOKEN.findall(query)
+    quoted = set(_TOKEN.findall(' '.join(re.findall(r'"([^"]+)"', query))))
+    entities = [token for i, token in enumerate(tokens)
+                if (i > 0 and token[0].isupper()) or token[0].isdigit() or token in quoted]
+
+    return {
+        'tokens': len(tokens),
+        'entity_share': len(entities) / len(tokens) if tokens else 0.0,
+        'is_question': bool(tokens) and (tokens[0].lower() in _QUESTION_WORDS or query.strip().endswith('?')),
+    }
+
+
+def select_retrieval_mode(query: str, router_config: dict) -> str:
+    """
+    picks the cheapest retrieval mode that should be good enough for the query:
+        sparse - keyword lookups and entity heavy queries, SPLADE matches names and numbers exactly.
+        dense - short natural language questions without entities.
+        hybrid_rerank - long or complex questions, where the precise ranking pays off.
+        hybrid - everything else.
+    router_config keys: keyword_max_tokens, sparse_entity_share, dense_max_tokens, rerank_min_tokens.
+    """
+    features = query_features(query)
+
+    if features['tokens'] <= router_config['keyword_max_tokens'] and not features['is_question']:
+        return 'sparse'
+    if features['entity_share'] >= router_config['sparse_entity_share']:
+        return 'sparse'
+    if features['tokens'] >= router_config['rerank_min_tokens']:
+        return 'hybrid_rerank'
+    if features['entity_share'] == 0 and features['tokens'] <= router_config['dense_max_tokens']:
+        return 'dense'
+    return 'hybrid'
+
+
+def candidate_depth(scores: List[float], min_depth: int, max_depth: int, gap_ratio: float) -> int:
+    """
+    how many of the candidates (sorted by their fusion score) are worth reranking.
+    the candidates are cut at the first score gap that is at least gap_ratio times the mean gap
+    between consecutive scores (but not before min_depth): a clear group of winners stops the
+    depth early, while flat scores (no such gap) keep every candidate up to max_depth.
+    """
+    scores = scores[:max_depth]
+    if len(scores) <= min_depth:
+        return len(scores)
+    spread = scores[0] - scores[-1]
+    if spread <= 0:
+        return len(scores)
+    mean_gap = spread / (len(scores) - 1)
+    for depth in range(1, len(scores)):
+        if scores[depth - 1] - scores[depth] >= gap_ratio * mean_gap:
+            return max(depth, min_depth)
+    return len(scores)
+
+
+def rerank_text(document: str, max_tokens: int) -> str:
+    "the passage cut to its first max_tokens words, a word is at least one reranker token."
+    words = document.split()
+    return ' '.join(words[:max_tokens]) if len(words) > max_tokens else document
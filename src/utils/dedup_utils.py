@@ -0,0 +1,138 @@
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_NON_WORD = re.compile(r'\W+')
+
+
+def normalize_text(text: str) -> str:
+    "lowercase the text and collapse punctuation and whitespace, so trivial edits hash the same."
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def _false_positive_area(threshold: float, bands: int, rows: int) -> float:
+    x = np.linspace(0, threshold, 100)
+    return float(np.mean(1 - (1 - x ** rows) ** bands)) * threshold
+
+
+def _false_negative_area(threshold: float, bands: int, rows: int) -> float:
+    x = np.linspace(threshold, 1, 100)
+    return float(np.mean((1 - x ** rows) ** bands)) * (1 - threshold)
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    choose the number of LSH bands and rows per band that minimize the
+    false positive and false negative probability around the threshold.
+    """
+    best, best_error = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        max_rows = num_perm // bands
+        for rows in range(1, max_rows + 1):
+            error = (_false_positive_area(threshold, bands, rows)
+                     + _false_negative_area(threshold, bands, rows))
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashDeduplicator:
+    """
+    Streaming near-duplicate detector based on MinHash signatures and LSH banding.
+
+    Only the signatures of the kept paragraphs are stored (num_perm * 4 bytes each),
+    and every new paragraph is compared only to the kept paragraphs that share an
+    LSH bucket with it, so the cost grows linearly with the corpus size.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Error: threshold should be in (0, 1], but got {threshold}.")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[int, np.ndarray] = {}
+
+    def _shingles(self, text: str) -> set:
+        words = normalize_text(text).split()
+        if len(words) <= self.shingle_size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        "the MinHash signature of the text as a uint32 array of length num_perm."
+        shingles = self._shingles(text)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key: int, text: str) -> Tuple[int, float]:
+        """
+        Parameters
+        ----------
+        key : unique id of the paragraph (e.g. the df index).
+        text : the paragraph text.
+
+        Returns
+        -------
+        (duplicate_of, similarity) : the key of the kept paragraph this text duplicates
+        and their estimated jaccard similarity, or (None, 0.0) if the text was kept.
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+
+        checked = set()
+        for band, band_key in enumerate(band_keys):
+            for candidate in self._buckets[band].get(band_key, []):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    return candidate, similarity
+
+        self._signatures[key] = signature
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return None, 0.0
+
+
+def find_near_duplicates(texts: pd.Series, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    texts : pd.Series of paragraphs, the index is used to identify them.
+    threshold: the estimated jaccard similarity above which a paragraph is a near duplicate.
+    num_perm: number of MinHash permutations, more permutations are more accurate but slower.
+    shingle_size: number of words in every shingle.
+
+    Returns
+    -------
+    duplicates_df : pd.DataFrame indexed like texts, contains only the near duplicates
+    with the columns duplicate_of (index of the first kept paragraph) and similarity.
+    """
+    deduplicator = MinHashDeduplicator(threshold, num_perm, shingle_size)
+
+    records = {}
+    for key, text in texts.items():
+        duplicate_of, similarity = deduplicator.add(key, text)
+        if duplicate_of is not None:
+            records[key] = (duplicate_of, similarity)
+
+    duplicates_df = pd.DataFrame.from_dict(records, orient='index', columns=['duplicate_of', 'similarity'])
+    return duplicates_df
@@ -0,0 +1,69 @@
+import hashlib
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from src.utils.metrics import metrics
+from src.utils.sqlite_store import SqliteStore, parameter_chunks
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, kind, text_hash)
+);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache(SqliteStore):
+    """
+    Content addressed cache of the vectors of a remote embedding model, keyed by the model,
+    the kind of text ('document' or 'query', providers embed them differently) and the sha256
+    of the text, so the same corpus is embedded once across runs.
+    stored in SQLite in WAL mode, so parallel processes (e.g. the test set shards) can share it.
+    """
+
+    def __init__(self, db_path, busy_timeout=30):
+        super().__init__(db_path, busy_timeout)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._connection().executescript(_SCHEMA)
+
+    def get_many(self, model: str, kind: str, texts: List[str]) -> List[Optional[List[float]]]:
+        "the cached vector of every text, None for the texts that are not cached."
+        hashes = [text_hash(text) for text in texts]
+        cached = {}
+        conn = self._connection()
+        for chunk in parameter_chunks(hashes):
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                f"AND text_hash IN ({', '.join('?' * len(chunk))})", (model, kind, *chunk))
+            cached.update({row[0]: np.frombuffer(row[1], dtype=np.float32).tolist() for row in rows})
+
+        vectors = [cached.get(key) for key in hashes]
+        hits = sum(vector is not None for vector in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        metrics.increment("embedding_cache.hits", hits)
+        metrics.increment("embedding_cache.misses", len(vectors) - hits)
+        return vectors
+
+    def put_many(self, model: str, kind: str, texts: List[str], vectors: List[List[float]]):
+        rows = [(model, kind, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes())
+                for text, vector in zip(texts, vectors)]
+        with self._write() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (model, kind, text_hash, vector) VALUES (?, ?, ?, ?)", rows)
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return self.hits / lookups if lookups else 0.0
@@ -1,6 +1,12 @@
+import random
 import pandas as pd
 from llama_index.core import Document 
-from typing import List, Dict
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from typing import List, Dict, Tuple
+
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.utility_functions import iter_input_batches
 
 def create_document_from_row (row, text_field: str, metadata_fields: List[str]) -> Document:
     """
@@ -32,3 +38,115 @@ def docs_list_from_df(df, text_field: str, metadata_fields: List[str], chunk_siz
     
     return docs_list
 
+def docs_list_from_files(file_paths: List[str], text_field: str, metadata_fields: List[str]) -> List[Document]:
+    """
+    create the llama index docs straight from the record batches of the input files,
+    columnar corpus files (.arrow/.feather) are memory mapped instead of parsed.
+    """
+    docs_list = []
+    for batch in iter_input_batches(file_paths, [text_field] + metadata_fields):
+        texts = batch.column(text_field).to_pylist()
+        metadata = batch.select(metadata_fields).to_pylist()
+        docs_list.extend(Document(text=text, metadata=meta) for text, meta in zip(texts, metadata))
+    
+    return docs_list
+
+def stratified_docs_from_files(file_paths: List[str], text_field: str, metadata_fields: List[str],
+                               strata_fields: List[str], docs_per_stratum: int, seed: int = 0) -> Dict[Tuple, List[Document]]:
+    """
+    stream the record batches of all the input files and keep a uniform sample (reservoir) of up to
+    docs_per_stratum paragraphs of every stratum, e.g. of every article with strata_fields=['title'],
+    so long articles don't crowd out the short ones and the memory is bounded by the number of strata.
+    
+    Returns
+    -------
+    strata : Dict, the values of the strata_fields -> the sampled llama index docs, in their corpus order.
+    """
+    rng = random.Random(seed)
+    columns = list(dict.fromkeys([text_field] + metadata_fields + strata_fields))
+    reservoirs: Dict[Tuple, List[Tuple[int, str, dict]]] = {}
+    seen: Dict[Tuple, int] = {}
+    position = 0
+    for batch in iter_input_batches(file_paths, columns):
+        texts = batch.column(text_field).to_pylist()
+        metadata = batch.select(metadata_fields).to_pylist()
+        strata_values = batch.select(strata_fields).to_pylist()
+        for text, meta, stratum_values in zip(texts, metadata, strata_values):
+            position += 1
+            if not text:
+                continue
+            stratum = tuple(stratum_values[field] for field in strata_fields)
+            reservoir = reservoirs.setdefault(stratum, [])
+            seen[stratum] = seen.get(stratum, 0) + 1
+            if len(reservoir) < docs_per_stratum:
+                reservoir.append((position, text, meta))
+            else:
+                replaced = rng.randrange(seen[stratum])
+                if replaced < docs_per_stratum:
+                    reservoir[replaced] = (position, text, meta)
+    
+    return {stratum: [Document(text=text, metadata=meta) for _, text, meta in sorted(reservoir, key=lambda item: item[0])]
+            for stratum, reservoir in reservoirs.items()}
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    llama index embedding model that looks up the vectors of a remote model in an EmbeddingCache
+    before calling it, only the texts that are not cached are sent to the provider.
+    """
+    _embedding: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    
+    def __init__(self, embedding: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(model_name=embedding.model_name, embed_batch_size=embedding.embed_batch_size, **kwargs)
+        self._embedding = embedding
+        self._cache = cache
+    
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+    
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+    
+    def _cached(self, kind: str, texts: List[str]) -> Tuple[List, List[int]]:
+        vectors = self._cache.get_many(self.model_name, kind, texts)
+        return vectors, [i for i, vector in enumerate(vectors) if vector is None]
+    
+    def _store(self, kind: str, texts: List[str], vectors: List, missing: List[int], embedded: List) -> List[List[float]]:
+        self._cache.put_many(self.model_name, kind, [texts[i] for i in missing], embedded)
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        return vectors
+    
+    def _get_query_embedding(self, query: str) -> List[float]:
+        vectors, missing = self._cached('query', [query])
+        if missing:
+            return self._store('query', [query], vectors, missing, [self._embedding.get_query_embedding(query)])[0]
+        return vectors[0]
+    
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        vectors, missing = self._cached('query', [query])
+        if missing:
+            return self._store('query', [query], vectors, missing, [await self._embedding.aget_query_embedding(query)])[0]
+        return vectors[0]
+    
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+    
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._cached('document', texts)
+        if missing:
+            embedded = self._embedding.get_text_embedding_batch([texts[i] for i in missing])
+            vectors = self._store('document', texts, vectors, missing, embedded)
+        return vectors
+    
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+    
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._cached('document', texts)
+        if missing:
+            embedded = await self._embedding.aget_text_embedding_batch([texts[i] for i in missing])
+            vectors = self._store('document', texts, vectors, missing, embedded)
+        return vectors
@@ -1,16 +1,171 @@
+"""
+The logging pipeline shared by the service, the ingestion and the evaluation.
+
+The threads that log only resolve the message and enqueue the record (a full queue drops it
+and counts logging.dropped), a background listener thread formats the records and writes them
+to the rotating log file and the console, so a slow disk doesn't add to the request latency.
+
+With the json format every record is one compact json line with the time, level, logger,
+message, the id of the request it was logged in and the extra fields passed to the logger
+(e.g. the stage timings of the request log line). The records at or below sampled_level are
+kept with probability sample_rate, the decision is made once per request so a sampled request
+keeps all its lines, warnings and errors are always kept.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+import yaml
+
+from src.utils.metrics import metrics
+from src.utils.request_context import current_request_id
+
+current_file = Path(__file__)
+repo_root = current_file.resolve().parent.parent.parent
+config_path = repo_root / "config.yaml"
+
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+
+logging_config = config['logging']
+
+LOG_FORMATS = ('json', 'text')
+
+# the attributes every LogRecord has, the others were passed in extra.
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'request_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        entry.update({key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class RequestSamplingFilter(logging.Filter):
+    """
+    Adds the id of the current request to the record, and drops the records at or below
+    sampled_level of the requests that are not sampled.
+    runs in the logging thread, since the request context is only known there.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, sampled_level: int = logging.INFO):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_level = sampled_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        if self.sample_rate >= 1.0 or record.levelno > self.sampled_level:
+            return True
+        if record.request_id is None:
+            return random.random() < self.sample_rate
+        # the same request id always gets the same decision.
+        return zlib.crc32(record.request_id.encode('utf-8')) / 2 ** 32 < self.sample_rate
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Enqueues the records without blocking and without formatting them, the formatting is left
+    to the listener thread. a record that doesn't fit in the queue is dropped.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the message arguments may change after the call returns, so the message is resolved here.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("logging.dropped")
+
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def _output_handlers():
+    if os.getenv("LOG_FORMAT", logging_config['format']) == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    file_handler = RotatingFileHandler(logging_config['file'], maxBytes=logging_config['max_bytes'],
+                                       backupCount=logging_config['backup_count'])
+    handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_listener():
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, *_output_handlers(), respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    "writes the queued records and stops the listener, at exit."
+    if _listener is not None and _listener._thread is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass
+
+
+def _restart_after_fork():
+    # the listener thread doesn't survive a fork (e.g. the gunicorn workers), and the queue may
+    # have been locked by another thread at the fork.
+    if _queue_handler is not None:
+        _queue_handler.queue = queue.Queue(maxsize=logging_config['queue_size'])
+        _start_listener()
+
+
+def _configure():
+    global _queue_handler
+    log_format = os.getenv("LOG_FORMAT", logging_config['format'])
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Error: the log format should be one of {LOG_FORMATS}, but got {log_format}.")
+
+    _queue_handler = BoundedQueueHandler(queue.Queue(maxsize=logging_config['queue_size']))
+    _queue_handler.addFilter(RequestSamplingFilter(
+        sample_rate=float(os.getenv("LOG_SAMPLE_RATE", logging_config['sample_rate'])),
+        sampled_level=logging.getLevelName(logging_config['sampled_level']),
+    ))
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.getenv("LOG_LEVEL", logging_config['level']))
+    root_logger.addHandler(_queue_handler)
+
+    _start_listener()
+    atexit.register(_stop_listener)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
 
 def get_logger():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            RotatingFileHandler(
-                "pipeline.log", 
-                maxBytes=5 * 1024 * 1024,  # 5 MB
-            ),
-            logging.StreamHandler()
-        ]
-    )
-    return logging.getLogger("shared_logger")
\ No newline at end of file
+    "the shared logger, the pipeline is set up on the first call."
+    with _lock:
+        if _queue_handler is None:
+            _configure()
+    return logging.getLogger("shared_logger")
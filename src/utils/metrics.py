@@ -0,0 +1,65 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+import numpy as np
+
+from src.utils.request_context import record_stage
+
+
+class MetricsRegistry:
+    """
+    Thread safe in-process counters and latency summaries.
+    Latencies keep only the last `window` observations of every name, so the
+    percentiles describe the recent traffic and the memory stays bounded.
+    """
+
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._latency_counts: Dict[str, int] = defaultdict(int)
+        self._latency_totals: Dict[str, float] = defaultdict(float)
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float):
+        "also adds the seconds to the stage timings of the current request (see request_context)."
+        record_stage(name, seconds)
+        with self._lock:
+            self._latencies[name].append(seconds)
+            self._latency_counts[name] += 1
+            self._latency_totals[name] += seconds
+
+    def reset(self):
+        """forget everything observed so far, e.g. the warm up requests of a load test."""
+        with self._lock:
+            self._counters.clear()
+            self._latencies.clear()
+            self._latency_counts.clear()
+            self._latency_totals.clear()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """the counters, and the count, total seconds, mean and percentiles (in ms) of every latency."""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = {name: (list(values), self._latency_counts[name], self._latency_totals[name])
+                         for name, values in self._latencies.items()}
+
+        summaries = {}
+        for name, (values, count, total) in latencies.items():
+            values_ms = np.array(values) * 1000
+            summaries[name] = {
+                'count': count,
+                'total_seconds': total,
+                'mean_ms': float(values_ms.mean()),
+                'p50_ms': float(np.percentile(values_ms, 50)),
+                'p95_ms': float(np.percentile(values_ms, 95)),
+                'p99_ms': float(np.percentile(values_ms, 99)),
+            }
+        return {'counters': counters, 'latencies': summaries}
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,87 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has no time left for its next stage."""
+
+
+class OverloadedError(Exception):
+    """Raised when a request is not admitted, the client should retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """
+    The time budget of one request, split between its stages by their shares.
+    A stage gets its share of whatever is left when it starts, so time that an
+    earlier stage didn't use is passed on to the later stages.
+    """
+
+    def __init__(self, seconds: float, stage_shares: Dict[str, float]):
+        self.seconds = seconds
+        self._expires_at = time.monotonic() + seconds
+        self._stages: List[str] = list(stage_shares.keys())
+        self._shares = stage_shares
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_budget(self, stage: str) -> float:
+        """the seconds this stage may use, raises DeadlineExceeded if nothing is left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"The request deadline of {self.seconds}s expired before the {stage} stage.")
+        later_shares = sum(self._shares[name] for name in self._stages[self._stages.index(stage):])
+        return remaining * self._shares[stage] / later_shares
+
+
+class AdmissionController:
+    """
+    Bounds the number of pipelines that run at the same time and the number of requests
+    that wait for a slot. When the queue is full, or a request waits longer than
+    queue_timeout, it's rejected with OverloadedError instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._retry_after = retry_after
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    @contextmanager
+    def admit(self, deadline: Deadline = None):
+        with self._lock:
+            if self._waiting >= self._max_queue:
+                raise OverloadedError("The server is overloaded, the admission queue is full.", self._retry_after)
+            self._waiting += 1
+
+        timeout = self._queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        try:
+            admitted = self._slots.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not admitted:
+            raise OverloadedError("The server is overloaded, no pipeline slot was free in time.", self._retry_after)
+
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def waiting(self) -> int:
+        with self._lock:
+            return self._waiting
@@ -0,0 +1,45 @@
+import contextvars
+import uuid
+from typing import Dict, Optional
+
+# the id and the stage timings of the request the current thread is serving, None outside of requests.
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar('stages', default=None)
+_cache: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('request_cache', default=None)
+
+
+def start_request(request_id: str = None) -> str:
+    "start the context of a request in the current thread, returns its id (a new one if not given)."
+    request_id = request_id or uuid.uuid4().hex
+    _request_id.set(request_id)
+    _stages.set({})
+    _cache.set({})
+    return request_id
+
+
+def end_request():
+    _request_id.set(None)
+    _stages.set(None)
+    _cache.set(None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def record_stage(name: str, seconds: float):
+    "add the seconds of a stage to the current request, does nothing outside of requests."
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def stage_timings() -> Dict[str, float]:
+    "the stages of the current request, in milliseconds."
+    return {name: seconds * 1000 for name, seconds in (_stages.get() or {}).items()}
+
+
+def request_cache() -> Optional[Dict]:
+    """a dict that lives as long as the current request (and is shared by the tasks that run in a
+    copy of its context), None outside of requests."""
+    return _cache.get()
@@ -0,0 +1,58 @@
+import threading
+from typing import Callable, Dict, Hashable
+
+from src.utils.metrics import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) runs
+    the function, and every caller that arrives while it's still running waits for
+    the leader and gets the same result (or exception). Calls are coalesced only
+    while they are in flight, nothing is cached after the leader finishes.
+
+    Counts `<name>.executions` and `<name>.deduplicated` in the metrics registry.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, function: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            metrics.increment(f"{self._name}.deduplicated")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment(f"{self._name}.executions")
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
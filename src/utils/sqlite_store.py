@@ -0,0 +1,60 @@
+"""
+The SQLite plumbing of the stores that threads and processes share (the gunicorn workers, the
+ingest jobs, the evaluation shards): the collection registry, the article store, the embedding
+cache, the RAGAS score cache and the provider recordings.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Sequence
+
+# sqlite limits the number of parameters of a query (999 before 3.32).
+MAX_QUERY_PARAMETERS = 500
+
+
+def parameter_chunks(values: Sequence, size: int = MAX_QUERY_PARAMETERS) -> Iterator[Sequence]:
+    "the values in chunks small enough to be the parameters of a single query."
+    for offset in range(0, len(values), size):
+        yield values[offset:offset + size]
+
+
+class SqliteStore:
+    """
+    Base of the stores kept in a SQLite file in WAL mode: readers never block and are not blocked
+    by the writer, and the writers are serialized by BEGIN IMMEDIATE transactions (see _write).
+    every thread gets its own connection, sqlite connections should not be shared between threads.
+    the file (and its directory) is created on the first connection.
+    """
+
+    def __init__(self, db_path, busy_timeout=30):
+        self._db_path = str(db_path)
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def _configure_connection(self, conn: sqlite3.Connection):
+        "called on every new connection, for the row factory and the pragmas of a store."
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._db_path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._configure_connection(conn)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        "a write transaction, committed when the block exits and rolled back when it raises."
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
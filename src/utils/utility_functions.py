@@ -6,8 +6,13 @@ Created on Tue Jul 23 21:23:19 2024
 @author: aloncohen
 """
 
+import hashlib
 import pandas as pd
-from typing import List, Dict
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import List, Dict, Iterator
+
+COLUMNAR_EXTENSIONS = ('.arrow', '.feather')
 
 def create_index_dict_from_df (docs_df: pd.DataFrame(), text_field: str, metadata_fields: List[str]) -> Dict[str, List[str]]:
     """
@@ -32,6 +37,18 @@ def create_index_dict_from_df (docs_df: pd.DataFrame(), text_field: str, metadat
     
     return index_dict
 
+def create_index_dict_from_batch (batch: pa.RecordBatch, text_field: str, metadata_fields: List[str]) -> Dict[str, List[str]]:
+    """
+    the same as create_index_dict_from_df, but for an arrow record batch
+    from read_corpus_batches, without converting it to pandas first.
+    """
+    documents = batch.column(text_field).to_pylist()
+    metadata = batch.select(metadata_fields).to_pylist()
+    
+    index_dict = {'documents': documents, 'metadata':metadata}
+    
+    return index_dict
+
 def convert_search_dict_to_index_dict (search_dict: dict) -> Dict[str, List[str]]:
     """convert the serach dict that created from quering the qdrant db
     to a dict with the same format as the index dit from create_index_dict_from_df"""
@@ -95,7 +112,9 @@ def read_and_concatenate(file_paths: list) -> pd.DataFrame():
         '.xlsx': pd.read_excel,
         '.xls': pd.read_excel,
         '.html': lambda file_path: pd.read_html(file_path)[0], 
-        '.parquet': pd.read_parquet
+        '.parquet': pd.read_parquet,
+        '.arrow': pd.read_feather,
+        '.feather': pd.read_feather
     }
 
     dataframes = []
@@ -122,6 +141,79 @@ def read_and_concatenate(file_paths: list) -> pd.DataFrame():
 
     return concatenated_df
     
+def write_columnar_corpus(df: pd.DataFrame, output_path: str, dictionary_fields: List[str] = None, batch_size=8192):
+    """
+    write a corpus df to an uncompressed arrow IPC file (.arrow/.feather) that can be memory mapped.
+    
+    Parameters
+    ----------
+    df : corpus df, one row per paragraph (e.g. espn_stories.csv).
+    output_path : path of the output file.
+    dictionary_fields : the columns that repeat for every paragraph of the same article
+        (site, country, title...), they are dictionary encoded so every distinct value is stored once.
+        the defult is all of the string columns except paragraph_text.
+    batch_size: number of rows in every record batch of the file.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    
+    if dictionary_fields is None:
+        dictionary_fields = [field.name for field in table.schema
+                             if (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))
+                             and field.name != 'paragraph_text']
+    
+    for field in dictionary_fields:
+        index = table.schema.get_field_index(field)
+        table = table.set_column(index, field, pc.dictionary_encode(table.column(field)))
+    
+    with pa.OSFile(output_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+
+def read_corpus_batches(file_path: str, columns: List[str] = None, batch_size: int = None) -> Iterator[pa.RecordBatch]:
+    """
+    memory map a columnar corpus file written by write_columnar_corpus and yield its record batches.
+    the batches point directly into the mapped file (zero copy), so only the pages that
+    are actually read are loaded to RAM.
+    
+    Parameters
+    ----------
+    file_path : path to an arrow IPC file (.arrow/.feather).
+    columns : the columns to yield, the defult is all of them.
+    batch_size : max number of rows in every yielded batch, the defult is the batches of the file.
+    """
+    with pa.memory_map(str(file_path), 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            if batch_size is None:
+                yield batch
+            else:
+                for offset in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(offset, batch_size)
+
+def iter_input_batches(file_paths: List[str], columns: List[str], batch_size: int = 8192) -> Iterator[pa.RecordBatch]:
+    """
+    yield record batches with the given columns from a list of dataframe files in different formats.
+    columnar files are memory mapped with read_corpus_batches, the rest are read with read_and_concatenate.
+    """
+    for file_path in file_paths:
+        if str(file_path).endswith(COLUMNAR_EXTENSIONS):
+            yield from read_corpus_batches(file_path, columns, batch_size)
+        else:
+            df = read_and_concatenate([file_path])
+            table = pa.Table.from_pandas(df[columns], preserve_index=False)
+            yield from table.to_batches(max_chunksize=batch_size)
+    
+def file_checksum(file_path: str, chunk_size=1024 * 1024) -> str:
+    "sha256 hex digest of a file, read in chunks so large corpus files are not loaded to memory."
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def update_section_with_kwargs(section_config: dict, **kwargs) -> dict:
     """
     Updates a specific section of the configuration with values from kwargs.
@@ -157,5 +249,6 @@ if __name__ == "__main__":
     df = read_and_concatenate(['../data/espn/espn_stories.csv'])
     text_field = "paragraph_text"
     metadata_fields = ['site', 'country', 'title', 'author', 'content_publish_date']
+    write_columnar_corpus(df, '../data/espn/espn_stories.arrow')
     
      
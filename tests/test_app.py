@@ -0,0 +1,87 @@
+import pytest
+
+try:
+    from src import app as app_module
+except Exception as error:  # the embedding models can't be loaded (e.g. offline).
+    pytest.skip(f"src.app can't be imported: {error}", allow_module_level=True)
+
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+API_KEY = 'test-key'
+
+
+class FakeCollectionManager:
+    def __init__(self, delete_error: Exception = None):
+        self.collections = []
+        self.delete_error = delete_error
+
+    def create_collection(self, collection_name, **kwargs):
+        self.collections.append(collection_name)
+
+    def delete_collection(self, collection_name):
+        if self.delete_error is not None:
+            raise self.delete_error
+        self.collections.remove(collection_name)
+
+    def get_collections(self):
+        return list(self.collections)
+
+
+class FakeIngestionQueue:
+    def resolve_input_file(self, file_name):
+        if file_name != 'espn/espn_stories.csv':
+            raise ValueError(f"input file {file_name} does not exist.")
+        return file_name
+
+    def submit(self, collection_name, input_files, text_field, metadata_fields, reindex=False):
+        return 'job'
+
+    def get_job(self, job_id):
+        return {'job_id': job_id}
+
+    def cancel_collection_jobs(self, collection_name):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('COLLECTIONS_API_KEY', API_KEY)
+    monkeypatch.setattr(app_module, 'collection_manager', FakeCollectionManager())
+    monkeypatch.setattr(app_module, 'ingestion_queue', FakeIngestionQueue())
+    app_module.app.config['RATELIMIT_ENABLED'] = False
+    return app_module.app.test_client()
+
+
+def post_collection(client, **payload):
+    return client.post('/collections', json={'collection_name': 'articles', **payload}, headers={'X-API-Key': API_KEY})
+
+
+@pytest.mark.parametrize('payload', [
+    {'input_files': ['espn/espn_stories.csv'], 'metadata_fields': 'title'},
+    {'input_files': ['missing.csv'], 'metadata_fields': ['title']},
+])
+def test_rejected_ingestion_creates_no_collection(client, payload):
+    assert post_collection(client, **payload).status_code == 400
+    assert app_module.collection_manager.collections == []
+
+    assert post_collection(client, input_files=['espn/espn_stories.csv'], metadata_fields=['title']).status_code == 202
+    assert app_module.collection_manager.collections == ['articles']
+
+
+def test_qdrant_errors_of_a_delete_are_not_500(client, monkeypatch):
+    manager = FakeCollectionManager(delete_error=UnexpectedResponse(500, 'Internal Server Error', b'{}', {}))
+    manager.collections.append('articles')
+    monkeypatch.setattr(app_module, 'collection_manager', manager)
+    assert client.delete('/collections/articles', headers={'X-API-Key': API_KEY}).status_code == 409
+
+
+@pytest.mark.parametrize('payload', [
+    {'collection_name': ['articles', ['nested']]},
+    {'collection_name': {'name': 'articles'}},
+    {'collection_name': 'articles', 'shard_keys': [['nba']]},
+    {'collection_name': 'articles', 'shard_keys': 'nba'},
+])
+def test_unhashable_qa_chain_parameters_are_rejected(client, monkeypatch, payload):
+    monkeypatch.setattr(app_module.searcher, 'QA_chain', lambda *args, **kwargs: pytest.fail("QA_chain was called"))
+    response = client.post('/qa_chain', json={'query': 'who won?', **payload})
+    assert response.status_code == 400
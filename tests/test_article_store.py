@@ -0,0 +1,24 @@
+from src.article_store import ARTICLE_ID_FIELD, ArticleStore, article_id
+
+ARTICLE = {'site': 'espn', 'title': 'Lakers win', 'author': 'a reporter'}
+
+
+def test_article_id_is_derived_from_the_metadata():
+    assert article_id(ARTICLE) == article_id(dict(reversed(list(ARTICLE.items()))))
+    assert article_id(ARTICLE) != article_id({**ARTICLE, 'title': 'Lakers lose'})
+    assert 0 <= article_id(ARTICLE) < 2 ** 63
+
+
+def test_articles_are_stored_once_and_joined(tmp_path):
+    store = ArticleStore(tmp_path / "articles.db")
+    ids = store.put_many([ARTICLE, ARTICLE])
+    assert ids[0] == ids[1]
+    assert store.all_articles() == [ARTICLE]
+
+    # a new store reads the article from SQLite, like another process would.
+    joined = ArticleStore(tmp_path / "articles.db").join([{ARTICLE_ID_FIELD: ids[0], 'document': 'paragraph'}])
+    assert joined == [{'document': 'paragraph', **ARTICLE}]
+
+
+def test_unknown_article_is_empty(tmp_path):
+    assert ArticleStore(tmp_path / "articles.db").get_many([1]) == [{}]
@@ -0,0 +1,148 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+from src.article_store import ARTICLE_ID_FIELD
+from src.collection_registry import CollectionRegistry, physical_collection_name
+
+DENSE_VECTOR = 'fast-bge-small-en'
+SPARSE_VECTOR = 'fast-sparse-splade_pp_en_v1'
+LATE_INTERACTION_VECTOR = 'late-interaction'
+VECTOR_MODELS = {DENSE_VECTOR: 'BAAI/bge-small-en', SPARSE_VECTOR: 'prithivida/Splade_PP_en_v1'}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return CollectionRegistry(tmp_path / "registry.db")
+
+
+def create_qdrant_collection(client: QdrantClient, name: str, late_interaction: bool = False, payload: dict = None):
+    vectors_config = {DENSE_VECTOR: models.VectorParams(size=2, distance=models.Distance.COSINE)}
+    if late_interaction:
+        vectors_config[LATE_INTERACTION_VECTOR] = models.VectorParams(
+            size=2, distance=models.Distance.COSINE,
+            multivector_config=models.MultiVectorConfig(comparator=models.MultiVectorComparator.MAX_SIM))
+    client.create_collection(name, vectors_config=vectors_config,
+                             sparse_vectors_config={SPARSE_VECTOR: models.SparseVectorParams()})
+    if payload is not None:
+        vector = {DENSE_VECTOR: [1.0, 0.0]}
+        if late_interaction:
+            vector[LATE_INTERACTION_VECTOR] = [[1.0, 0.0]]
+        client.upsert(name, [models.PointStruct(id=1, vector=vector, payload=payload)])
+
+
+def test_old_registries_get_the_added_columns(tmp_path):
+    db_path = tmp_path / "registry.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE collections (name TEXT PRIMARY KEY, dense_model TEXT, sparse_model TEXT, "
+                     "points_count INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)")
+        conn.execute("INSERT INTO collections (name, created_at) VALUES ('old', 0)")
+
+    registry = CollectionRegistry(db_path)
+
+    record = registry.get_collection('old')
+    assert record['version'] == 0
+    assert record['normalized_metadata'] == 0
+    assert record['shard_key_field'] is None
+    registry.add_collection('new', shard_number=2, shard_key_field='site')
+    assert registry.get_collection('new')['shard_number'] == 2
+
+
+def test_duplicate_collection_raises(registry):
+    registry.add_collection('articles')
+    with pytest.raises(ValueError):
+        registry.add_collection('articles')
+
+
+def test_rebuild_registers_models_late_interaction_and_normalized_metadata(registry):
+    client = QdrantClient(location=':memory:')
+    physical_name = physical_collection_name('articles', 2)
+    create_qdrant_collection(client, physical_name, late_interaction=True, payload={ARTICLE_ID_FIELD: 7, 'document': 'text'})
+    client.update_collection_aliases(change_aliases_operations=[models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=physical_name, alias_name='articles'))])
+    create_qdrant_collection(client, 'plain', payload={'document': 'text', 'site': 'espn'})
+    # a version without an alias, e.g. an unfinished reindex.
+    create_qdrant_collection(client, physical_collection_name('articles', 3))
+
+    registry.rebuild_from_qdrant(client, VECTOR_MODELS, late_interaction_model='colbert-ir/colbertv2.0')
+
+    assert registry.get_collections() == ['articles', 'plain']
+    articles = registry.get_collection('articles')
+    assert (articles['dense_model'], articles['sparse_model']) == ('BAAI/bge-small-en', 'prithivida/Splade_PP_en_v1')
+    assert articles['late_interaction_model'] == 'colbert-ir/colbertv2.0'
+    assert articles['normalized_metadata'] == 1
+    assert (articles['physical_name'], articles['version'], articles['points_count']) == (physical_name, 2, 1)
+    plain = registry.get_collection('plain')
+    assert plain['late_interaction_model'] is None
+    assert plain['normalized_metadata'] == 0
+
+
+def test_rebuild_keeps_registered_settings_and_removes_missing_collections(registry):
+    client = QdrantClient(location=':memory:')
+    create_qdrant_collection(client, 'articles')
+    registry.add_collection('articles', dense_model='registered-model', sparse_top_k=64)
+    registry.add_collection('deleted')
+    registry.record_ingest('articles', 'articles.csv', points_count=10)
+
+    registry.rebuild_from_qdrant(client, VECTOR_MODELS)
+
+    assert registry.get_collections() == ['articles']
+    articles = registry.get_collection('articles')
+    assert articles['dense_model'] == 'registered-model'
+    assert articles['sparse_model'] == 'prithivida/Splade_PP_en_v1'
+    assert articles['sparse_top_k'] == 64
+    assert articles['points_count'] == 0
+    assert registry.get_collection_files('articles') == ['articles.csv']
+
+
+def test_rebuild_keeps_the_field_name_of_unknown_vectors(registry):
+    client = QdrantClient(location=':memory:')
+    create_qdrant_collection(client, 'articles')
+    registry.rebuild_from_qdrant(client)
+    assert registry.get_collection('articles')['dense_model'] == DENSE_VECTOR
+
+
+def test_custom_shard_key_field_is_the_field_holding_the_shard_key():
+    shards = [SimpleNamespace(shard_key='espn'), SimpleNamespace(shard_key=None)]
+    cluster_info = SimpleNamespace(result=SimpleNamespace(local_shards=shards, remote_shards=[]))
+    client = SimpleNamespace(
+        http=SimpleNamespace(distributed_api=SimpleNamespace(collection_cluster_info=lambda name: cluster_info)),
+        scroll=lambda name, shard_key_selector, **kwargs: (
+            [SimpleNamespace(payload={ARTICLE_ID_FIELD: 7, 'site': shard_key_selector})], None))
+    assert CollectionRegistry._custom_shard_key_field(client, 'articles__v1') == 'site'
+
+
+def test_sparse_index_settings_are_recorded_and_unknown_for_old_collections(registry):
+    registry.add_collection('new', sparse_on_disk=True, idf_modifier=False)
+    registry.add_collection('old')
+    assert (registry.get_collection('new')['sparse_on_disk'], registry.get_collection('new')['idf_modifier']) == (1, 0)
+    assert registry.get_collection('old')['idf_modifier'] is None
+
+    registry.switch_collection_version('new', physical_collection_name('new', 2), 2, [], idf_modifier=True)
+    assert (registry.get_collection('new')['sparse_on_disk'], registry.get_collection('new')['idf_modifier']) == (1, 1)
+
+
+def test_rebuild_recovers_the_idf_modifier(registry):
+    client = QdrantClient(location=':memory:')
+    client.create_collection('articles', vectors_config={DENSE_VECTOR: models.VectorParams(size=2, distance=models.Distance.COSINE)},
+                             sparse_vectors_config={SPARSE_VECTOR: models.SparseVectorParams(modifier=models.Modifier.IDF)})
+    registry.rebuild_from_qdrant(client, VECTOR_MODELS)
+    assert registry.get_collection('articles')['idf_modifier'] == 1
+
+
+def test_reindex_doesnt_run_next_to_other_jobs(registry):
+    registry.add_collection('articles')
+    registry.add_collection('other')
+    registry.create_job('ingest', 'articles', ['a.csv'])
+    with pytest.raises(ValueError):
+        registry.create_job('reindex', 'articles', [], kind='reindex')
+    registry.create_job('other reindex', 'other', [], kind='reindex')
+
+    registry.set_job_status('ingest', 'succeeded')
+    registry.create_job('reindex', 'articles', [], kind='reindex')
+    with pytest.raises(ValueError):
+        registry.create_job('late ingest', 'articles', ['b.csv'])
+    registry.set_job_status('reindex', 'failed')
+    registry.create_job('late ingest', 'articles', ['b.csv'])
@@ -0,0 +1,39 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import QdrantClient
+
+try:
+    from src import collection_snapshots
+except Exception as error:  # the embedding models can't be loaded (e.g. offline).
+    pytest.skip(f"src.collection_snapshots can't be imported: {error}", allow_module_level=True)
+
+
+class LocalBuildClient(QdrantClient):
+    "an in-memory Qdrant, the embedded mode has no snapshot API so the snapshot is faked."
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(location=':memory:')
+
+    def create_snapshot(self, collection_name, wait=True, **kwargs):
+        return SimpleNamespace(name=f"{collection_name}.snapshot")
+
+
+def fake_download(qdrant_url, collection_name, snapshot_name, output_path):
+    output_path.write_bytes(b'snapshot of ' + collection_name.encode('utf-8'))
+
+
+def test_build_starts_from_an_empty_registry(monkeypatch, tmp_path):
+    monkeypatch.setattr(collection_snapshots, 'QdrantClient', LocalBuildClient)
+    monkeypatch.setattr(collection_snapshots, '_download_snapshot', fake_download)
+    monkeypatch.setattr(collection_snapshots.QdrantCollectionManager, 'add_data_to_collection',
+                        lambda self, *args, **kwargs: None)
+
+    # ESPN_articles is in qdrant_collections.json, the build registry must not import it.
+    metadata_path = collection_snapshots.build_snapshot('ESPN_articles', [], 'content', [], output_dir=tmp_path)
+
+    metadata = json.loads(metadata_path.read_text())
+    assert metadata['collection_name'] == 'ESPN_articles'
+    assert metadata['files'] == []
+    assert (tmp_path / metadata['snapshot_file']).exists()
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from src.utils.dedup_utils import MinHashDeduplicator, find_near_duplicates, normalize_text, optimal_bands
+
+PARAGRAPH = ("LeBron James scored 30 points and grabbed 10 rebounds as the Lakers beat the Celtics "
+             "in overtime on Sunday night at Crypto.com Arena in Los Angeles")
+EDITED = PARAGRAPH + " after a late comeback"
+UNRELATED = ("The Chiefs signed their first round pick to a four year contract on Tuesday, "
+             "the team announced before the start of the rookie minicamp in Kansas City")
+
+
+def test_normalize_text_ignores_case_punctuation_and_whitespace():
+    assert normalize_text("  LeBron's   30-point night!! ") == normalize_text("lebron s 30 point night")
+
+
+def test_optimal_bands_fit_the_permutations():
+    bands, rows = optimal_bands(0.8, 128)
+    assert bands * rows <= 128
+
+
+def test_invalid_threshold_raises():
+    with pytest.raises(ValueError):
+        MinHashDeduplicator(threshold=0)
+
+
+def test_exact_duplicate_after_normalization():
+    deduplicator = MinHashDeduplicator(threshold=0.8)
+    assert deduplicator.add(0, PARAGRAPH) == (None, 0.0)
+    duplicate_of, similarity = deduplicator.add(1, PARAGRAPH.upper() + "!")
+    assert (duplicate_of, similarity) == (0, 1.0)
+
+
+def test_near_duplicate_is_detected():
+    deduplicator = MinHashDeduplicator(threshold=0.7)
+    deduplicator.add(0, PARAGRAPH)
+    duplicate_of, similarity = deduplicator.add(1, EDITED)
+    assert duplicate_of == 0
+    assert 0.7 <= similarity < 1.0
+
+
+def test_below_threshold_is_kept():
+    deduplicator = MinHashDeduplicator(threshold=0.95)
+    deduplicator.add(0, PARAGRAPH)
+    assert deduplicator.add(1, EDITED) == (None, 0.0)
+    assert deduplicator.add(2, UNRELATED) == (None, 0.0)
+
+
+def test_find_near_duplicates_reports_the_duplicates_only():
+    texts = pd.Series([PARAGRAPH, UNRELATED, EDITED], index=[10, 11, 12])
+    duplicates_df = find_near_duplicates(texts, threshold=0.7)
+    assert list(duplicates_df.index) == [12]
+    assert duplicates_df.loc[12, 'duplicate_of'] == 10
+    assert 0.7 <= duplicates_df.loc[12, 'similarity'] < 1.0
+
+
+def test_find_near_duplicates_without_duplicates_is_empty():
+    duplicates_df = find_near_duplicates(pd.Series([PARAGRAPH, UNRELATED]))
+    assert duplicates_df.empty
+    assert list(duplicates_df.columns) == ['duplicate_of', 'similarity']
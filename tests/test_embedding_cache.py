@@ -0,0 +1,18 @@
+from src.utils.embedding_cache import EmbeddingCache
+
+
+def test_cached_vectors_are_keyed_by_model_kind_and_text(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.db")
+    cache.put_many('model', 'document', ['first', 'second'], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert cache.get_many('model', 'document', ['first', 'third', 'second']) == [[1.0, 2.0], None, [3.0, 4.0]]
+    assert cache.get_many('model', 'query', ['first']) == [None]
+    assert cache.get_many('other model', 'document', ['first']) == [None]
+    assert cache.hit_rate() == 0.4
+
+
+def test_lookups_larger_than_a_query(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.db")
+    texts = [f"text {i}" for i in range(1200)]
+    cache.put_many('model', 'document', texts, [[float(i)] for i in range(1200)])
+    assert cache.get_many('model', 'document', texts)[-1] == [1199.0]
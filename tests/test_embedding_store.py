@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from qdrant_client import models
+
+from src.embedding_store import EmbeddingStore
+
+
+def batch(documents):
+    index_dict = {'documents': documents, 'metadata': [{'title': document} for document in documents]}
+    embeddings = {
+        'dense': [[float(i), 1.0] for i in range(len(documents))],
+        'sparse': [models.SparseVector(indices=[i], values=[0.5]) for i in range(len(documents))],
+    }
+    return index_dict, embeddings
+
+
+def test_embedding_key_depends_on_the_checksum_and_the_fields():
+    key = EmbeddingStore.embedding_key('abc', 'content', ['title'])
+    assert key == EmbeddingStore.embedding_key('abc', 'content', ['title'])
+    assert key != EmbeddingStore.embedding_key('abd', 'content', ['title'])
+    assert key != EmbeddingStore.embedding_key('abc', 'summary', ['title'])
+    assert key != EmbeddingStore.embedding_key('abc', 'content', ['title', 'author'])
+
+
+def test_stores_are_separated_by_models(tmp_path):
+    key = EmbeddingStore.embedding_key('abc', 'content', [])
+    assert EmbeddingStore(tmp_path, 'dense-a', 'sparse').path(key) != EmbeddingStore(tmp_path, 'dense-b', 'sparse').path(key)
+
+
+def test_written_embeddings_are_read_back(tmp_path):
+    store = EmbeddingStore(tmp_path, 'dense', 'sparse')
+    key = EmbeddingStore.embedding_key('abc', 'content', ['title'])
+    with store.writer(key) as writer:
+        writer.write(*batch(['first', 'second']))
+
+    assert store.exists(key)
+    (index_dict, embeddings), = list(store.read(key))
+    assert index_dict == batch(['first', 'second'])[0]
+    assert embeddings['dense'] == [[0.0, 1.0], [1.0, 1.0]]
+    assert embeddings['sparse'][1] == models.SparseVector(indices=[1], values=[0.5])
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path):
+    store = EmbeddingStore(tmp_path, 'dense', 'sparse')
+    key = EmbeddingStore.embedding_key('abc', 'content', [])
+    with pytest.raises(RuntimeError):
+        with store.writer(key) as writer:
+            writer.write(*batch(['first']))
+            raise RuntimeError("cancelled")
+    assert not store.exists(key)
+    assert not list(store.path(key).parent.glob("*.tmp"))
+
+
+def test_concurrent_writers_of_a_key_dont_share_a_temporary_file(tmp_path):
+    store = EmbeddingStore(tmp_path, 'dense', 'sparse')
+    key = EmbeddingStore.embedding_key('abc', 'content', [])
+    both_writing = threading.Barrier(2)
+    errors = []
+
+    def write():
+        try:
+            with store.writer(key) as writer:
+                both_writing.wait(timeout=5)
+                writer.write(*batch(['first', 'second']))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    (index_dict, _), = list(store.read(key))
+    assert index_dict['documents'] == ['first', 'second']
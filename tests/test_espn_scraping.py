@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("selenium")
+
+from src.espn_scraping import filter_articles_df
+
+PARAGRAPH = ("LeBron James scored 30 points and grabbed 10 rebounds as the Lakers beat the Celtics "
+             "in overtime on Sunday night at Crypto.com Arena in Los Angeles")
+
+
+def articles_df(paragraphs):
+    return pd.DataFrame({'title': 'Lakers beat Celtics', 'paragraph_text': paragraphs},
+                        index=[100 + i for i in range(len(paragraphs))])
+
+
+def test_filters_and_reports_every_dropped_row():
+    df = articles_df([
+        PARAGRAPH,
+        "too short",
+        PARAGRAPH + " • read more",
+        "We use cookies to improve your experience on this site, please accept them to continue",
+        np.nan,
+        PARAGRAPH.upper(),
+        PARAGRAPH + " after a late comeback",
+    ])
+    filtered_df, report_df = filter_articles_df(df, near_duplicate_threshold=0.7, return_report=True)
+
+    # the index is reset, so the report refers to the positions of the input rows.
+    assert list(filtered_df.index) == [0]
+    assert report_df['reason'].to_dict() == {1: 'too_short', 2: 'side_note', 3: 'cookies', 4: 'null_values',
+                                             5: 'exact_duplicate', 6: 'near_duplicate'}
+    assert report_df.loc[5, 'duplicate_of'] == 0 and report_df.loc[5, 'similarity'] == 1.0
+    assert report_df.loc[6, 'duplicate_of'] == 0 and 0.7 <= report_df.loc[6, 'similarity'] < 1.0
+    assert report_df.loc[6, 'paragraph_text'] == df['paragraph_text'].iloc[6]
+
+
+def test_without_report_returns_the_filtered_df_only():
+    filtered_df = filter_articles_df(articles_df([PARAGRAPH, "too short"]), near_duplicate_threshold=None)
+    assert list(filtered_df['paragraph_text']) == [PARAGRAPH]
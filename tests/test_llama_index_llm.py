@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from src.llm_providers import llama_index_llm
+from src.llm_providers.recording import ProviderRecorder
+
+
+def test_replay_needs_no_provider_keys(monkeypatch, tmp_path):
+    recording = ProviderRecorder(tmp_path / "recordings.db", mode='record')
+    recording.save('embedding', {'provider': 'azure_openai', 'model': 'ada', 'input_type': 'query', 'text': 'q'},
+                   [0.1, 0.2], 0.0)
+    recording.save('completion', {'provider': 'azure_openai', 'model': 'judge', 'prompt': 'p', 'formatted': False},
+                   'verdict', 0.0)
+    recording.mode = 'replay'
+    monkeypatch.setattr(llama_index_llm, 'recorder', recording)
+    for name in ('AZURE_OPENAI_API_KEY', 'AZURE_OPENAI_ENDPOINT', 'AZURE_OPENAI_API_VERSION'):
+        monkeypatch.delenv(name, raising=False)
+
+    manager = llama_index_llm.LLMServiceManager("azure_openai", "judge", "ada")
+    embedding = llama_index_llm.RecordingEmbedding(None, 'azure_openai', 'ada', recording)
+    llm = llama_index_llm.RecordingLLM(None, 'azure_openai', 'judge', recording)
+
+    assert manager.get_embedding_model().model_name == 'ada'
+    assert embedding.get_query_embedding('q') == [0.1, 0.2]
+    assert asyncio.run(embedding.aget_query_embedding('q')) == [0.1, 0.2]
+    assert llm.complete('p').text == 'verdict'
+    assert asyncio.run(llm.acomplete('p')).text == 'verdict'
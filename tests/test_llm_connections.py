@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from cohere.core.api_error import ApiError
+
+from src.llm_providers.llm_connections import (CircuitBreaker, CircuitOpenError, HedgedLLMStrategy, LatencyTracker,
+                                               LLMStrategy, is_provider_failure)
+
+
+class FakeStrategy(LLMStrategy):
+    def __init__(self, answer: str, delay: float = 0.0, error: Exception = None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def generate_response(self, messages: list, temperature=0, timeout=None) -> str:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+def open_breaker(breaker: CircuitBreaker, failures: int):
+    for _ in range(failures):
+        breaker.record_failure()
+
+
+def hedged(primary, fallback, primary_breaker=None, fallback_breaker=None, hedge_delay=0.05):
+    return HedgedLLMStrategy(
+        primary, fallback,
+        primary_breaker or CircuitBreaker('primary', failure_threshold=2, reset_timeout=0.05),
+        fallback_breaker or CircuitBreaker('fallback', failure_threshold=2, reset_timeout=0.05),
+        LatencyTracker(), initial_hedge_delay=hedge_delay, min_samples=1000,
+        executor=ThreadPoolExecutor(max_workers=4))
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.allow_request()
+
+
+def test_breaker_failed_trial_opens_again():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+
+def test_released_trial_can_be_taken_again():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_fast_primary_doesnt_hedge():
+    primary, fallback = FakeStrategy('primary'), FakeStrategy('fallback')
+    assert hedged(primary, fallback).generate_response([]) == 'primary'
+    assert fallback.calls == 0
+
+
+def test_slow_primary_is_hedged_to_the_fallback():
+    primary, fallback = FakeStrategy('primary', delay=0.5), FakeStrategy('fallback')
+    assert hedged(primary, fallback).generate_response([], timeout=2) == 'fallback'
+
+
+def test_failed_primary_falls_back():
+    primary, fallback = FakeStrategy('primary', error=ConnectionError('down')), FakeStrategy('fallback')
+    assert hedged(primary, fallback, hedge_delay=5).generate_response([]) == 'fallback'
+
+
+def test_client_errors_are_raised_without_falling_back():
+    primary_breaker = CircuitBreaker('primary', failure_threshold=1, reset_timeout=60)
+    primary, fallback = FakeStrategy('primary', error=ValueError('invalid model')), FakeStrategy('fallback')
+    strategy = hedged(primary, fallback, primary_breaker=primary_breaker, hedge_delay=5)
+    with pytest.raises(ValueError, match='invalid model'):
+        strategy.generate_response([])
+    assert fallback.calls == 0
+    assert primary_breaker.allow_request()
+
+
+@pytest.mark.parametrize('status_code, provider_failure', [(400, False), (404, False), (500, True), (503, True)])
+def test_only_5xx_responses_are_provider_failures(status_code, provider_failure):
+    error = ApiError(status_code=status_code, body={})
+    assert is_provider_failure(error) == provider_failure
+    assert is_provider_failure(httpx.ConnectTimeout('timed out'))
+
+
+def test_primary_win_keeps_the_half_open_fallback_usable():
+    fallback_breaker = CircuitBreaker('fallback', failure_threshold=1, reset_timeout=0.05)
+    open_breaker(fallback_breaker, 1)
+    time.sleep(0.06)
+
+    strategy = hedged(FakeStrategy('primary'), FakeStrategy('fallback'), fallback_breaker=fallback_breaker, hedge_delay=5)
+    assert strategy.generate_response([]) == 'primary'
+    # the fallback was never called, so its trial is still available.
+    assert fallback_breaker.allow_request()
+
+
+def test_open_primary_goes_straight_to_the_fallback():
+    primary_breaker = CircuitBreaker('primary', failure_threshold=1, reset_timeout=60)
+    open_breaker(primary_breaker, 1)
+    primary, fallback = FakeStrategy('primary'), FakeStrategy('fallback')
+    assert hedged(primary, fallback, primary_breaker=primary_breaker).generate_response([]) == 'fallback'
+    assert primary.calls == 0
+
+
+def test_all_breakers_open_raises():
+    primary_breaker = CircuitBreaker('primary', failure_threshold=1, reset_timeout=60)
+    fallback_breaker = CircuitBreaker('fallback', failure_threshold=1, reset_timeout=60)
+    open_breaker(primary_breaker, 1)
+    open_breaker(fallback_breaker, 1)
+    with pytest.raises(CircuitOpenError):
+        hedged(FakeStrategy('primary'), FakeStrategy('fallback'), primary_breaker, fallback_breaker).generate_response([])
+
+
+def test_no_answer_within_the_timeout_raises():
+    primary, fallback = FakeStrategy('primary', delay=0.5), FakeStrategy('fallback', delay=0.5)
+    with pytest.raises(TimeoutError):
+        hedged(primary, fallback, hedge_delay=0.01).generate_response([], timeout=0.1)
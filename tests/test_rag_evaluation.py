@@ -0,0 +1,38 @@
+import math
+
+import pytest
+
+pytest.importorskip("ragas")
+try:
+    from eval.rag_evaluation import ScoreCache
+except Exception as error:  # the judge models need their provider keys (or a replay recording).
+    pytest.skip(f"eval.rag_evaluation can't be imported: {error}", allow_module_level=True)
+
+ROW = {'question': 'who won?', 'answer': 'the Lakers', 'contexts': ['the Lakers won'], 'ground_truth': 'the Lakers'}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ScoreCache(tmp_path / "scores.db", {'eval_llm': 'judge', 'eval_embeddings': 'embedder'})
+
+
+def test_cached_score_is_a_hit(cache):
+    key = cache.score_key('faithfulness', ROW)
+    assert cache.get(key) is None
+    cache.put_many([(key, 'faithfulness', 0.75)])
+    assert cache.get(key) == 0.75
+
+
+def test_changed_row_metric_or_judge_is_a_miss(cache, tmp_path):
+    key = cache.score_key('faithfulness', ROW)
+    cache.put_many([(key, 'faithfulness', 0.75)])
+    assert cache.get(cache.score_key('faithfulness', {**ROW, 'answer': 'the Celtics'})) is None
+    assert cache.get(cache.score_key('answer_correctness', ROW)) is None
+    other_judge = ScoreCache(tmp_path / "scores.db", {'eval_llm': 'other judge', 'eval_embeddings': 'embedder'})
+    assert other_judge.score_key('faithfulness', ROW) != key
+
+
+def test_missing_scores_are_not_cached(cache):
+    key = cache.score_key('faithfulness', ROW)
+    cache.put_many([(key, 'faithfulness', math.nan)])
+    assert cache.get(key) is None
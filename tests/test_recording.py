@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from src.llm_providers.recording import ProviderRecorder, RecordingNotFound
+
+
+def recorder(tmp_path, mode, replay_latency=False):
+    return ProviderRecorder(tmp_path / "recordings.db", mode=mode, replay_latency=replay_latency)
+
+
+def test_replays_the_recorded_response(tmp_path):
+    recorder(tmp_path, 'record').call('completion', {'prompt': 'hi'}, lambda: 'hello')
+    assert recorder(tmp_path, 'replay').call('completion', {'prompt': 'hi'}, lambda: pytest.fail("called")) == 'hello'
+
+
+def test_unrecorded_request_raises(tmp_path):
+    recorder(tmp_path, 'record')
+    with pytest.raises(RecordingNotFound):
+        recorder(tmp_path, 'replay').call('completion', {'prompt': 'hi'}, lambda: 'hello')
+
+
+def test_async_replay_awaits_the_recorded_latency(tmp_path):
+    recorder(tmp_path, 'record').save('completion', {'prompt': 'hi'}, 'hello', latency=0.2)
+    replaying = recorder(tmp_path, 'replay', replay_latency=True)
+
+    async def replay_twice():
+        # both replays wait concurrently, a blocking sleep would take twice the latency.
+        return await asyncio.gather(*(replaying.acall('completion', {'prompt': 'hi'}, None) for _ in range(2)))
+
+    start_time = time.perf_counter()
+    assert asyncio.run(replay_twice()) == ['hello', 'hello']
+    assert time.perf_counter() - start_time < 0.35
+
+
+def test_async_replay_slower_than_the_timeout_times_out(tmp_path):
+    recorder(tmp_path, 'record').save('completion', {'prompt': 'hi'}, 'hello', latency=5)
+    replaying = recorder(tmp_path, 'replay', replay_latency=True)
+    with pytest.raises(TimeoutError):
+        asyncio.run(replaying.acall('completion', {'prompt': 'hi'}, None, timeout=0.01))
+
+
+def test_async_record_saves_the_response(tmp_path):
+    async def provider_call():
+        return 'hello'
+
+    assert asyncio.run(recorder(tmp_path, 'record').acall('completion', {'prompt': 'hi'}, provider_call)) == 'hello'
+    assert recorder(tmp_path, 'replay').load('completion', {'prompt': 'hi'})[0] == 'hello'
@@ -0,0 +1,24 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.request_context import end_request, request_cache, start_request
+
+
+def test_request_cache_lives_as_long_as_the_request():
+    assert request_cache() is None
+    start_request()
+    request_cache()['record'] = 1
+    assert request_cache() == {'record': 1}
+    end_request()
+    assert request_cache() is None
+    start_request()
+    assert request_cache() == {}
+    end_request()
+
+
+def test_tasks_in_a_copy_of_the_context_share_the_cache():
+    start_request()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(contextvars.copy_context().run, lambda: request_cache().update(record=1)).result()
+    assert request_cache() == {'record': 1}
+    end_request()
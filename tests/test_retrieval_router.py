@@ -0,0 +1,84 @@
+import math
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+from src.retrieval_router import candidate_depth, query_features, rerank_text, select_retrieval_mode
+
+ROUTER_CONFIG = {'keyword_max_tokens': 3, 'sparse_entity_share': 0.5, 'dense_max_tokens': 10, 'rerank_min_tokens': 14}
+
+
+@pytest.mark.parametrize('query, mode', [
+    ('lakers trade rumors', 'sparse'),
+    ('Did LeBron James play against Stephen Curry?', 'sparse'),
+    ('who won the game last night', 'dense'),
+    ('how did the Lakers play in the second half of the season', 'hybrid'),
+    ('what did the coach say about the defense after the loss in the last game of the regular season', 'hybrid_rerank'),
+])
+def test_select_retrieval_mode(query, mode):
+    assert select_retrieval_mode(query, ROUTER_CONFIG) == mode
+
+
+def test_query_features():
+    features = query_features('Who scored 30 points for the "Lakers"?')
+    assert features['tokens'] == 7
+    assert features['entity_share'] == pytest.approx(2 / 7)
+    assert features['is_question']
+    assert query_features('')['entity_share'] == 0.0
+
+
+def test_clear_winners_stop_the_depth_early():
+    scores = [0.9, 0.88, 0.87, 0.3, 0.29, 0.28, 0.27, 0.26]
+    assert candidate_depth(scores, min_depth=2, max_depth=8, gap_ratio=2.0) == 3
+
+
+def test_depth_is_at_least_min_depth():
+    scores = [0.9, 0.2, 0.19, 0.18, 0.17, 0.16]
+    assert candidate_depth(scores, min_depth=3, max_depth=6, gap_ratio=2.0) == 3
+
+
+def test_flat_scores_keep_max_depth():
+    scores = [0.5 - 0.01 * i for i in range(20)]
+    assert candidate_depth(scores, min_depth=2, max_depth=10, gap_ratio=2.0) == 10
+    assert candidate_depth([0.5] * 5, min_depth=2, max_depth=10, gap_ratio=2.0) == 5
+
+
+def test_fewer_candidates_than_min_depth():
+    assert candidate_depth([0.9, 0.1], min_depth=5, max_depth=10, gap_ratio=2.0) == 2
+
+
+def fused_scores(angles, weights, fusion):
+    "the scores of a hybrid query (dense and sparse prefetch, fused in Qdrant) over one point per angle and weight."
+    client = QdrantClient(location=':memory:')
+    client.create_collection('articles', vectors_config={'dense': models.VectorParams(size=2, distance=models.Distance.COSINE)},
+                             sparse_vectors_config={'sparse': models.SparseVectorParams()})
+    client.upsert('articles', [
+        models.PointStruct(id=i, vector={'dense': [math.cos(angle), math.sin(angle)],
+                                         'sparse': models.SparseVector(indices=[0], values=[weight])})
+        for i, (angle, weight) in enumerate(zip(angles, weights))])
+    prefetch = [models.Prefetch(query=[1.0, 0.0], using='dense', limit=len(angles)),
+                models.Prefetch(query=models.SparseVector(indices=[0], values=[1.0]), using='sparse', limit=len(angles))]
+    points = client.query_points('articles', prefetch=prefetch, query=models.FusionQuery(fusion=fusion),
+                                 limit=len(angles)).points
+    return [point.score for point in points]
+
+
+# three passages close to the query in both vectors, and twelve far away.
+GAP = ([0.0, 0.05, 0.1] + [1.2 + 0.02 * i for i in range(12)], [1.0, 0.95, 0.9] + [0.3 - 0.01 * i for i in range(12)])
+# fifteen passages drifting away from the query evenly.
+FLAT = ([0.08 * i for i in range(15)], [1.0 - 0.05 * i for i in range(15)])
+
+
+def test_depth_of_dbsf_fused_candidates():
+    assert candidate_depth(fused_scores(*GAP, models.Fusion.DBSF), min_depth=2, max_depth=15, gap_ratio=3.0) == 3
+    assert candidate_depth(fused_scores(*FLAT, models.Fusion.DBSF), min_depth=2, max_depth=15, gap_ratio=3.0) == 15
+
+
+def test_rrf_scores_dont_depend_on_the_query():
+    # the reason the candidates to rerank are fused with DBSF.
+    assert fused_scores(*GAP, models.Fusion.RRF) == fused_scores(*FLAT, models.Fusion.RRF)
+
+
+def test_rerank_text_keeps_the_first_words():
+    assert rerank_text("one two three four", 2) == "one two"
+    assert rerank_text("one two", 5) == "one two"
@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.utils.metrics import metrics
+from src.utils.single_flight import SingleFlight
+
+
+def counters():
+    return metrics.snapshot()['counters']
+
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    single_flight = SingleFlight('test_same_key')
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(timeout=5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(single_flight.do, 'key', slow, 21)
+        while single_flight.in_flight() == 0:
+            pass
+        followers = [executor.submit(single_flight.do, 'key', slow, 21) for _ in range(3)]
+        while counters().get('test_same_key.deduplicated', 0) < 3:
+            pass
+        release.set()
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert results == [42] * 4
+    assert calls == [21]
+    assert counters()['test_same_key.executions'] == 1
+    assert single_flight.in_flight() == 0
+
+
+def test_followers_get_the_leaders_exception():
+    single_flight = SingleFlight('test_error')
+    release = threading.Event()
+
+    def failing():
+        release.wait(timeout=5)
+        raise RuntimeError("down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, 'key', failing)
+        while single_flight.in_flight() == 0:
+            pass
+        follower = executor.submit(single_flight.do, 'key', failing)
+        while counters().get('test_error.deduplicated', 0) < 1:
+            pass
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+
+def test_finished_calls_are_not_cached():
+    single_flight = SingleFlight('test_sequential')
+    calls = []
+    for _ in range(2):
+        single_flight.do('key', calls.append, 1)
+    assert calls == [1, 1]
+
+
+def test_different_keys_run_separately():
+    single_flight = SingleFlight('test_keys')
+    assert [single_flight.do(key, str.upper, key) for key in ('a', 'b')] == ['A', 'B']
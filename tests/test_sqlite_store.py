@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from src.utils.sqlite_store import SqliteStore, parameter_chunks
+
+
+class NumbersStore(SqliteStore):
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self._connection().execute("CREATE TABLE IF NOT EXISTS numbers (value INTEGER PRIMARY KEY)")
+
+    def values(self):
+        return [row[0] for row in self._connection().execute("SELECT value FROM numbers ORDER BY value")]
+
+
+def test_write_commits_or_rolls_back(tmp_path):
+    store = NumbersStore(tmp_path / "nested" / "numbers.db")
+    with store._write() as conn:
+        conn.execute("INSERT INTO numbers VALUES (1)")
+    with pytest.raises(RuntimeError):
+        with store._write() as conn:
+            conn.execute("INSERT INTO numbers VALUES (2)")
+            raise RuntimeError("failed")
+    assert store.values() == [1]
+    assert NumbersStore(tmp_path / "nested" / "numbers.db").values() == [1]
+
+
+def test_every_thread_gets_its_own_connection(tmp_path):
+    store = NumbersStore(tmp_path / "numbers.db")
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(store._connection()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not store._connection()
+    assert store._connection() is store._connection()
+
+
+def test_parameter_chunks():
+    assert [list(chunk) for chunk in parameter_chunks(list(range(5)), 2)] == [[0, 1], [2, 3], [4]]
+    assert list(parameter_chunks([])) == []